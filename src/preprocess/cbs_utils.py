@@ -0,0 +1,915 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pyarrow as pa
+import requests
+from requests.adapters import HTTPAdapter
+import cbsodata
+
+from src.utilities.utilities import atomic_filepath
+
+CACHE_POLICIES = ['refresh', 'check', 'cache', 'offline']
+DICT_REGION_PREFIX = {'gemeente': 'GM', 'wijk': 'WK', 'buurt': 'BU'}
+DICT_PERIOD_CODE = {'jaar': 'JJ', 'halfjaar': 'HJ', 'maand': 'MM'}
+LIST_DIMENSION_TYPES = ['Dimension', 'GeoDimension', 'TimeDimension']
+LIST_RETRY_STATUS = [429, 500, 502, 503, 504]
+CBS_CLIENT = {'session': None, 'retries': 3, 'backoff': 1.0, 'timeout': 60, 'pool_size': 16, 'max_requests': 8,
+              'semaphore': threading.BoundedSemaphore(8)}
+CBS_CLIENT_LOCK = threading.Lock()
+FETCH_STATS = threading.local()
+CBS_METADATA = {'metadata': {}, 'locks': {}, 'lock': threading.Lock()}
+DICT_ARROW_TYPES = {'Long': pa.int64(), 'Integer': pa.int64(), 'Short': pa.int64(), 'Byte': pa.int64(),
+                    'Double': pa.float64(), 'Float': pa.float64(), 'Decimal': pa.float64()}
+
+
+def strip_cbs_colname(colname):
+    """
+    Method to strip a CBS columnname of its numeric suffix, underscores and capitals, i.e. 'Codering_3' -> 'codering'.
+
+    Parameters
+    ----------
+    colname : str
+        Original columnname in the CBS database
+
+    Returns
+    -------
+    str with the stripped columnname
+    """
+
+    return colname.rstrip('0123456789').replace("_", "").lower()
+
+
+class CBSFetchError(Exception):
+    """
+    Exception for CBS tables that could not be collected, with the fetch report of all tables (see get_cbs_table) in
+    the attribute df_report.
+    """
+
+    def __init__(self, message, df_report=None):
+        super().__init__(message)
+        self.df_report = df_report
+
+
+def configure_cbs_client(retries=3, backoff=1.0, timeout=60, pool_size=16, max_requests=8):
+    """
+    Method to configure the HTTP client that is shared by all downloads of the CBS database. The pooled connections
+    are reused across all tables of a run, only a different configuration starts a new pool. The number of requests
+    at the same time is bounded for the whole process, however many tables and steps are downloaded concurrently.
+
+    Parameters
+    ----------
+    retries : int
+        Number of retries of a request after a connection error, timeout or status 429/5xx. Default 3.
+    backoff : float
+        Number of seconds before the first retry, doubled for every next retry (with a random jitter of +/- 50%).
+        Default 1.0.
+    timeout : float
+        Number of seconds to wait for a response of the CBS database. Default 60.
+    pool_size : int
+        Maximum number of connections that are kept alive, should at least be the number of concurrent downloads.
+        Default 16.
+    max_requests : int
+        Maximum number of requests to the CBS database at the same time in the whole process, at most pool_size.
+        Default 8.
+
+    Returns
+    -------
+    None
+    """
+
+    dict_config = {'retries': retries, 'backoff': backoff, 'timeout': timeout, 'pool_size': pool_size,
+                   'max_requests': max(1, min(max_requests, pool_size))}
+    with CBS_CLIENT_LOCK:
+        if all(CBS_CLIENT[key] == value for key, value in dict_config.items()):
+            # Same configuration, keep the pool (i.e. of a concurrent run)
+            return
+        if CBS_CLIENT['session'] is not None:
+            CBS_CLIENT['session'].close()
+        if CBS_CLIENT['max_requests'] != dict_config['max_requests']:
+            # Requests in progress release the semaphore they acquired
+            CBS_CLIENT['semaphore'] = threading.BoundedSemaphore(dict_config['max_requests'])
+        CBS_CLIENT.update(dict_config, session=None)
+
+
+def get_cbs_session():
+    """
+    Method to get the shared requests.Session with a pool of keep-alive connections, see configure_cbs_client.
+
+    Returns
+    -------
+    requests.Session
+    """
+
+    with CBS_CLIENT_LOCK:
+        if CBS_CLIENT['session'] is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=CBS_CLIENT['pool_size'], pool_maxsize=CBS_CLIENT['pool_size'])
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            CBS_CLIENT['session'] = session
+        return CBS_CLIENT['session']
+
+
+def reset_fetch_stats():
+    """
+    Method to reset the number of requests and bytes of the downloads in the current thread, see request_cbs_json.
+
+    Returns
+    -------
+    None
+    """
+
+    FETCH_STATS.requests = 0
+    FETCH_STATS.bytes = 0
+    FETCH_STATS.retries = 0
+
+
+def request_cbs_json(url, params=None):
+    """
+    Method to get a JSON response of the CBS database with the shared session. Connection errors, timeouts and the
+    status codes 429 and 5xx are retried with a jittered exponential backoff, see configure_cbs_client. The request
+    waits while the maximum number of requests of the process is in progress, the backoff itself does not count.
+
+    Parameters
+    ----------
+    url : str
+        Full URL of the request
+    params : dict(str: str)
+        Query parameters of the request, i.e. {'$format': 'json'}
+
+    Returns
+    -------
+    dict with the JSON response
+    """
+
+    session = get_cbs_session()
+    for attempt in range(CBS_CLIENT['retries'] + 1):
+        try:
+            with CBS_CLIENT['semaphore']:
+                response = session.get(url, params=params, timeout=CBS_CLIENT['timeout'], **cbsodata.options.requests)
+            FETCH_STATS.requests = getattr(FETCH_STATS, 'requests', 0) + 1
+            FETCH_STATS.bytes = getattr(FETCH_STATS, 'bytes', 0) + len(response.content)
+            response.raise_for_status()
+            response.encoding = 'utf-8'
+            return response.json()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            status = e.response.status_code if isinstance(e, requests.HTTPError) else None
+            if attempt == CBS_CLIENT['retries'] or (status is not None and status not in LIST_RETRY_STATUS):
+                raise
+            FETCH_STATS.retries = getattr(FETCH_STATS, 'retries', 0) + 1
+            time.sleep(CBS_CLIENT['backoff'] * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def iter_cbs_odata_pages(table, name, url='opendata.cbs.nl', select=None, filters=None):
+    """
+    Method to download (meta)data of a CBS table page by page, following the 'odata.nextLink' of each page.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    name : str
+        Name of the (meta)data, i.e. 'TypedDataSet', 'DataProperties', 'TableInfos' or the key of a dimension
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    select : list(str)
+        List with the original columnnames to download. Default None (all columns).
+    filters : str
+        OData filter of the rows to download, see build_cbs_filters. Default None (all rows).
+
+    Returns
+    -------
+    generator of list(dict) with the rows of each page
+    """
+
+    page_url = f"{'https' if cbsodata.options.use_https else 'http'}://{url}/ODataFeed/odata/{table}/{name}"
+    params = {'$format': 'json'}
+    if select:
+        params['$select'] = ','.join(select)
+    if filters:
+        params['$filter'] = filters
+    while page_url is not None:
+        dict_page = request_cbs_json(page_url, params=params)
+        page_url = dict_page.get('odata.nextLink')
+        params = None
+        yield dict_page['value']
+
+
+def get_cbs_odata(table, name, url='opendata.cbs.nl', select=None, filters=None):
+    """
+    Method to download all (meta)data of a CBS table, see iter_cbs_odata_pages.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    name : str
+        Name of the (meta)data, i.e. 'TypedDataSet', 'DataProperties', 'TableInfos' or the key of a dimension
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    select : list(str)
+        List with the original columnnames to download. Default None (all columns).
+    filters : str
+        OData filter of the rows to download. Default None (all rows).
+
+    Returns
+    -------
+    list(dict) with all rows
+    """
+
+    list_rows = []
+    for list_page in iter_cbs_odata_pages(table, name, url=url, select=select, filters=filters):
+        list_rows.extend(list_page)
+    return list_rows
+
+
+def get_cache_filepaths(table, url, cache_path, select=None, filters=None):
+    """
+    Method to get the filepaths of the cached data and metadata of a CBS table.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    cache_path : str
+        Path of the folder with the cached CBS tables
+    select : list(str)
+        List with the original columnnames that are downloaded. Default None (all columns).
+    filters : str
+        OData filter of the rows that are downloaded. Default None (all rows).
+
+    Returns
+    -------
+    Tuple with the filepath of the data (feather) and the filepath of the metadata (json)
+    """
+
+    cache_key = f"{url}/{table}"
+    if select is not None:
+        cache_key += '/' + ','.join(sorted(select))
+    if filters is not None:
+        cache_key += '?' + filters
+    cache_key = hashlib.sha1(cache_key.encode('utf-8')).hexdigest()[:12]
+    filename = f"{table}_{cache_key}"
+    return os.path.join(cache_path, filename + '.feather'), os.path.join(cache_path, filename + '.json')
+
+
+def get_cbs_table_modified(table, url='opendata.cbs.nl'):
+    """
+    Method to get the timestamp of the last modification of a CBS table.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+
+    Returns
+    -------
+    str with the timestamp of the last modification (None if unknown)
+    """
+
+    list_table_infos = get_cbs_odata(table, 'TableInfos', url=url)
+    if len(list_table_infos) == 0:
+        return None
+    return list_table_infos[0].get('Modified')
+
+
+def get_cbs_tables_modified(list_tables, url='opendata.cbs.nl', max_workers=8):
+    """
+    Method to get the timestamps of the last modification of multiple CBS tables at once, i.e. to check if the output
+    of a step that uses these tables is still up to date.
+
+    Parameters
+    ----------
+    list_tables : list(str)
+        List with table names in the CBS database, i.e. ['84583NED', '84286NED']
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    max_workers : int
+        Maximum number of tables that are checked at the same time. Default 8.
+
+    Returns
+    -------
+    dict(str: str) with per table the timestamp of the last modification (None if unknown)
+    """
+
+    list_tables = sorted(set(list_tables))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(list_tables)))) as executor:
+        list_modified = list(executor.map(lambda table: get_cbs_table_modified(table, url), list_tables))
+    return dict(zip(list_tables, list_modified))
+
+
+def read_cached_cbs_table(table, url, cache_path, select=None, filters=None):
+    """
+    Method to read a CBS table and its metadata from the cache. If only a subset of the columns is asked for and that
+    subset is not cached, the subset is read from the cached table with all columns (if available).
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    cache_path : str
+        Path of the folder with the cached CBS tables
+    select : list(str)
+        List with the original columnnames to read. Default None (all columns).
+    filters : str
+        OData filter of the rows. Default None (all rows).
+
+    Returns
+    -------
+    Tuple with pd.DataFrame with the raw cbs data and a dictionary with the metadata. Both are None if the table is not
+    in the cache.
+    """
+
+    list_select_options = [select, None] if select is not None else [None]
+    for select_option in list_select_options:
+        filepath_data, filepath_meta = get_cache_filepaths(table, url, cache_path, select=select_option,
+                                                           filters=filters)
+        if not (os.path.isfile(filepath_data) and os.path.isfile(filepath_meta)):
+            continue
+        with open(filepath_meta, 'r') as file_meta:
+            dict_meta = json.load(file_meta)
+        if select_option is None and select is not None:
+            if not set(select).issubset(dict_meta.get('columns', [])):
+                continue
+            return pd.read_feather(filepath_data, columns=select), dict_meta
+        return pd.read_feather(filepath_data), dict_meta
+    return None, None
+
+
+def write_cached_cbs_table(df, table, url, cache_path, select=None, filters=None, modified=None):
+    """
+    Method to write a CBS table and its metadata to the cache.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame with the raw cbs data
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    cache_path : str
+        Path of the folder with the cached CBS tables
+    select : list(str)
+        List with the original columnnames that are downloaded. Default None (all columns).
+    filters : str
+        OData filter of the rows that are downloaded. Default None (all rows).
+    modified : str
+        Timestamp of the last modification of the table in the CBS database
+
+    Returns
+    -------
+    None
+    """
+
+    os.makedirs(cache_path, exist_ok=True)
+    filepath_data, filepath_meta = get_cache_filepaths(table, url, cache_path, select=select, filters=filters)
+    # The metadata is written last, a table is only used from the cache with its metadata (see get_cbs_table_raw)
+    with atomic_filepath(filepath_data) as filepath_data_tmp:
+        df.reset_index(drop=True).to_feather(filepath_data_tmp)
+    write_cached_cbs_meta(filepath_meta, table, url, list(df.columns), list(df.shape), select=select,
+                          filters=filters, modified=modified)
+
+
+def write_cached_cbs_meta(filepath_meta, table, url, list_cols, shape, select=None, filters=None, modified=None):
+    """
+    Method to write the metadata of a cached CBS table (atomically, see src.utilities.utilities.atomic_filepath).
+
+    Parameters
+    ----------
+    filepath_meta : str
+        Filepath of the metadata of the cached table, see get_cache_filepaths
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    list_cols : list(str)
+        List with the columnnames of the cached table
+    shape : list(int)
+        Number of rows and columns of the cached table
+    select : list(str)
+        List with the original columnnames that are downloaded. Default None (all columns).
+    filters : str
+        OData filter of the rows that are downloaded. Default None (all rows).
+    modified : str
+        Timestamp of the last modification of the table in the CBS database
+
+    Returns
+    -------
+    None
+    """
+
+    with atomic_filepath(filepath_meta) as filepath_meta_tmp, open(filepath_meta_tmp, 'w') as file_meta:
+        json.dump({'table': table,
+                   'url': url,
+                   'modified': modified,
+                   'timestamp_download': datetime.now().isoformat(),
+                   'select': select,
+                   'filters': filters,
+                   'columns': list_cols,
+                   'shape': shape}, file_meta)
+
+
+def reset_cbs_metadata():
+    """
+    Method to forget the metadata of the CBS tables that is collected in this run, see get_cbs_metadata.
+
+    Returns
+    -------
+    None
+    """
+
+    with CBS_METADATA['lock']:
+        CBS_METADATA['metadata'] = {}
+
+
+def get_cbs_metadata(table, metadata_name='DataProperties', url='opendata.cbs.nl', cache_path=None,
+                     cache_policy='check'):
+    """
+    Method to get metadata of a CBS table, i.e. the DataProperties (description of all columns) or the keys and titles
+    of a dimension, using the local cache. The metadata is collected once per run (see reset_cbs_metadata), concurrent
+    downloads of the same table wait for the first one instead of downloading the metadata again.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    metadata_name : str
+        Name of the metadata, i.e. 'DataProperties' or the key of a dimension like 'TypeMaatwerkarrangement'.
+        Default 'DataProperties'.
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    cache_path : str
+        Path of the folder with the cached CBS tables. Default None (no cache is used).
+    cache_policy : str
+        Policy of the cache ('refresh', 'check', 'cache', 'offline'). The metadata is small, therefore it is only read
+        from the cache with the policies 'cache' and 'offline'.
+
+    Returns
+    -------
+    list(dict) with the metadata of the table
+    """
+
+    if cache_policy not in CACHE_POLICIES:
+        raise ValueError(f"Unknown cache policy '{cache_policy}', choose one of: {CACHE_POLICIES}")
+    key = (url, table, metadata_name)
+    with CBS_METADATA['lock']:
+        lock_metadata = CBS_METADATA['locks'].setdefault(key, threading.Lock())
+    with lock_metadata:
+        if key not in CBS_METADATA['metadata']:
+            CBS_METADATA['metadata'][key] = read_or_download_cbs_metadata(table, metadata_name, url=url,
+                                                                          cache_path=cache_path,
+                                                                          cache_policy=cache_policy)
+        return CBS_METADATA['metadata'][key]
+
+
+def read_or_download_cbs_metadata(table, metadata_name='DataProperties', url='opendata.cbs.nl', cache_path=None,
+                                  cache_policy='check'):
+    """
+    Method to read metadata of a CBS table from the local cache or download it, see get_cbs_metadata.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    metadata_name : str
+        Name of the metadata, i.e. 'DataProperties' or the key of a dimension. Default 'DataProperties'.
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    cache_path : str
+        Path of the folder with the cached CBS tables. Default None (no cache is used).
+    cache_policy : str
+        Policy of the cache, see get_cbs_metadata.
+
+    Returns
+    -------
+    list(dict) with the metadata of the table
+    """
+
+    if cache_path is None:
+        return get_cbs_odata(table, metadata_name, url=url)
+
+    filepath_data, _ = get_cache_filepaths(table, url, cache_path)
+    filepath_metadata = filepath_data.replace('.feather', f'_{metadata_name}.json')
+    if cache_policy in ['cache', 'offline'] and os.path.isfile(filepath_metadata):
+        with open(filepath_metadata, 'r') as file_metadata:
+            return json.load(file_metadata)
+    if cache_policy == 'offline':
+        raise FileNotFoundError(f"{metadata_name} of table {table} of {url} is not available in the cache "
+                                f"'{cache_path}' (cache policy is 'offline')")
+
+    list_metadata = get_cbs_odata(table, metadata_name, url=url)
+    os.makedirs(cache_path, exist_ok=True)
+    with atomic_filepath(filepath_metadata) as filepath_metadata_tmp, open(filepath_metadata_tmp, 'w') as file_metadata:
+        json.dump(list_metadata, file_metadata)
+    return list_metadata
+
+
+def determine_cbs_select_cols(list_data_properties, list_cols_required, double_trouble_colnames=None,
+                              dict_rename=None):
+    """
+    Method to determine which original columns of a CBS table are needed, given the (stripped and renamed)
+    columnnames that are used further on.
+
+    Parameters
+    ----------
+    list_data_properties : list(dict)
+        DataProperties of the table, see get_cbs_metadata
+    list_cols_required : list(str)
+        List with columnnames that are used further on, i.e. 'codering_regio' or 'aantalinwoners'
+    double_trouble_colnames : dict(str: str)
+        Dictionary with columnnames that will cause trouble if the suffix is deleted (same as get_cbs_table)
+    dict_rename : dict(str: str)
+        Dictionary with the renaming of the stripped columnnames, i.e. {'codering': 'codering_regio'}
+
+    Returns
+    -------
+    list(str) with the original columnnames to download
+    """
+
+    double_trouble_colnames = double_trouble_colnames or {}
+    dict_rename = dict_rename or {}
+    set_cols_required = set(list_cols_required)
+
+    list_select = []
+    for data_property in list_data_properties:
+        key = data_property.get('Key')
+        # TopicGroups only group other columns and are not a column themselves
+        if not key or data_property.get('Type') == 'TopicGroup':
+            continue
+        colname_stripped = strip_cbs_colname(double_trouble_colnames.get(key, key))
+        colname_renamed = dict_rename.get(colname_stripped, colname_stripped)
+        if colname_stripped in set_cols_required or colname_renamed in set_cols_required:
+            list_select.append(key)
+    return list_select
+
+
+def build_cbs_filters(list_data_properties, region=None, period=None, col=None, spec_value=None,
+                      list_spec_value_keys=None):
+    """
+    Method to build an OData filter for a CBS table, so only the rows of a certain region level, period and specific
+    value of a dimension are downloaded. This is the equivalent of get_region_period_spec_val_subtable in
+    preprocess_utils, only filters for dimensions that are available in the table are added.
+
+    Parameters
+    ----------
+    list_data_properties : list(dict)
+        DataProperties of the table, see get_cbs_metadata
+    region : str
+        String to choose region. Possible strings are: "gemeente", "wijk", "buurt"
+    period : str
+        String to choose period. Possible strings are: "jaar", "halfjaar", "maand"
+    col : str
+        (Stripped) columnname of the dimension to subset on, i.e. 'typemaatwerkarrangement'
+    spec_value : str
+        Title of the specific value of the dimension, i.e. 'Hulp bij het huishouden'
+    list_spec_value_keys : list(dict)
+        Metadata of the dimension col (with 'Key' and 'Title'), see get_cbs_metadata
+
+    Returns
+    -------
+    str with the OData filter (None if no filter applies)
+    """
+
+    list_filters = []
+    for data_property in list_data_properties:
+        key = data_property.get('Key')
+        data_property_type = data_property.get('Type')
+        if data_property_type == 'GeoDimension' and region in DICT_REGION_PREFIX:
+            list_filters.append(f"startswith({key},'{DICT_REGION_PREFIX[region]}')")
+        if data_property_type == 'TimeDimension' and period in DICT_PERIOD_CODE:
+            list_filters.append(f"substringof('{DICT_PERIOD_CODE[period]}',{key})")
+        if data_property_type == 'Dimension' and spec_value is not None and col is not None \
+                and strip_cbs_colname(key) == col:
+            list_keys = [dimension_value['Key'] for dimension_value in (list_spec_value_keys or [])
+                         if dimension_value.get('Title', '').strip() == spec_value]
+            if list_keys:
+                list_filters.append('(' + ' or '.join([f"{key} eq '{value_key}'" for value_key in list_keys]) + ')')
+
+    if not list_filters:
+        return None
+    return ' and '.join(list_filters)
+
+
+def get_cbs_dimension_key(list_data_properties, col):
+    """
+    Method to get the original key of a dimension in a CBS table by its stripped columnname.
+
+    Parameters
+    ----------
+    list_data_properties : list(dict)
+        DataProperties of the table, see get_cbs_metadata
+    col : str
+        (Stripped) columnname of the dimension, i.e. 'typemaatwerkarrangement'
+
+    Returns
+    -------
+    str with the key of the dimension, i.e. 'TypeMaatwerkarrangement' (None if the table has no such dimension)
+    """
+
+    for data_property in list_data_properties:
+        if data_property.get('Type') == 'Dimension' and strip_cbs_colname(data_property.get('Key', '')) == col:
+            return data_property['Key']
+    return None
+
+
+def get_cbs_arrow_schema(list_data_properties, select=None):
+    """
+    Method to get the Arrow schema of the data of a CBS table, based on the datatypes in the DataProperties. Dimensions
+    and text topics are strings, numeric topics are int64 or float64.
+
+    Parameters
+    ----------
+    list_data_properties : list(dict)
+        DataProperties of the table, see get_cbs_metadata
+    select : list(str)
+        List with the original columnnames to download. Default None (all columns).
+
+    Returns
+    -------
+    pa.Schema with a field per column, in the order of select (or of the DataProperties)
+    """
+
+    dict_types = {'ID': pa.int64()}
+    for data_property in list_data_properties:
+        if data_property.get('Type') in LIST_DIMENSION_TYPES:
+            dict_types[data_property['Key']] = pa.string()
+        elif data_property.get('Type') == 'Topic':
+            dict_types[data_property['Key']] = DICT_ARROW_TYPES.get(data_property.get('Datatype'), pa.string())
+    list_cols = list(dict_types.keys()) if select is None else select
+    return pa.schema([(col, dict_types.get(col, pa.string())) for col in list_cols])
+
+
+def get_cbs_dimension_titles(table, list_data_properties, list_cols, url='opendata.cbs.nl', cache_path=None,
+                             cache_policy='check'):
+    """
+    Method to get the titles of the keys of the dimensions of a CBS table, i.e. {'Perioden': {'2019JJ00': '2019'}}.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    list_data_properties : list(dict)
+        DataProperties of the table, see get_cbs_metadata
+    list_cols : list(str)
+        List with the original columnnames that are downloaded, only the titles of these dimensions are collected
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    cache_path : str
+        Path of the folder with the cached metadata. Default None (no cache is used).
+    cache_policy : str
+        Policy of the cache of the metadata, see get_cbs_metadata.
+
+    Returns
+    -------
+    dict(str: dict(str: str)) with per dimension the title of each key
+    """
+
+    dict_titles = {}
+    for data_property in list_data_properties:
+        if data_property.get('Type') in LIST_DIMENSION_TYPES and data_property['Key'] in list_cols:
+            list_dimension = get_cbs_metadata(table, data_property['Key'], url=url, cache_path=cache_path,
+                                              cache_policy=cache_policy)
+            dict_titles[data_property['Key']] = {value['Key']: value['Title'] for value in list_dimension}
+    return dict_titles
+
+
+def iter_cbs_record_batches(table, url='opendata.cbs.nl', select=None, filters=None, cache_path=None,
+                            cache_policy='check'):
+    """
+    Method to download the data of a CBS table page by page, each page is directly converted to an Arrow RecordBatch.
+    Like cbsodata.get_data, the keys of the dimensions are replaced by their titles.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    select : list(str)
+        List with the original columnnames to download. Default None (all columns).
+    filters : str
+        OData filter of the rows to download, see build_cbs_filters. Default None (all rows).
+    cache_path : str
+        Path of the folder with the cached metadata. Default None (no cache is used).
+    cache_policy : str
+        Policy of the cache of the metadata, see get_cbs_metadata.
+
+    Returns
+    -------
+    generator of pa.RecordBatch, all with the schema of get_cbs_arrow_schema
+    """
+
+    list_data_properties = get_cbs_metadata(table, 'DataProperties', url=url, cache_path=cache_path,
+                                            cache_policy=cache_policy)
+    schema = get_cbs_arrow_schema(list_data_properties, select=select)
+    dict_titles = get_cbs_dimension_titles(table, list_data_properties, schema.names, url=url, cache_path=cache_path,
+                                           cache_policy=cache_policy)
+    for list_rows in iter_cbs_odata_pages(table, 'TypedDataSet', url=url, select=select, filters=filters):
+        list_arrays = []
+        for field in schema:
+            list_values = [row.get(field.name) for row in list_rows]
+            if field.name in dict_titles:
+                list_values = [dict_titles[field.name].get(value, value) for value in list_values]
+            elif pa.types.is_string(field.type):
+                list_values = [None if value is None else str(value) for value in list_values]
+            list_arrays.append(pa.array(list_values, type=field.type))
+        # Only the current page is kept in memory as Python objects
+        del list_rows
+        yield pa.RecordBatch.from_arrays(list_arrays, schema=schema)
+
+
+def download_cbs_table(table, url='opendata.cbs.nl', select=None, filters=None, streaming=False, cache_path=None,
+                       cache_policy='check'):
+    """
+    Method to download the data of a CBS table with the original columnnames.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    select : list(str)
+        List with the original columnnames to download. Default None (all columns).
+    filters : str
+        OData filter of the rows to download, see build_cbs_filters. Default None (all rows).
+    streaming : bool
+        Boolean value to convert the data page by page to Arrow (see iter_cbs_record_batches) instead of collecting
+        all rows as Python dictionaries first. Default False.
+    cache_path : str
+        Path of the folder with the cached metadata. Default None (no cache is used).
+    cache_policy : str
+        Policy of the cache of the metadata, see get_cbs_metadata.
+
+    Returns
+    -------
+    pd.DataFrame with raw cbs data
+    """
+
+    if not streaming:
+        list_rows = get_cbs_odata(table, 'TypedDataSet', url=url, select=select, filters=filters)
+        list_data_properties = get_cbs_metadata(table, 'DataProperties', url=url, cache_path=cache_path,
+                                                cache_policy=cache_policy)
+        list_cols = select if select is not None else list(list_rows[0].keys()) if list_rows else []
+        dict_titles = get_cbs_dimension_titles(table, list_data_properties, list_cols, url=url,
+                                               cache_path=cache_path, cache_policy=cache_policy)
+        for row in list_rows:
+            for col, dict_col_titles in dict_titles.items():
+                row[col] = dict_col_titles.get(row.get(col), row.get(col))
+        return pd.DataFrame(list_rows, columns=select)
+    list_batches = list(iter_cbs_record_batches(table, url=url, select=select, filters=filters, cache_path=cache_path,
+                                                cache_policy=cache_policy))
+    schema = list_batches[0].schema if list_batches else get_cbs_arrow_schema(
+        get_cbs_metadata(table, 'DataProperties', url=url, cache_path=cache_path, cache_policy=cache_policy), select)
+    return pa.Table.from_batches(list_batches, schema=schema).to_pandas()
+
+
+def iter_cbs_table_batches(table, url='opendata.cbs.nl', select=None, filters=None, cache_path=None,
+                           cache_policy='check'):
+    """
+    Method to get a CBS table with the original columnnames in Arrow RecordBatches, without holding the whole table in
+    memory. A cached table is read batch by batch from the memory mapped feather file, a downloaded table is written to
+    the cache batch by batch.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    select : list(str)
+        List with the original columnnames to download. Default None (all columns).
+    filters : str
+        OData filter of the rows to download, see build_cbs_filters. Default None (all rows).
+    cache_path : str
+        Path of the folder with the cached CBS tables. Default None (no cache is used).
+    cache_policy : str
+        Policy of the cache ('refresh', 'check', 'cache', 'offline'), see get_cbs_table_raw.
+
+    Returns
+    -------
+    generator of pa.RecordBatch
+    """
+
+    if cache_path is None:
+        yield from iter_cbs_record_batches(table, url=url, select=select, filters=filters)
+        return
+    if cache_policy not in CACHE_POLICIES:
+        raise ValueError(f"Unknown cache policy '{cache_policy}', choose one of: {CACHE_POLICIES}")
+
+    filepath_data, filepath_meta = get_cache_filepaths(table, url, cache_path, select=select, filters=filters)
+    modified = None
+    if cache_policy != 'refresh':
+        is_cached = os.path.isfile(filepath_data) and os.path.isfile(filepath_meta)
+        if cache_policy == 'offline' and not is_cached:
+            raise FileNotFoundError(f"Table {table} of {url} is not available in the cache '{cache_path}' "
+                                    f"(cache policy is 'offline')")
+        use_cache = is_cached and cache_policy in ['offline', 'cache']
+        if is_cached and cache_policy == 'check':
+            with open(filepath_meta, 'r') as file_meta:
+                dict_meta = json.load(file_meta)
+            modified = get_cbs_table_modified(table, url)
+            use_cache = modified is not None and modified == dict_meta.get('modified')
+        if use_cache:
+            with pa.memory_map(filepath_data, 'r') as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i)
+            return
+
+    if modified is None:
+        modified = get_cbs_table_modified(table, url)
+    os.makedirs(cache_path, exist_ok=True)
+    n_rows = 0
+    schema = None
+    writer = None
+    # A download that is not completed (i.e. the generator is closed early) is not cached
+    with atomic_filepath(filepath_data) as filepath_data_tmp:
+        try:
+            for batch in iter_cbs_record_batches(table, url=url, select=select, filters=filters, cache_path=cache_path,
+                                                 cache_policy=cache_policy):
+                if writer is None:
+                    schema = batch.schema
+                    writer = pa.ipc.new_file(filepath_data_tmp, schema)
+                writer.write_batch(batch)
+                n_rows += batch.num_rows
+                yield batch
+        finally:
+            if writer is not None:
+                writer.close()
+    if writer is not None:
+        write_cached_cbs_meta(filepath_meta, table, url, schema.names, [n_rows, len(schema.names)], select=select,
+                              filters=filters, modified=modified)
+
+
+def get_cbs_table_raw(table, url='opendata.cbs.nl', select=None, filters=None, cache_path=None,
+                      cache_policy='check', streaming=False):
+    """
+    Method to get a CBS table with the original columnnames, using a local cache of the raw tables.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    select : list(str)
+        List with the original columnnames to download. Default None (all columns).
+    filters : str
+        OData filter of the rows to download, see build_cbs_filters. Default None (all rows).
+    cache_path : str
+        Path of the folder with the cached CBS tables. Default None (no cache is used).
+    cache_policy : str
+        Policy of the cache, one of the following:
+        * 'refresh': always download the table and update the cache
+        * 'check': use the cached table if it is not modified in the CBS database, otherwise download it (default)
+        * 'cache': use the cached table without checking for modifications, download it if it is not cached
+        * 'offline': only use the cached table, never connect to the CBS database
+    streaming : bool
+        Boolean value to download the table page by page into Arrow, see download_cbs_table. Default False.
+
+    Returns
+    -------
+    pd.DataFrame with raw cbs data
+    """
+
+    if cache_path is None:
+        return download_cbs_table(table, url=url, select=select, filters=filters, streaming=streaming)
+    if cache_policy not in CACHE_POLICIES:
+        raise ValueError(f"Unknown cache policy '{cache_policy}', choose one of: {CACHE_POLICIES}")
+
+    modified = None
+    if cache_policy != 'refresh':
+        df, dict_meta = read_cached_cbs_table(table, url, cache_path, select=select, filters=filters)
+        if cache_policy == 'offline':
+            if df is None:
+                raise FileNotFoundError(f"Table {table} of {url} is not available in the cache '{cache_path}' "
+                                        f"(cache policy is 'offline')")
+            return df
+        if df is not None:
+            if cache_policy == 'cache':
+                return df
+            modified = get_cbs_table_modified(table, url)
+            if modified is not None and modified == dict_meta.get('modified'):
+                print(f"Table {table} is not modified since {modified}, use cached table")
+                return df
+
+    if modified is None:
+        modified = get_cbs_table_modified(table, url)
+    df = download_cbs_table(table, url=url, select=select, filters=filters, streaming=streaming, cache_path=cache_path,
+                            cache_policy=cache_policy)
+    write_cached_cbs_table(df, table, url, cache_path, select=select, filters=filters, modified=modified)
+    return df
@@ -1,7 +1,113 @@
+import os
+import time
+import numpy as np
 import pandas as pd
-import cbsodata
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
 
-def get_and_combine_cbs_tables(dict_tables, double_trouble_colnames=None, url='opendata.cbs.nl'):
+from src.utilities.utilities import get_dataset_files
+from src.preprocess.cbs_utils import get_cbs_table_raw, get_cbs_metadata, determine_cbs_select_cols, \
+    strip_cbs_colname, build_cbs_filters, get_cbs_dimension_key, reset_fetch_stats, FETCH_STATS, CBSFetchError, \
+    iter_cbs_table_batches
+
+
+def get_cbs_table(table, interval, double_trouble_colnames=None, url='opendata.cbs.nl', cache_path=None,
+                  cache_policy='check', list_cols_required=None, dict_rename=None, region=None, period=None,
+                  col=None, spec_value=None, streaming=False, list_fetch_report=None):
+    """
+    Method to get one table of the CBS database with stripped columnnames and the interval added.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    interval : str
+        Period of the table, will be added as the column 'interval'
+    double_trouble_colnames : dict(str: str)
+        double_trouble_colnames: Dictionary with columnnames that will cause trouble if the suffix is deleted
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    cache_path : str
+        Path of the folder with the cached CBS tables. Default None (no cache is used).
+    cache_policy : str
+        Policy of the cache ('refresh', 'check', 'cache', 'offline'), see cbs_utils.get_cbs_table_raw.
+    list_cols_required : list(str)
+        List with (stripped) columnnames that are used further on. Only these columns are downloaded from the CBS
+        database. Default None (all columns are downloaded).
+    dict_rename : dict(str: str)
+        Dictionary with the renaming of the stripped columnnames further on, used to match list_cols_required.
+    region : str
+        Only download rows of this region level ("gemeente", "wijk", "buurt"). Default None (all rows).
+    period : str
+        Only download rows of this period level ("jaar", "halfjaar"). Default None (all rows).
+    col : str
+        (Stripped) columnname of the dimension to subset on with spec_value, i.e. 'typemaatwerkarrangement'
+    spec_value : str
+        Only download rows with this value of the dimension col. Default None (all rows).
+    streaming : bool
+        Boolean value to download the table(s) page by page into Arrow, see cbs_utils.download_cbs_table.
+    list_fetch_report : list(dict)
+        List to which the fetch report of the table is appended: the table, interval, status ('ok' or 'failed'),
+        number of rows, seconds, requests, retries, bytes and error. Default None (no report).
+
+    Returns
+    -------
+    pd.DataFrame with cbs data (empty DataFrame if the table could not be collected, see list_fetch_report)
+    """
+
+    print(f"Pythonic iteration {interval} for table {table}")
+    reset_fetch_stats()
+    time_start = time.perf_counter()
+    error = None
+    try:
+        select = None
+        filters = None
+        if list_cols_required is not None or region is not None or period is not None or spec_value is not None:
+            list_data_properties = get_cbs_metadata(table, 'DataProperties', url=url, cache_path=cache_path,
+                                                    cache_policy=cache_policy)
+        if list_cols_required is not None:
+            select = determine_cbs_select_cols(list_data_properties, list_cols_required,
+                                               double_trouble_colnames=double_trouble_colnames,
+                                               dict_rename=dict_rename)
+        if region is not None or period is not None or spec_value is not None:
+            list_spec_value_keys = None
+            dimension_key = get_cbs_dimension_key(list_data_properties, col) if spec_value is not None else None
+            if dimension_key is not None:
+                list_spec_value_keys = get_cbs_metadata(table, dimension_key, url=url, cache_path=cache_path,
+                                                        cache_policy=cache_policy)
+            filters = build_cbs_filters(list_data_properties, region=region, period=period, col=col,
+                                        spec_value=spec_value, list_spec_value_keys=list_spec_value_keys)
+        df_sub = get_cbs_table_raw(table, url=url, select=select, filters=filters, cache_path=cache_path,
+                                   cache_policy=cache_policy, streaming=streaming)
+        if double_trouble_colnames:
+            df_sub = df_sub.rename(columns=double_trouble_colnames)
+        cols_wijk_stripped = [strip_cbs_colname(i) for i in list(df_sub.columns)]
+        dict_wijk_cols_renamed = {key: value for key, value in zip(iter(df_sub.columns), iter(cols_wijk_stripped))}
+        df_sub = df_sub.rename(columns=dict_wijk_cols_renamed)
+        df_sub['interval'] = interval
+    except Exception as e:
+        print(f"Table {table} for {interval} could not be collected: {e!r}")
+        error = e
+        df_sub = pd.DataFrame()
+
+    if list_fetch_report is not None:
+        list_fetch_report.append({'table': table,
+                                  'interval': interval,
+                                  'status': 'ok' if error is None else 'failed',
+                                  'rows': len(df_sub),
+                                  'seconds': round(time.perf_counter() - time_start, 3),
+                                  'requests': getattr(FETCH_STATS, 'requests', 0),
+                                  'retries': getattr(FETCH_STATS, 'retries', 0),
+                                  'bytes': getattr(FETCH_STATS, 'bytes', 0),
+                                  'error': None if error is None else repr(error)})
+    return df_sub
+
+
+def get_and_combine_cbs_tables(dict_tables, double_trouble_colnames=None, url='opendata.cbs.nl', max_workers=1,
+                               cache_path=None, cache_policy='check', list_cols_required=None, dict_rename=None,
+                               region=None, period=None, col=None, spec_value=None, streaming=False,
+                               list_fetch_report=None, allow_failed=False):
     """
     Method to get multiple similar tables in the CBS database.
 
@@ -13,6 +119,32 @@ def get_and_combine_cbs_tables(dict_tables, double_trouble_colnames=None, url='o
         double_trouble_colnames: Dictionary with columnnames that will cause trouble if the suffix is deleted
     url : str
         URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    max_workers : int
+        Maximum number of tables that are downloaded at the same time. Default 1 (one table after another).
+    cache_path : str
+        Path of the folder with the cached CBS tables. Default None (no cache is used).
+    cache_policy : str
+        Policy of the cache ('refresh', 'check', 'cache', 'offline'), see cbs_utils.get_cbs_table_raw.
+    list_cols_required : list(str)
+        List with (stripped) columnnames that are used further on. Only these columns are downloaded from the CBS
+        database. Default None (all columns are downloaded).
+    dict_rename : dict(str: str)
+        Dictionary with the renaming of the stripped columnnames further on, used to match list_cols_required.
+    region : str
+        Only download rows of this region level ("gemeente", "wijk", "buurt"). Default None (all rows).
+    period : str
+        Only download rows of this period level ("jaar", "halfjaar"). Default None (all rows).
+    col : str
+        (Stripped) columnname of the dimension to subset on with spec_value, i.e. 'typemaatwerkarrangement'
+    spec_value : str
+        Only download rows with this value of the dimension col. Default None (all rows).
+    streaming : bool
+        Boolean value to download the table(s) page by page into Arrow, see cbs_utils.download_cbs_table.
+    list_fetch_report : list(dict)
+        List to which the fetch reports of the tables are appended, see get_cbs_table. Default None (no report).
+    allow_failed : bool
+        Boolean value to continue with the tables that could be collected if some tables failed. Default False (a
+        CBSFetchError with the fetch report is raised).
 
     Returns
     -------
@@ -21,26 +153,310 @@ def get_and_combine_cbs_tables(dict_tables, double_trouble_colnames=None, url='o
 
     print(f"Number of tables to collect: {len(dict_tables)}")
 
-    df = pd.DataFrame()
+    list_report = []
+    if max_workers > 1 and len(dict_tables) > 1:
+        # Downloading is mostly waiting on the network, so threads are sufficient
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(dict_tables))) as executor:
+            futures = [executor.submit(get_cbs_table, table, interval, double_trouble_colnames, url, cache_path,
+                                       cache_policy, list_cols_required, dict_rename, region, period, col,
+                                       spec_value, streaming, list_report)
+                       for interval, table in dict_tables.items()]
+            list_df_sub = [future.result() for future in futures]
+    else:
+        list_df_sub = [get_cbs_table(table, interval, double_trouble_colnames, url, cache_path, cache_policy,
+                                     list_cols_required, dict_rename, region, period, col, spec_value, streaming,
+                                     list_report)
+                       for interval, table in dict_tables.items()]
+
+    list_report = sorted(list_report, key=lambda report: list(dict_tables.keys()).index(report['interval']))
+    if list_fetch_report is not None:
+        list_fetch_report.extend(list_report)
+    list_failed = [f"{report['table']} ({report['interval']})" for report in list_report
+                   if report['status'] == 'failed']
+    if list_failed and not allow_failed:
+        raise CBSFetchError(f"CBS tables could not be collected: {', '.join(list_failed)}",
+                            df_report=pd.DataFrame(list_report))
+
+    df = combine_cbs_tables(list_df_sub)
+    return df
+
+
+def aggregate_cbs_tables(dict_tables, func_aggregate, double_trouble_colnames=None, url='opendata.cbs.nl',
+                         cache_path=None, cache_policy='check', list_fetch_report=None, allow_failed=False,
+                         n_partials=32):
+    """
+    Method to aggregate multiple similar tables in the CBS database chunk by chunk, without holding a whole table in
+    memory. Each chunk gets stripped columnnames and the interval (like get_cbs_table) and is aggregated by
+    func_aggregate. The partial results are summed per index value.
+
+    Parameters
+    ----------
+    dict_tables : dict(str: str)
+        Dictionary with as key the period and as value the table name
+    func_aggregate : function
+        Function that aggregates a chunk (pd.DataFrame) to a pd.Series of which the values can be summed per index
+        value, i.e. the number of inhabitants per municipality
+    double_trouble_colnames : dict(str: str)
+        double_trouble_colnames: Dictionary with columnnames that will cause trouble if the suffix is deleted
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+    cache_path : str
+        Path of the folder with the cached CBS tables. Default None (no cache is used).
+    cache_policy : str
+        Policy of the cache ('refresh', 'check', 'cache', 'offline'), see cbs_utils.get_cbs_table_raw.
+    list_fetch_report : list(dict)
+        List to which the fetch reports of the tables are appended, see get_cbs_table. Default None (no report).
+    allow_failed : bool
+        Boolean value to continue with the tables that could be collected if some tables failed. Default False (a
+        CBSFetchError with the fetch report is raised).
+    n_partials : int
+        Number of partial results that are kept before they are summed. Default 32.
+
+    Returns
+    -------
+    pd.Series with the sum of the aggregated chunks of all tables
+    """
+
+    print(f"Number of tables to aggregate: {len(dict_tables)}")
+
+    list_report = []
+    list_partial = []
     for interval, table in dict_tables.items():
-        print(f"Pythonic iteration {interval} for table {table}")
+        print(f"Pythonic iteration {interval} for table {table} (aggregated in chunks)")
+        reset_fetch_stats()
+        time_start = time.perf_counter()
+        error = None
+        n_rows = 0
+        list_partial_table = []
         try:
-            df_sub = pd.DataFrame(cbsodata.get_data(table, catalog_url=url))
-            if double_trouble_colnames:
-                df_sub = df_sub.rename(columns=double_trouble_colnames)
-            cols_wijk_stripped = [i.rstrip('0123456789').replace("_", "").lower() for i in list(df_sub.columns)]
-            dict_wijk_cols_renamed = {key: value for key, value in zip(iter(df_sub.columns), iter(cols_wijk_stripped))}
-            df_sub = df_sub.rename(columns=dict_wijk_cols_renamed)
-            df_sub['interval'] = interval
-            # print(list(df_sub.columns))
-        except Exception:
-            df_sub = pd.DataFrame()
-            pass
-        df = pd.concat([df, df_sub], sort=True)
-        # print(list(df.columns))
+            for batch in iter_cbs_table_batches(table, url=url, cache_path=cache_path, cache_policy=cache_policy):
+                df_chunk = batch.to_pandas()
+                if double_trouble_colnames:
+                    df_chunk = df_chunk.rename(columns=double_trouble_colnames)
+                df_chunk.columns = [strip_cbs_colname(i) for i in list(df_chunk.columns)]
+                df_chunk['interval'] = interval
+                n_rows += len(df_chunk)
+                list_partial_table.append(func_aggregate(df_chunk))
+                if len(list_partial_table) >= n_partials:
+                    list_partial_table = [sum_partial_results(list_partial_table)]
+        except Exception as e:
+            print(f"Table {table} for {interval} could not be aggregated: {e!r}")
+            error = e
+        else:
+            list_partial.extend(list_partial_table)
+        list_report.append({'table': table,
+                            'interval': interval,
+                            'status': 'ok' if error is None else 'failed',
+                            'rows': n_rows,
+                            'seconds': round(time.perf_counter() - time_start, 3),
+                            'requests': getattr(FETCH_STATS, 'requests', 0),
+                            'retries': getattr(FETCH_STATS, 'retries', 0),
+                            'bytes': getattr(FETCH_STATS, 'bytes', 0),
+                            'error': None if error is None else repr(error)})
+
+    if list_fetch_report is not None:
+        list_fetch_report.extend(list_report)
+    list_failed = [f"{report['table']} ({report['interval']})" for report in list_report
+                   if report['status'] == 'failed']
+    if list_failed and not allow_failed:
+        raise CBSFetchError(f"CBS tables could not be aggregated: {', '.join(list_failed)}",
+                            df_report=pd.DataFrame(list_report))
+
+    return sum_partial_results(list_partial)
+
+
+def sum_partial_results(list_partial):
+    """
+    Method to sum partial results (pd.Series with the same index levels) per index value.
+
+    Parameters
+    ----------
+    list_partial : list(pd.Series)
+        List with the partial results
+
+    Returns
+    -------
+    pd.Series with the sum per index value (sorted by index)
+    """
+
+    if len(list_partial) == 0:
+        return pd.Series(dtype='float64')
+    sr = pd.concat(list_partial)
+    return sr.groupby(level=list(range(sr.index.nlevels))).sum()
+
+
+def combine_cbs_tables(list_df):
+    """
+    Method to combine similar CBS tables (i.e. of different years) into one DataFrame. The columns of the result are
+    the sorted union of the columns of all tables, the dtype of each column is determined once for all tables and
+    every column is filled in one allocation. Columns that are missing in a table are filled with NaN, in which case
+    integer columns become float.
+
+    Parameters
+    ----------
+    list_df : list(pd.DataFrame)
+        List with DataFrames to combine, empty DataFrames (i.e. tables that could not be collected) are skipped
+
+    Returns
+    -------
+    pd.DataFrame with the rows of all DataFrames, in the order of list_df
+    """
+
+    list_df = [df for df in list_df if len(df.columns) > 0]
+    if not list_df:
+        return pd.DataFrame()
+
+    list_cols = sorted(set().union(*[df.columns for df in list_df]))
+    index = list_df[0].index.append([df.index for df in list_df[1:]])
+    dict_cols = {}
+    for col in list_cols:
+        list_dtypes = [df[col].dtype for df in list_df if col in df.columns]
+        missing = len(list_dtypes) < len(list_df)
+        # Determine the dtype of the combined column (similar to pd.concat)
+        if all(dtype == list_dtypes[0] for dtype in list_dtypes) and not (
+                missing and not pd.api.types.is_float_dtype(list_dtypes[0])
+                and not pd.api.types.is_object_dtype(list_dtypes[0])):
+            dtype = list_dtypes[0]
+        elif all(pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+                 and isinstance(dtype, np.dtype) for dtype in list_dtypes):
+            dtype = np.result_type(*list_dtypes, *([np.float64] if missing else []))
+        else:
+            dtype = np.dtype(object)
+
+        if not isinstance(dtype, np.dtype):
+            # Extension dtypes (i.e. category) that are equal in all tables
+            dict_cols[col] = pd.concat([df[col] for df in list_df], ignore_index=True).array
+            continue
+        values = np.empty(len(index), dtype=dtype)
+        start = 0
+        for df in list_df:
+            end = start + len(df)
+            values[start:end] = df[col].to_numpy(dtype=dtype) if col in df.columns else np.nan
+            start = end
+        dict_cols[col] = values
+
+    df = pd.DataFrame(dict_cols, index=index, columns=list_cols)
     return df
 
 
+def get_shared_key_codes(list_key_values):
+    """
+    Method to factorize the values of a key column of several DataFrames at once, so equal values get the same
+    (sorted) integer code in all DataFrames. Missing values get their own code, like in pd.merge.
+
+    Parameters
+    ----------
+    list_key_values : list(pd.Series)
+        List with the values of the key column of each DataFrame
+
+    Returns
+    -------
+    tuple(list(np.array), int) with the integer codes per DataFrame and the number of codes
+    """
+
+    codes, uniques = pd.factorize(np.concatenate([np.asarray(values, dtype=object) for values in list_key_values]),
+                                  sort=True)
+    codes = np.where(codes == -1, len(uniques), codes).astype(np.int64)
+    list_codes = np.split(codes, np.cumsum([len(values) for values in list_key_values])[:-1])
+    return list_codes, len(uniques) + 1
+
+
+def combine_sources_on_keys(df_base, list_sources):
+    """
+    Method to left join several sources to a base DataFrame in one pass, with the same result as a chain of
+    pd.merge(how='left') calls (including the suffixes '_x' and '_y' of overlapping columns). The keys are factorized
+    once into a shared sorted integer key per source, the rows of each source are looked up with a binary search and
+    the wide DataFrame is assembled at once. Sources with duplicate keys are merged with pd.merge.
+
+    Parameters
+    ----------
+    df_base : pd.DataFrame
+        DataFrame with the rows of the result, i.e. the WMO data
+    list_sources : list(tuple(pd.DataFrame, list(str)))
+        List with the sources to join in order, each with the columns to join on. The key columns should be in
+        df_base or in one of the previous sources, i.e. [(df_wijk, ['codering_regio', 'interval']),
+        (df_bevolking, ['gemeentenaam', 'interval'])]
+
+    Returns
+    -------
+    pd.DataFrame with a RangeIndex
+    """
+
+    df_base = df_base.reset_index(drop=True)
+    list_blocks = [df_base]
+    list_colnames = list(df_base.columns)
+    for i, (df_source, list_keys) in enumerate(list_sources):
+        df_source = df_source.reset_index(drop=True)
+        list_source_cols = [c for c in df_source.columns if c not in list_keys]
+        dict_cols_left = dict(zip(list_colnames, [block[col] for block in list_blocks for col in block.columns]))
+
+        # Combine the shared codes of all keys to one integer key
+        key_left = np.zeros(len(df_base), dtype=np.int64)
+        key_source = np.zeros(len(df_source), dtype=np.int64)
+        for key in list_keys:
+            (codes_left, codes_source), n_codes = get_shared_key_codes([dict_cols_left[key], df_source[key]])
+            key_left = key_left * n_codes + codes_left
+            key_source = key_source * n_codes + codes_source
+        order = np.argsort(key_source, kind='stable')
+        key_source_sorted = key_source[order]
+
+        if (key_source_sorted[1:] == key_source_sorted[:-1]).any():
+            # A left join with duplicate keys adds rows, so the remaining sources are merged one by one
+            print(f"Source {i} has duplicate keys, combine the remaining sources with pd.merge")
+            df = pd.concat(list_blocks, axis=1)
+            df.columns = list_colnames
+            for df_source_merge, list_keys_merge in list_sources[i:]:
+                df = pd.merge(df, df_source_merge, how='left', on=list_keys_merge)
+            return df
+
+        # Binary search of the keys of df_base in the sorted keys of the source (-1 if not found)
+        rows_source = np.full(len(df_base), -1, dtype=np.int64)
+        if len(df_source) > 0:
+            positions = np.minimum(np.searchsorted(key_source_sorted, key_left), len(df_source) - 1)
+            found = key_source_sorted[positions] == key_left
+            rows_source[found] = order[positions[found]]
+        list_blocks.append(df_source[list_source_cols].reindex(rows_source).reset_index(drop=True))
+
+        # Overlapping columns get a suffix, like pd.merge
+        list_overlap = [c for c in list_source_cols if c in list_colnames]
+        list_colnames = [c + '_x' if c in list_overlap else c for c in list_colnames]
+        list_colnames += [c + '_y' if c in list_overlap else c for c in list_source_cols]
+
+    df = pd.concat(list_blocks, axis=1)
+    df.columns = list_colnames
+    return df
+
+
+def get_required_cols(list_settings):
+    """
+    Method to get all (stripped) columnnames that are mentioned in settings, used to download only these columns.
+
+    Parameters
+    ----------
+    list_settings : list
+        List with settings (strings, lists and/or dictionaries, possibly nested) that contain columnnames. Columnnames
+        with the prefix 'relative_' are added without that prefix.
+
+    Returns
+    -------
+    list(str) with the unique columnnames
+    """
+
+    set_cols = set()
+    list_to_check = list(list_settings)
+    while list_to_check:
+        item = list_to_check.pop()
+        if isinstance(item, str):
+            set_cols.add(item)
+            set_cols.add(item.replace('relative_', ''))
+        elif isinstance(item, dict):
+            list_to_check.extend(item.keys())
+            list_to_check.extend(item.values())
+        elif isinstance(item, (list, tuple, set)):
+            list_to_check.extend(item)
+    return sorted(set_cols)
+
+
 def rename_and_subset_cols(df, dict_rename, list_cols, include=True):
     """
     Method to rename and subset certain columns from a DataFrame.
@@ -55,6 +471,7 @@ def rename_and_subset_cols(df, dict_rename, list_cols, include=True):
         List of columns to keep/drop
     include : bool
         Boolean value to indicate if the columns from list_cols should be kept or dropped. Default 'true' to keep.
+        Columns to drop that are not in the DataFrame (i.e. not downloaded) are ignored.
 
     Returns
     -------
@@ -65,14 +482,56 @@ def rename_and_subset_cols(df, dict_rename, list_cols, include=True):
     if include:
         df = df[list_cols]
     else:
-        df = df.drop(list_cols, axis=1)
+        df = df.drop(list_cols, axis=1, errors='ignore')
 
     return df
 
 
+def pivot_sum_table(df, list_index, col_pivot, dict_values):
+    """
+    Method to pivot one or more value columns of a DataFrame at once, summing the values per index and pivot value.
+    Gives the same result as pd.pivot_table(..., aggfunc=np.sum) per value column (followed by reset_index and
+    rename), but the keys are factorized and grouped only once for all value columns.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame in long format
+    list_index : list(str)
+        List with the columns that identify a row of the result
+    col_pivot : str
+        Column of which the values become the new columns
+    dict_values : dict(str:dict(str:str))
+        Dictionary with the value columns to pivot and per value column the dictionary to rename the columns of its
+        pivot (including the columns of list_index). Use an empty dictionary to keep the columnnames.
+
+    Returns
+    -------
+    pd.DataFrame with the (renamed) index columns, followed by the pivoted columns of each value column
+    """
+
+    list_values = list(dict_values.keys())
+    df_grouped = df.groupby(list_index + [col_pivot])[list_values].sum()
+    df_pivot = df_grouped.unstack(col_pivot).dropna(how='all', axis=1)
+    list_blocks = []
+    for value in list_values:
+        df_block = df_pivot[value].rename(columns=dict_values[value])
+        df_block.columns.name = col_pivot
+        list_blocks.append(df_block)
+    df_pivot = pd.concat(list_blocks, axis=1).reset_index()
+    dict_rename_index = {}
+    for dict_rename in dict_values.values():
+        dict_rename_index.update({k: v for k, v in dict_rename.items() if k in list_index})
+    df_pivot = df_pivot.rename(columns=dict_rename_index)
+
+    return df_pivot
+
+
 def get_region_period_spec_val_subtable(df, region=None, period=None, col='typemaatwerkarrangement', spec_value=None):
     """
-    Method to subset the dataframe based on a certain region, period and specific value of a column.
+    Method to subset the dataframe based on a certain region, period and specific value of a column. Note: With
+    settings.get_data['ROW_FILTER_PUSHDOWN'] the same subset is already requested from the CBS database (see
+    cbs_utils.build_cbs_filters), this method remains as the in-memory filter, i.e. for servers without $filter.
 
     Parameters
     ----------
@@ -80,7 +539,7 @@ def get_region_period_spec_val_subtable(df, region=None, period=None, col='typem
         DataFrame with the WMO data from CBS with the columns 'codering_regio', 'perioden' and a specific to subset on
         which gives a type, i.e. a column to subset on type of WMO.
     region : str
-        String to choose region. Possible strings are: "gemeente", "wijk"
+        String to choose region. Possible strings are: "gemeente", "wijk", "buurt"
     period : str
         String to choose period. Possible strings are: "jaar", "halfjaar"
     col : str
@@ -112,7 +571,8 @@ def get_region_period_spec_val_subtable(df, region=None, period=None, col='typem
 
 def downcast_variables_dataframe(df):
     """
-    Method to downcast the variables in a DataFrame
+    Method to downcast the variables in a DataFrame: object columns (and index levels) become categorical, integers
+    become int32 and floats become float32 if their values fit.
 
     Parameters
     ----------
@@ -123,17 +583,83 @@ def downcast_variables_dataframe(df):
     -------
     pd.DataFrame
     """
-    df_downy = df.copy()
+    list_index_names = [name for name in df.index.names if name is not None]
+    df_downy = df.reset_index() if list_index_names else df.copy()
     # Downcast dataset
     df_downy[df_downy.select_dtypes(include='object').columns] = df_downy.select_dtypes(include='object').astype(
         'category')
 
-    for old, new in [('integer', 'unsigned'), ('float', 'float')]:
-        for col in df.select_dtypes(include=old).columns:
-            df_downy.loc[:, col] = pd.to_numeric(df_downy.loc[:, col], downcast=new)
+    info_int32 = np.iinfo(np.int32)
+    info_float32 = np.finfo(np.float32)
+    for col in df_downy.select_dtypes(include='integer').columns:
+        if df_downy[col].min() >= info_int32.min and df_downy[col].max() <= info_int32.max:
+            df_downy[col] = df_downy[col].astype(np.int32)
+    for col in df_downy.select_dtypes(include='float').columns:
+        if not (df_downy[col].abs() > info_float32.max).any():
+            df_downy[col] = df_downy[col].astype(np.float32)
+    if list_index_names:
+        df_downy = df_downy.set_index(list_index_names)
     return df_downy
 
 
+def get_shared_categorical_dtypes(list_df, list_cols):
+    """
+    Method to get one (ordered) categorical dtype per column with the values of all DataFrames. When the key columns
+    of DataFrames have the same categorical dtype, a merge on these columns keeps the categorical dtype.
+
+    Parameters
+    ----------
+    list_df : list(pd.DataFrame)
+        List with DataFrames with (some of) the columns or index levels of list_cols
+    list_cols : list(str)
+        List with the columns to make categorical, i.e. ['codering_regio', 'interval', 'gemeentenaam']
+
+    Returns
+    -------
+    dict(str: pd.CategoricalDtype)
+    """
+
+    dict_dtypes = {}
+    for col in list_cols:
+        set_values = set()
+        for df in list_df:
+            if col in df.columns:
+                set_values.update(df[col].dropna().unique())
+            elif col in df.index.names:
+                set_values.update(df.index.get_level_values(col).dropna().unique())
+        dict_dtypes[col] = pd.CategoricalDtype(sorted(set_values), ordered=True)
+    return dict_dtypes
+
+
+def set_categorical_dtypes(df, dict_dtypes):
+    """
+    Method to set the categorical dtypes of columns and index levels of a DataFrame, see get_shared_categorical_dtypes.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame with (some of) the columns or index levels of dict_dtypes
+    dict_dtypes : dict(str: pd.CategoricalDtype)
+        Dictionary with as key the columnname and as value the categorical dtype
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+
+    df = df.copy()
+    list_index_cols = [col for col in dict_dtypes.keys() if col in df.index.names]
+    if list_index_cols:
+        list_index_names = list(df.index.names)
+        df = df.reset_index()
+    for col, dtype in dict_dtypes.items():
+        if col in df.columns:
+            df[col] = df[col].astype(dtype)
+    if list_index_cols:
+        df = df.set_index(list_index_names)
+    return df
+
+
 def make_df_missing(df):
     """
     Method to calculate the number and percentages of missing values.
@@ -152,4 +678,167 @@ def make_df_missing(df):
     s_perc_missing = s_num_missing / len(df)
     df_missing = pd.DataFrame({'num_missing': s_num_missing, 'perc_missing': s_perc_missing})
     df_missing = df_missing.sort_values('perc_missing', ascending=False)
-    return df_missing
\ No newline at end of file
+    return df_missing
+
+
+def get_incremental_rows(df, index_previous, groupcols, cols, interpolate_method='linear'):
+    """
+    Method to get the rows to preprocess again when new rows (i.e. a new period) are added to a dataset that is
+    preprocessed before with a fitted pipeline. Of the previous rows only the rows whose interpolation (per group, in
+    the order of the rows) changes are preprocessed again: the missing values of a column of which the nearest value
+    before or after (only before for 'pad') is a new value, and for 'linear' also the missing values with a new row
+    between the values they are interpolated from. The interpolation of these rows needs the rows of the group between
+    the values they are interpolated from (the anchors).
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame with all rows (previous and new), with the index of the preprocessed dataset
+    index_previous : pd.Index
+        Index of the previously preprocessed rows
+    groupcols : list(str)
+        Columns of the groups of the interpolation, i.e. ['codering_regio']
+    cols : list(str)
+        Columns that are interpolated
+    interpolate_method : str
+        Method of the interpolation, i.e. 'linear', 'pad' or 'nearest'. Default 'linear'
+
+    Returns
+    -------
+    Tuple with two boolean np.ndarray's: the rows to transform (including the anchors) and the rows of the output
+    """
+
+    n_rows = len(df)
+    is_previous = df.index.isin(index_previous)
+    df_groups = df.reset_index()[groupcols]
+    # Rows with a missing value in a group column are in no group (-1)
+    codes = df_groups.groupby(groupcols, sort=False).ngroup().fillna(-1).to_numpy(dtype=np.int64) \
+        if len(groupcols) > 0 else np.zeros(n_rows, dtype=np.int64)
+
+    # Sort the rows by group (in the order of the rows), so every group is a range of positions
+    order = np.argsort(codes, kind='stable')
+    codes_sorted = codes[order]
+    positions = np.arange(n_rows)
+    starts = np.searchsorted(codes_sorted, codes_sorted, side='left')
+    ends = np.searchsorted(codes_sorted, codes_sorted, side='right') - 1
+    is_previous_sorted = is_previous[order]
+    is_valid = df[cols].notna().to_numpy()[order]
+
+    def get_nearest_valid(is_valid_nearest):
+        # Position of the last value at or before a row and the first value at or after a row in its group
+        last = np.maximum.accumulate(np.where(is_valid_nearest, positions[:, None], -1), axis=0)
+        last = np.where(last >= starts[:, None], last, -1)
+        first = np.minimum.accumulate(np.where(is_valid_nearest, positions[:, None], n_rows)[::-1], axis=0)[::-1]
+        first = np.where(first <= ends[:, None], first, n_rows)
+        return last, first
+
+    last_all, first_all = get_nearest_valid(is_valid)
+    last_previous, first_previous = get_nearest_valid(is_valid & is_previous_sorted[:, None])
+    is_changed = last_all != last_previous
+    if interpolate_method != 'pad':
+        is_changed |= first_all != first_previous
+    if interpolate_method == 'linear':
+        # The linear interpolation uses the positions in the group, so a new row (with or without values) between the
+        # values that a missing value is interpolated from changes it as well
+        cum_new = np.cumsum(~is_previous_sorted)
+        n_new_between = cum_new[np.clip(first_all, 0, n_rows - 1)] - cum_new[np.clip(last_all, 0, n_rows - 1)]
+        is_changed |= (last_all >= 0) & (first_all < n_rows) & ~is_valid & (n_new_between > 0)
+    is_output_sorted = ~is_previous_sorted | is_changed.any(axis=1)
+
+    # Per group the range from the first to the last anchor of the rows of the output
+    anchor_first = np.where(last_all >= 0, last_all, positions[:, None]).min(axis=1)
+    anchor_last = np.where(first_all < n_rows, first_all, positions[:, None]).max(axis=1)
+    n_groups = codes.max() + 2 if n_rows > 0 else 1
+    range_first = np.full(n_groups, n_rows)
+    range_last = np.full(n_groups, -1)
+    np.minimum.at(range_first, codes_sorted[is_output_sorted] + 1, anchor_first[is_output_sorted])
+    np.maximum.at(range_last, codes_sorted[is_output_sorted] + 1, anchor_last[is_output_sorted])
+    is_transform_sorted = (positions >= range_first[codes_sorted + 1]) & (positions <= range_last[codes_sorted + 1])
+
+    # Rows without a group (-1) are not interpolated, so only new rows of them are transformed
+    is_output = np.empty(n_rows, dtype=bool)
+    is_transform = np.empty(n_rows, dtype=bool)
+    is_output[order] = is_output_sorted
+    is_transform[order] = is_transform_sorted
+    is_output = np.where(codes >= 0, is_output, ~is_previous)
+    is_transform = np.where(codes >= 0, is_transform, ~is_previous)
+
+    return is_transform, is_output
+
+
+def split_dataset_by_groups(filepath, path_split, groupcols, n_partitions, batch_size=100000,
+                            col_position='__position__', compression='zstd'):
+    """
+    Method to split a saved dataset (see write_dataset) into partitions of groups (by the hash of the group columns,
+    i.e. all rows of a region are in the same partition) without reading the whole dataset in memory: the dataset is
+    read in batches and every batch is appended to the files of the partitions. The position of every row in the
+    dataset is added as a column, and the missing values per column are counted (like make_df_missing).
+
+    Parameters
+    ----------
+    filepath : str
+        Filepath of the dataset (a parquet file or the folder of a partitioned dataset)
+    path_split : str
+        Path of the folder to save the partitions in
+    groupcols : list(str)
+        Columns (or levels of the index) of the groups, i.e. ['codering_regio']
+    n_partitions : int
+        Number of partitions
+    batch_size : int
+        Maximum number of rows that are read at once. Default 100000
+    col_position : str
+        Name of the column with the position of the rows in the dataset. Default '__position__'
+    compression : str
+        Codec of the parquet files of the partitions. Default 'zstd'
+
+    Returns
+    -------
+    Tuple with the list of the filepaths of the partitions (with rows), a pd.DataFrame with the missing values per
+    column (see make_df_missing) and an empty pd.DataFrame with the columns and dtypes of the dataset
+    """
+
+    os.makedirs(path_split, exist_ok=True)
+    dict_writers = {}
+    n_rows = 0
+    s_num_missing = None
+    schema = None
+    try:
+        for file in get_dataset_files(filepath):
+            for batch in pq.ParquetFile(file).iter_batches(batch_size=batch_size):
+                if schema is None:
+                    schema = batch.schema
+                    s_num_missing = pd.Series(0, index=schema.names)
+                # Nulls of float columns are NaN in numpy, so NaN and null are both counted once
+                s_num_missing += [np.isnan(col.to_numpy(zero_copy_only=False)).sum() if pa.types.is_floating(col.type)
+                                  else col.null_count for col in batch.columns]
+                df_groups = pd.DataFrame({col: batch.column(schema.get_field_index(col)).to_pandas()
+                                          for col in groupcols})
+                partitions = pd.util.hash_pandas_object(df_groups, index=False).to_numpy() % n_partitions
+                batch = pa.RecordBatch.from_arrays(
+                    batch.columns + [pa.array(np.arange(n_rows, n_rows + batch.num_rows))],
+                    schema=schema.append(pa.field(col_position, pa.int64())))
+                for partition in np.unique(partitions):
+                    if partition not in dict_writers:
+                        filepath_partition = os.path.join(path_split, f"partition={partition}", 'part-0.parquet')
+                        os.makedirs(os.path.dirname(filepath_partition), exist_ok=True)
+                        dict_writers[partition] = pq.ParquetWriter(filepath_partition, batch.schema,
+                                                                   compression=compression)
+                    dict_writers[partition].write_table(
+                        pa.Table.from_batches([batch.filter(pa.array(partitions == partition))]))
+                n_rows += batch.num_rows
+    finally:
+        for writer in dict_writers.values():
+            writer.close()
+
+    if schema is None:
+        # A dataset without rows has no batches
+        schema = pq.read_schema(get_dataset_files(filepath)[0])
+        s_num_missing = pd.Series(0, index=schema.names)
+    list_files_split = [os.path.join(path_split, f"partition={partition}", 'part-0.parquet')
+                        for partition in sorted(dict_writers)]
+    # The same as make_df_missing of the whole dataset (with the index as columns)
+    s_num_missing = s_num_missing[s_num_missing > 0]
+    df_missing = pd.DataFrame({'num_missing': s_num_missing, 'perc_missing': s_num_missing / n_rows})
+    df_missing = df_missing.sort_values('perc_missing', ascending=False)
+
+    return list_files_split, df_missing, schema.empty_table().to_pandas()
\ No newline at end of file
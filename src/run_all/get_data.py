@@ -2,13 +2,158 @@
 import sys
 sys.path.append('../../')
 import pandas as pd
-import numpy as np
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # Custom functions and settings
 import src.settings as settings
+import src.mapper_cols as mapper_cols
 from src.preprocess.preprocess_utils import get_and_combine_cbs_tables, rename_and_subset_cols, \
-    get_region_period_spec_val_subtable, downcast_variables_dataframe
+    get_region_period_spec_val_subtable, downcast_variables_dataframe, get_required_cols, \
+    get_shared_categorical_dtypes, set_categorical_dtypes, combine_sources_on_keys, pivot_sum_table, \
+    aggregate_cbs_tables
+from src.preprocess.cbs_utils import configure_cbs_client, reset_cbs_metadata, get_cbs_tables_modified
+from src.utilities.artifact_store import get_artifact_key, load_artifact, save_artifact
+from src.utilities.artifact_catalog import register_artifact
+from src.utilities.utilities import write_dataset
+
+
+def get_list_cols_required():
+    """
+    Custom function to get all columnnames that are used in the settings and mapper_cols, used to download only the
+    necessary columns of the (wide) CBS tables. Note: Returns None if settings.get_data['COLUMN_PROJECTION'] is False.
+
+    Returns
+    -------
+    list(str) with columnnames or None (all columns are downloaded)
+    """
+
+    if not settings.get_data['COLUMN_PROJECTION']:
+        return None
+    list_mapper_cols = [value for key, value in vars(mapper_cols).items() if key.isupper()]
+    return get_required_cols([settings.Y_TARGET_COLS, settings.get_data, settings.get_data_predict,
+                              settings.preprocess, settings.preprocess_predict] + list_mapper_cols)
+
+
+def clean_huishoudens(df_huishoudens):
+    """
+    Custom function to clean the household table(s): the zipcodes 'Nederland' and 'Niet in te delen' are removed and
+    the position in the household and gender are combined to the column 'positiehuishouden'.
+
+    Parameters
+    ----------
+    df_huishoudens : pd.DataFrame
+        DataFrame with (a chunk of) the household table(s), see settings.get_data['DICT_TABLES_HUISHOUDEN']
+
+    Returns
+    -------
+    pd.DataFrame with the columns of settings.get_data['LIST_COLS_SUBSET_HUISHOUDEN']
+    """
+
+    df_huishoudens = df_huishoudens.drop(['interval'], axis=1)
+    df_huishoudens = df_huishoudens.rename(columns=settings.get_data['DICT_COLS_RENAMED_HUISHOUDEN'])
+    indexNames = df_huishoudens[
+        (df_huishoudens['postcode'] == 'Nederland') | (df_huishoudens['postcode'] == 'Niet in te delen')].index
+    df_huishoudens.drop(indexNames, inplace=True)
+    for col in ['geslacht', 'positieinhethuishouden']:
+        df_huishoudens[col] = df_huishoudens[col].str.lower().str.replace(" ", "_")
+    df_huishoudens['positiehuishouden'] = df_huishoudens['positieinhethuishouden'] + '_' + df_huishoudens['geslacht']
+    df_huishoudens = df_huishoudens[settings.get_data['LIST_COLS_SUBSET_HUISHOUDEN']]
+    return df_huishoudens
+
+
+def aggregate_huishoudens_chunk(df_chunk, df_pc_link):
+    """
+    Custom function to aggregate a chunk of the household table(s) from zipcodes to municipalities. The number of
+    inhabitants of a zipcode is counted once for every 'buurt' of a municipality with that zipcode, like the inner
+    merge of the zipcode table with the 'buurten'.
+
+    Parameters
+    ----------
+    df_chunk : pd.DataFrame
+        DataFrame with a chunk of the household table(s), with stripped columnnames and the interval
+    df_pc_link : pd.DataFrame
+        DataFrame with the zipcode, interval, municipality and the number of 'buurten' ('n_buurten')
+
+    Returns
+    -------
+    pd.Series with the number of inhabitants per municipality, interval and position in the household
+    """
+
+    df_chunk = clean_huishoudens(df_chunk)
+    df_chunk = pd.merge(df_chunk, df_pc_link, how='inner', on=settings.get_data['LIST_INDEX_ZIPCODE_LINK_WIJK'])
+    df_chunk['bevolking'] = df_chunk['bevolking'] * df_chunk['n_buurten']
+    return df_chunk.groupby(settings.get_data['LIST_MERGE_COLS'] + ['positiehuishouden'])['bevolking'].sum()
+
+
+def get_cbs_artifact_key(step, list_inputs, list_settings):
+    """
+    Custom function to get the key of the output of a step that collects CBS tables (see
+    src.utilities.artifact_store). Next to the inputs, the key contains the required columns and the timestamps of the
+    last modification of all tables in the settings, so the output is collected again if CBS changed a table. The
+    timestamps are not checked with the cache policy 'offline'.
+
+    Parameters
+    ----------
+    step : str
+        Name of the step, i.e. 'get_data'
+    list_inputs : list(object)
+        List with the inputs of the step (settings, parameters)
+    list_settings : list(dict)
+        List with the settings that contain the tables of the step (keys that start with 'DICT_TABLES')
+
+    Returns
+    -------
+    str with the key of the artifact
+    """
+
+    list_tables = [table for dict_settings in list_settings for key, dict_tables in dict_settings.items()
+                   if key.startswith('DICT_TABLES') for table in dict_tables.values()]
+    dict_modified = None
+    if settings.get_data['CBS_CACHE_POLICY'] != 'offline':
+        dict_modified = get_cbs_tables_modified(list_tables, url=settings.get_data['CBS_OPEN_URL'])
+    return get_artifact_key(step, list(list_inputs) + [get_list_cols_required(), dict_modified])
+
+
+def save_get_data_output(df, dict_settings, filename_prefix, personal_note="", df_fetch_report=None):
+    """
+    Method to save the logging and the DataFrame of step 'Get Data' (or 'Get Data Predict') and to add the DataFrame
+    to the catalog of artifacts.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame with the output of the step
+    dict_settings : dict
+        Settings of the step (settings.get_data or settings.get_data_predict), the log is saved in 'LOG_PATH'
+    filename_prefix : str
+        Prefix of the filename, the timestamp of the run is added (i.e. settings.get_data['FILENAME'])
+    personal_note : str
+        String value to add to the filename to make recognition of the saved files easier.
+    df_fetch_report : pd.DataFrame
+        DataFrame with the report of the downloads of the CBS tables. Default None (the output is of the artifact
+        store, nothing is downloaded)
+
+    Returns
+    -------
+    str with the filepath of the saved DataFrame
+    """
+
+    datetime_now = datetime.now()
+    filename = filename_prefix + datetime.strftime(datetime_now, format='%Y%m%d%H%M')
+    df_log = pd.DataFrame({
+        'timestamp_run': [datetime_now],
+        'filename': [filename],
+        'df_output_shape': [df.shape],
+        'df_output_cols': [df.columns],
+        'settings': [dict_settings],
+        'personal_note': [personal_note]})
+    df_log.to_csv(dict_settings['LOG_PATH'] + filename + '_' + personal_note + '.csv')
+    if df_fetch_report is not None:
+        df_fetch_report.to_csv(dict_settings['LOG_PATH'] + filename + '_' + personal_note + '_fetch_report.csv')
+    filepath = write_dataset(df, settings.DATAPATH + filename + '_' + personal_note)
+    register_artifact(filepath, shape=df.shape, catalog_path=settings.artifact_store['CATALOG_PATH'])
+    return filepath
 
 
 def get_data(save_all=False, personal_note=""):
@@ -28,9 +173,132 @@ def get_data(save_all=False, personal_note=""):
     pd.DataFrame with all data needed for training/prediction
     """
 
+    # Start collecting all CBS tables at once, the total download time is limited by the slowest table
+    list_cols_required = get_list_cols_required()
+    configure_cbs_client(retries=settings.get_data['CBS_RETRIES'], backoff=settings.get_data['CBS_BACKOFF'],
+                         timeout=settings.get_data['CBS_TIMEOUT'], pool_size=settings.get_data['CBS_POOL_SIZE'],
+                         max_requests=settings.get_data['CBS_MAX_WORKERS'])
+    reset_cbs_metadata()
+    artifact_key = None
+    if settings.artifact_store['USE_ARTIFACT_STORE']:
+        artifact_key = get_cbs_artifact_key('get_data', [settings.get_data], [settings.get_data])
+        df_artifact = load_artifact('get_data', artifact_key, store_path=settings.artifact_store['STORE_PATH'])
+        if df_artifact is not None:
+            # Nothing is downloaded, but the DataFrame is saved like a downloaded one
+            if save_all:
+                save_get_data_output(df_artifact, settings.get_data, settings.get_data['FILENAME'],
+                                     personal_note=personal_note)
+            return df_artifact
+    list_fetch_report = []
+    list_cols_required_wijk = None
+    if list_cols_required is not None:
+        # Columns that are dropped from the WIJK tables anyway don't need to be downloaded
+        list_cols_required_wijk = [c for c in list_cols_required if c not in settings.get_data['LIST_COLS_SUBSET_WIJK']]
+    # Only request the rows of the selected region level, period and type of WMO (filters are applied again below)
+    dict_row_filters_wmo = {}
+    dict_row_filters_wijk = {}
+    dict_row_filters_bevolking = {}
+    if settings.get_data['ROW_FILTER_PUSHDOWN']:
+        dict_row_filters_wmo = {'region': settings.get_data['REGION'],
+                                'period': settings.get_data['PERIOD'],
+                                'col': settings.get_data['COL_TYPE_WMO'],
+                                'spec_value': settings.get_data['TYPE_WMO']}
+        dict_row_filters_bevolking = {'region': 'gemeente'}
+    # With the projection the 'buurt' rows (for the link between zipcodes and municipalities) are downloaded apart,
+    # with only their link columns. Without it, that download would have all columns of the 'buurt' rows, so the WIJK
+    # tables are downloaded once without the region filter and both are taken from it.
+    # Both downloads of the WIJK tables share their metadata, it is collected once (see get_cbs_metadata).
+    is_wijk_postcode_apart = settings.get_data['ROW_FILTER_PUSHDOWN'] and list_cols_required is not None
+    if is_wijk_postcode_apart:
+        dict_row_filters_wijk = {'region': settings.get_data['REGION']}
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        future_wmo = executor.submit(get_and_combine_cbs_tables,
+                                     dict_tables=settings.get_data['DICT_TABLES_WMO'],
+                                     url=settings.get_data['CBS_OPEN_URL'],
+                                     list_cols_required=list_cols_required,
+                                     dict_rename=settings.get_data['DICT_COLS_RENAMED_WMO'],
+                                     max_workers=settings.get_data['CBS_MAX_WORKERS'],
+                                     cache_path=settings.get_data['CBS_CACHE_PATH'],
+                                     cache_policy=settings.get_data['CBS_CACHE_POLICY'],
+                                     streaming=settings.get_data['CBS_STREAMING'],
+                                     list_fetch_report=list_fetch_report,
+                                     allow_failed=settings.get_data['CBS_ALLOW_FAILED_TABLES'],
+                                     **dict_row_filters_wmo)
+        future_wijk = executor.submit(get_and_combine_cbs_tables,
+                                      dict_tables=settings.get_data['DICT_TABLES_WIJK'],
+                                      double_trouble_colnames=settings.get_data['DOUBLETROUBLECOLNAMES_WIJK'],
+                                      url=settings.get_data['CBS_OPEN_URL'],
+                                      list_cols_required=list_cols_required_wijk,
+                                      dict_rename=settings.get_data['DICT_COLS_RENAMED_WIJK'],
+                                      max_workers=settings.get_data['CBS_MAX_WORKERS'],
+                                      cache_path=settings.get_data['CBS_CACHE_PATH'],
+                                      cache_policy=settings.get_data['CBS_CACHE_POLICY'],
+                                      streaming=settings.get_data['CBS_STREAMING'],
+                                      list_fetch_report=list_fetch_report,
+                                      allow_failed=settings.get_data['CBS_ALLOW_FAILED_TABLES'],
+                                      **dict_row_filters_wijk)
+        future_wijk_postcode = None
+        if is_wijk_postcode_apart:
+            # The link between zipcodes and municipalities is made with the 'buurt' rows, only their link columns are
+            # needed
+            future_wijk_postcode = executor.submit(get_and_combine_cbs_tables,
+                                                   dict_tables=settings.get_data['DICT_TABLES_WIJK'],
+                                                   double_trouble_colnames=settings.get_data[
+                                                       'DOUBLETROUBLECOLNAMES_WIJK'],
+                                                   url=settings.get_data['CBS_OPEN_URL'],
+                                                   list_cols_required=settings.get_data[
+                                                       'LIST_COLS_ZIPCODE_LINK_WIJK'],
+                                                   dict_rename=settings.get_data['DICT_COLS_RENAMED_WIJK'],
+                                                   max_workers=settings.get_data['CBS_MAX_WORKERS'],
+                                                   cache_path=settings.get_data['CBS_CACHE_PATH'],
+                                                   cache_policy=settings.get_data['CBS_CACHE_POLICY'],
+                                                   streaming=settings.get_data['CBS_STREAMING'],
+                                                   list_fetch_report=list_fetch_report,
+                                                   allow_failed=settings.get_data['CBS_ALLOW_FAILED_TABLES'],
+                                                   region='buurt')
+        future_huishoudens = None
+        if not settings.get_data['HUISHOUDENS_STREAMING']:
+            future_huishoudens = executor.submit(get_and_combine_cbs_tables,
+                                                 dict_tables=settings.get_data['DICT_TABLES_HUISHOUDEN'],
+                                                 url=settings.get_data['CBS_OPEN_URL'],
+                                                 max_workers=settings.get_data['CBS_MAX_WORKERS'],
+                                                 cache_path=settings.get_data['CBS_CACHE_PATH'],
+                                                 cache_policy=settings.get_data['CBS_CACHE_POLICY'],
+                                                 streaming=settings.get_data['CBS_STREAMING'],
+                                                 list_fetch_report=list_fetch_report,
+                                                 allow_failed=settings.get_data['CBS_ALLOW_FAILED_TABLES'])
+        future_bevolking = executor.submit(get_and_combine_cbs_tables,
+                                           dict_tables=settings.get_data['DICT_TABLES_BEVOLKING'],
+                                           double_trouble_colnames=settings.get_data[
+                                               'DICT_DOUBLETROUBLECOLNAMES_BEVOLKING'],
+                                           url=settings.get_data['CBS_OPEN_URL'],
+                                           list_cols_required=list_cols_required,
+                                           dict_rename=settings.get_data['DICT_COLS_RENAMED_BEVOLKING'],
+                                           max_workers=settings.get_data['CBS_MAX_WORKERS'],
+                                           cache_path=settings.get_data['CBS_CACHE_PATH'],
+                                           cache_policy=settings.get_data['CBS_CACHE_POLICY'],
+                                           streaming=settings.get_data['CBS_STREAMING'],
+                                           list_fetch_report=list_fetch_report,
+                                           allow_failed=settings.get_data['CBS_ALLOW_FAILED_TABLES'],
+                                           **dict_row_filters_bevolking)
+        future_heffing = executor.submit(get_and_combine_cbs_tables,
+                                         dict_tables=settings.get_data['DICT_TABLES_HEFFING'],
+                                         url=settings.get_data['CBS_OPEN_URL'],
+                                         max_workers=settings.get_data['CBS_MAX_WORKERS'],
+                                         cache_path=settings.get_data['CBS_CACHE_PATH'],
+                                         cache_policy=settings.get_data['CBS_CACHE_POLICY'],
+                                         streaming=settings.get_data['CBS_STREAMING'],
+                                         list_fetch_report=list_fetch_report,
+                                         allow_failed=settings.get_data['CBS_ALLOW_FAILED_TABLES'])
+        # The results are collected within the block, so no download is left running after an error
+        df_wmo = future_wmo.result()
+        df_wijk = future_wijk.result()
+        df_wijk_postcode_raw = None if future_wijk_postcode is None else future_wijk_postcode.result()
+        df_huishoudens_raw = None if future_huishoudens is None else future_huishoudens.result()
+        df_bevolking = future_bevolking.result()
+        df_heffing = future_heffing.result()
+
     print("Get 'WMO' tables")
-    df_wmo = get_and_combine_cbs_tables(dict_tables=settings.get_data['DICT_TABLES_WMO'],
-                                        url=settings.get_data['CBS_OPEN_URL'])
     df_wmo_sub = rename_and_subset_cols(df=df_wmo,
                                         dict_rename=settings.get_data['DICT_COLS_RENAMED_WMO'],
                                         list_cols=settings.get_data['LIST_COLS_SUBSET_WMO'])
@@ -41,13 +309,9 @@ def get_data(save_all=False, personal_note=""):
                                                        spec_value=settings.get_data['TYPE_WMO'])
     df_wmo_total[settings.get_data['LIST_STR_STRIP_COLS_WMO']] = df_wmo_total[
         settings.get_data['LIST_STR_STRIP_COLS_WMO']].apply(lambda x: x.str.strip())
-    # df_wmo_total = downcast_variables_dataframe(df_wmo_total)
     df_wmo_total = df_wmo_total.set_index(settings.get_data['LIST_INDEX_WMO'])
 
     print("Get 'WIJK' tables")
-    df_wijk = get_and_combine_cbs_tables(dict_tables=settings.get_data['DICT_TABLES_WIJK'],
-                                         double_trouble_colnames=settings.get_data['DOUBLETROUBLECOLNAMES_WIJK'],
-                                         url=settings.get_data['CBS_OPEN_URL'])
     df_wijk_sub = rename_and_subset_cols(df=df_wijk,
                                          dict_rename=settings.get_data['DICT_COLS_RENAMED_WIJK'],
                                          list_cols=settings.get_data['LIST_COLS_SUBSET_WIJK'],
@@ -56,7 +320,16 @@ def get_data(save_all=False, personal_note=""):
         settings.get_data['LIST_STR_STRIP_COLS_WIJK']].apply(lambda x: x.str.strip())
     df_wijk_sub['perioden'] = df_wijk_sub['interval']  # just to apply function get_region_period_spec_val_subtable
     # Extract the municipalities and zipcodes for later
-    df_pc_gem = df_wijk_sub[df_wijk_sub.codering_regio.str.startswith('BU', na=False)][
+    if df_wijk_postcode_raw is None:
+        df_wijk_postcode_sub = df_wijk_sub
+    else:
+        df_wijk_postcode_sub = rename_and_subset_cols(df=df_wijk_postcode_raw,
+                                                      dict_rename=settings.get_data['DICT_COLS_RENAMED_WIJK'],
+                                                      list_cols=settings.get_data['LIST_COLS_SUBSET_WIJK'],
+                                                      include=False)
+        df_wijk_postcode_sub[settings.get_data['LIST_STR_STRIP_COLS_WIJK']] = df_wijk_postcode_sub[
+            settings.get_data['LIST_STR_STRIP_COLS_WIJK']].apply(lambda x: x.str.strip())
+    df_pc_gem = df_wijk_postcode_sub[df_wijk_postcode_sub.codering_regio.str.startswith('BU', na=False)][
         settings.get_data['LIST_COLS_ZIPCODE_LINK_WIJK']].copy()
     df_pc_gem = df_pc_gem.rename(columns=settings.get_data['DICT_COLS_RENAME_ZIPCODE_LINK_WIJK'])
     df_pc_gem[settings.get_data['LIST_STR_STRIP_COLS_ZIPCODE_LINK_WIJK']] = df_pc_gem[
@@ -67,33 +340,35 @@ def get_data(save_all=False, personal_note=""):
                                                         period=settings.get_data['PERIOD'],
                                                         spec_value=None)
     df_wijk_total = df_wijk_total.drop(['perioden'], axis=1)
-    # df_wijk_total = downcast_variables_dataframe(df_wijk_total)
     df_wijk_total = df_wijk_total.set_index(settings.get_data['LIST_INDEX_WMO'])
 
     print("Get 'Huishoudens' data")
-    df_huishoudens = get_and_combine_cbs_tables(dict_tables=settings.get_data['DICT_TABLES_HUISHOUDEN'],
-                                                url=settings.get_data['CBS_OPEN_URL'])
-    df_huishoudens = df_huishoudens.drop(['interval'], axis=1)
-    df_huishoudens = df_huishoudens.rename(columns=settings.get_data['DICT_COLS_RENAMED_HUISHOUDEN'])
-    indexNames = df_huishoudens[
-        (df_huishoudens['postcode'] == 'Nederland') | (df_huishoudens['postcode'] == 'Niet in te delen')].index
-    df_huishoudens.drop(indexNames, inplace=True)
-    for col in ['geslacht', 'positieinhethuishouden']:
-        df_huishoudens[col] = df_huishoudens[col].str.lower().str.replace(" ", "_")
-    df_huishoudens['positiehuishouden'] = df_huishoudens['positieinhethuishouden'] + '_' + df_huishoudens['geslacht']
-    df_huishoudens = df_huishoudens[settings.get_data['LIST_COLS_SUBSET_HUISHOUDEN']]
-    df_huishoudens = pd.pivot_table(data=df_huishoudens, values='bevolking',
-                                    index=settings.get_data['LIST_INDEX_ZIPCODE_LINK_WIJK'],
-                                    columns=['positiehuishouden'], aggfunc=np.sum).reset_index()
-    df_huishoudens = df_huishoudens.set_index(settings.get_data['LIST_INDEX_ZIPCODE_LINK_WIJK'])
-    df_huishoudens = pd.merge(df_huishoudens, df_pc_gem, how='inner', left_index=True, right_index=True).reset_index()
-    df_huishoudens = df_huishoudens.groupby(by=settings.get_data['LIST_MERGE_COLS']).sum().reset_index()
+    if settings.get_data['HUISHOUDENS_STREAMING']:
+        # Number of 'buurten' per zipcode and municipality, the same weights as the inner merge with df_pc_gem
+        df_pc_link = df_pc_gem.reset_index().groupby(
+            settings.get_data['LIST_INDEX_ZIPCODE_LINK_WIJK'] + ['gemeentenaam']).size().rename('n_buurten')
+        df_pc_link = df_pc_link.reset_index()
+        sr_huishoudens = aggregate_cbs_tables(dict_tables=settings.get_data['DICT_TABLES_HUISHOUDEN'],
+                                              func_aggregate=lambda df_chunk: aggregate_huishoudens_chunk(df_chunk,
+                                                                                                          df_pc_link),
+                                              url=settings.get_data['CBS_OPEN_URL'],
+                                              cache_path=settings.get_data['CBS_CACHE_PATH'],
+                                              cache_policy=settings.get_data['CBS_CACHE_POLICY'],
+                                              list_fetch_report=list_fetch_report,
+                                              allow_failed=settings.get_data['CBS_ALLOW_FAILED_TABLES'])
+        df_huishoudens = sr_huishoudens.unstack('positiehuishouden', fill_value=0).reset_index()
+        df_huishoudens.columns.name = None
+    else:
+        df_huishoudens = clean_huishoudens(df_huishoudens_raw)
+        df_huishoudens = pivot_sum_table(df=df_huishoudens,
+                                         list_index=settings.get_data['LIST_INDEX_ZIPCODE_LINK_WIJK'],
+                                         col_pivot='positiehuishouden', dict_values={'bevolking': {}})
+        df_huishoudens = df_huishoudens.set_index(settings.get_data['LIST_INDEX_ZIPCODE_LINK_WIJK'])
+        df_huishoudens = pd.merge(df_huishoudens, df_pc_gem, how='inner', left_index=True,
+                                  right_index=True).reset_index()
+        df_huishoudens = df_huishoudens.groupby(by=settings.get_data['LIST_MERGE_COLS']).sum().reset_index()
 
     print("Get 'Bevolkings' data")
-    df_bevolking = get_and_combine_cbs_tables(dict_tables=settings.get_data['DICT_TABLES_BEVOLKING'],
-                                              double_trouble_colnames=settings.get_data[
-                                                  'DICT_DOUBLETROUBLECOLNAMES_BEVOLKING'],
-                                              url=settings.get_data['CBS_OPEN_URL'])
     df_bevolking = rename_and_subset_cols(df=df_bevolking,
                                           dict_rename=settings.get_data['DICT_COLS_RENAMED_BEVOLKING'],
                                           list_cols=settings.get_data['LIST_COLS_SUBSET_BEVOLKING'],
@@ -104,53 +379,51 @@ def get_data(save_all=False, personal_note=""):
 
     # Get levy data of municipalities
     print("Get 'Gemeentelijke heffingen' data")
-    df_heffing = get_and_combine_cbs_tables(dict_tables=settings.get_data['DICT_TABLES_HEFFING'],
-                                            url=settings.get_data['CBS_OPEN_URL'])
     for col in ['gemeentelijkeheffingenvanaf']:
         df_heffing[col] = df_heffing[col].str.lower().str.replace(" ", "_")
     df_heffing = df_heffing.drop(['interval'], axis=1)
     df_heffing = df_heffing.rename(columns=settings.get_data['DICT_COLS_RENAMED_HEFFING'])
-    df_heffing_euroinwoner = pd.pivot_table(data=df_heffing, values='gemeentelijkeheffingeneuroinwoner',
-                                            index=['regios', 'interval'],
-                                            columns=['gemeentelijkeheffingenvanaf'], aggfunc=np.sum).reset_index()
-    df_heffing_1000euro = pd.pivot_table(data=df_heffing, values='gemeentelijkeheffingenin1000euro',
-                                         index=['regios', 'interval'],
-                                         columns=['gemeentelijkeheffingenvanaf'], aggfunc=np.sum).reset_index()
-    df_heffing_euroinwoner = df_heffing_euroinwoner.rename(columns=settings.get_data['DICT_EUROINWONER_RENAME_HEFFING'])
-    df_heffing_1000euro = df_heffing_1000euro.rename(columns=settings.get_data['DICT_1000EURO_RENAME_HEFFING'])
-    df_heffing = pd.merge(df_heffing_euroinwoner, df_heffing_1000euro, how='inner',
-                          left_on=settings.get_data['LIST_MERGE_COLS'],
-                          right_on=settings.get_data['LIST_MERGE_COLS'])
+    # Both levies are pivoted in one pass, the columns of each levy get their own suffix
+    df_heffing = pivot_sum_table(df=df_heffing, list_index=['regios', 'interval'],
+                                 col_pivot='gemeentelijkeheffingenvanaf',
+                                 dict_values={
+                                     'gemeentelijkeheffingeneuroinwoner':
+                                         settings.get_data['DICT_EUROINWONER_RENAME_HEFFING'],
+                                     'gemeentelijkeheffingenin1000euro':
+                                         settings.get_data['DICT_1000EURO_RENAME_HEFFING']})
+
+    df_fetch_report = pd.DataFrame(list_fetch_report)
+    print(f"Fetch report of the CBS tables (total {df_fetch_report['bytes'].sum()} bytes):")
+    print(df_fetch_report)
+
+    if settings.get_data['LOW_MEMORY']:
+        # Downcast the measures and give the keys of all datasets the same categories, so the merges keep the dtypes
+        list_df = [df_wmo_total, df_wijk_total, df_huishoudens, df_bevolking, df_heffing]
+        dict_dtypes_category = get_shared_categorical_dtypes(list_df, settings.get_data['LIST_COLS_CATEGORY'])
+        df_wmo_total, df_wijk_total, df_huishoudens, df_bevolking, df_heffing = [
+            downcast_variables_dataframe(set_categorical_dtypes(df, dict_dtypes_category)) for df in list_df]
 
     # Combine dataset
     print("Combine all datasets to one DataFrame")
-    df_dataset_WMO = pd.merge(df_wmo_total, df_wijk_total, how='left', left_index=True, right_index=True)
-    df_dataset_WMO = df_dataset_WMO.reset_index()
-    df_dataset_WMO = pd.merge(df_dataset_WMO, df_huishoudens, how='left',
-                              left_on=settings.get_data['LIST_MERGE_COLS'],
-                              right_on=settings.get_data['LIST_MERGE_COLS'])
-    df_dataset_WMO = pd.merge(df_dataset_WMO, df_bevolking, how='left',
-                              left_on=settings.get_data['LIST_MERGE_COLS'],
-                              right_on=settings.get_data['LIST_MERGE_COLS'])
-    df_dataset_WMO = pd.merge(df_dataset_WMO, df_heffing, how='left',
-                              left_on=settings.get_data['LIST_MERGE_COLS'],
-                              right_on=settings.get_data['LIST_MERGE_COLS'])
+    df_dataset_WMO = combine_sources_on_keys(
+        df_base=df_wmo_total.reset_index(),
+        list_sources=[(df_wijk_total.reset_index(), settings.get_data['LIST_INDEX_WMO']),
+                      (df_huishoudens, settings.get_data['LIST_MERGE_COLS']),
+                      (df_bevolking, settings.get_data['LIST_MERGE_COLS']),
+                      (df_heffing, settings.get_data['LIST_MERGE_COLS'])])
     df_dataset_WMO = df_dataset_WMO.set_index(settings.get_data['LIST_INDEX_WMO'])
+    if settings.get_data['LOW_MEMORY']:
+        # Measures without a match in a left merge are upcast because of the missing values
+        df_dataset_WMO = downcast_variables_dataframe(df_dataset_WMO)
+    print(f"Memory usage of df_dataset_WMO = {df_dataset_WMO.memory_usage(deep=True).sum() / 2 ** 20:.1f} MB")
 
     # Save logging and DataFrame
     if save_all:
-        datetime_now = datetime.now()
-        filename = settings.get_data['FILENAME'] + datetime.strftime(datetime_now, format='%Y%m%d%H%M')
-        df_log = pd.DataFrame({
-            'timestamp_run': [datetime_now],
-            'filename': [filename],
-            'df_output_shape': [df_dataset_WMO.shape],
-            'df_output_cols': [df_dataset_WMO.columns],
-            'settings': [settings.get_data],
-            'personal_note': [personal_note]})
-        df_log.to_csv(settings.get_data['LOG_PATH'] + filename + '_' + personal_note + '.csv')
-        df_dataset_WMO.to_parquet(settings.DATAPATH + filename + '_' + personal_note + '.parquet.gzip',
-                                  compression='gzip')
+        save_get_data_output(df_dataset_WMO, settings.get_data, settings.get_data['FILENAME'],
+                             personal_note=personal_note, df_fetch_report=df_fetch_report)
+    # The output is only stored if all CBS tables could be collected
+    if artifact_key is not None and (df_fetch_report['status'] == 'ok').all():
+        save_artifact(df_dataset_WMO, 'get_data', artifact_key, store_path=settings.artifact_store['STORE_PATH'])
 
     return df_dataset_WMO
 
@@ -181,11 +454,66 @@ def get_data_predict(periods=settings.get_data_predict['LIST_PERIODS'], save_all
     roundedto5periods = max(periods) + (5 - max(periods)) % 5
     total_periods = list(range(min(periods), roundedto5periods + 1, 1))
 
+    # Start collecting all CBS tables at once, the total download time is limited by the slowest table
+    list_cols_required = get_list_cols_required()
+    configure_cbs_client(retries=settings.get_data['CBS_RETRIES'], backoff=settings.get_data['CBS_BACKOFF'],
+                         timeout=settings.get_data['CBS_TIMEOUT'], pool_size=settings.get_data['CBS_POOL_SIZE'],
+                         max_requests=settings.get_data['CBS_MAX_WORKERS'])
+    reset_cbs_metadata()
+    artifact_key = None
+    if settings.artifact_store['USE_ARTIFACT_STORE']:
+        artifact_key = get_cbs_artifact_key('get_data_predict', [settings.get_data, settings.get_data_predict, periods],
+                                            [settings.get_data_predict])
+        df_artifact = load_artifact('get_data_predict', artifact_key, store_path=settings.artifact_store['STORE_PATH'])
+        if df_artifact is not None:
+            # Nothing is downloaded, but the DataFrame is saved like a downloaded one
+            if save_all:
+                save_get_data_output(df_artifact, settings.get_data_predict,
+                                     settings.get_data_predict['FILENAME_GET_DATA_PREDICT'],
+                                     personal_note=personal_note)
+            return df_artifact
+    list_fetch_report = []
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        future_regioindeling = executor.submit(get_and_combine_cbs_tables,
+                                               dict_tables=settings.get_data_predict['DICT_TABLES_REGIOINDELING'],
+                                               double_trouble_colnames=settings.get_data_predict[
+                                                   'DICT_DOUBLETROUBLECOLNAMES_REGIOINDELING'],
+                                               url=settings.get_data['CBS_OPEN_URL'],
+                                               list_cols_required=list_cols_required,
+                                               dict_rename=settings.get_data_predict['DICT_COLS_RENAMED_REGIOINDELING'],
+                                               max_workers=settings.get_data['CBS_MAX_WORKERS'],
+                                               cache_path=settings.get_data['CBS_CACHE_PATH'],
+                                               cache_policy=settings.get_data['CBS_CACHE_POLICY'],
+                                               streaming=settings.get_data['CBS_STREAMING'],
+                                               list_fetch_report=list_fetch_report,
+                                               allow_failed=settings.get_data['CBS_ALLOW_FAILED_TABLES'])
+        future_huishouden_prognose = executor.submit(get_and_combine_cbs_tables,
+                                                     dict_tables=settings.get_data_predict['DICT_TABLES_HUISHOUDEN'],
+                                                     url=settings.get_data['CBS_OPEN_URL'],
+                                                     max_workers=settings.get_data['CBS_MAX_WORKERS'],
+                                                     cache_path=settings.get_data['CBS_CACHE_PATH'],
+                                                     cache_policy=settings.get_data['CBS_CACHE_POLICY'],
+                                                     streaming=settings.get_data['CBS_STREAMING'],
+                                                     list_fetch_report=list_fetch_report,
+                                                     allow_failed=settings.get_data['CBS_ALLOW_FAILED_TABLES'])
+        future_population_prognose = executor.submit(get_and_combine_cbs_tables,
+                                                     dict_tables=settings.get_data_predict['DICT_TABLES_BEVOLKING'],
+                                                     url=settings.get_data['CBS_OPEN_URL'],
+                                                     list_cols_required=list_cols_required,
+                                                     dict_rename=settings.get_data_predict[
+                                                         'DICT_COLS_RENAMED_BEVOLKING'],
+                                                     max_workers=settings.get_data['CBS_MAX_WORKERS'],
+                                                     cache_path=settings.get_data['CBS_CACHE_PATH'],
+                                                     cache_policy=settings.get_data['CBS_CACHE_POLICY'],
+                                                     streaming=settings.get_data['CBS_STREAMING'],
+                                                     list_fetch_report=list_fetch_report,
+                                                     allow_failed=settings.get_data['CBS_ALLOW_FAILED_TABLES'])
+        # The results are collected within the block, so no download is left running after an error
+        df_regioindeling = future_regioindeling.result()
+        df_huishouden_prognose = future_huishouden_prognose.result()
+        df_population_prognose = future_population_prognose.result()
+
     print("Get 'regio-indeling'")
-    df_regioindeling = get_and_combine_cbs_tables(dict_tables=settings.get_data_predict['DICT_TABLES_REGIOINDELING'],
-                                                  double_trouble_colnames=settings.get_data_predict[
-                                                      'DICT_DOUBLETROUBLECOLNAMES_REGIOINDELING'],
-                                                  url=settings.get_data['CBS_OPEN_URL'])
     df_regioindeling = rename_and_subset_cols(df=df_regioindeling,
                                               dict_rename=settings.get_data_predict['DICT_COLS_RENAMED_REGIOINDELING'],
                                               list_cols=settings.get_data_predict['LIST_COLS_SUBSET_REGIOINDELING'])
@@ -193,8 +521,6 @@ def get_data_predict(periods=settings.get_data_predict['LIST_PERIODS'], save_all
         settings.get_data_predict['LIST_STR_STRIP_COLS_REGIOINDELING']].apply(lambda x: x.str.strip())
 
     print("Get 'prognose huishoudens' tables")
-    df_huishouden_prognose = get_and_combine_cbs_tables(dict_tables=settings.get_data_predict['DICT_TABLES_HUISHOUDEN'],
-                                                        url=settings.get_data['CBS_OPEN_URL'])
     df_huishouden_prognose[settings.get_data_predict['PERIOD_COL']] = df_huishouden_prognose['perioden']
     df_huishouden_prognose = df_huishouden_prognose.rename(
         columns=settings.get_data_predict['DICT_COLS_RENAMED_HUISHOUDEN'])
@@ -206,11 +532,11 @@ def get_data_predict(periods=settings.get_data_predict['LIST_PERIODS'], save_all
     df_huishouden_prognose['particulierehuishoudens'] = df_huishouden_prognose['particulierehuishoudens'] * 1000
     df_huishouden_prognose['particulierehuishoudens'] = df_huishouden_prognose[
         'particulierehuishoudens'].round().astype(int)
-    df_huishouden_prognose_pivot = pd.pivot_table(data=df_huishouden_prognose, values='particulierehuishoudens',
-                                                  index=[settings.get_data_predict['REGION_COL'],
-                                                         settings.get_data_predict['PERIOD_COL']],
-                                                  columns=['samenstellingvanhethuishouden'],
-                                                  aggfunc=np.sum).reset_index()
+    df_huishouden_prognose_pivot = pivot_sum_table(df=df_huishouden_prognose,
+                                                   list_index=[settings.get_data_predict['REGION_COL'],
+                                                               settings.get_data_predict['PERIOD_COL']],
+                                                   col_pivot='samenstellingvanhethuishouden',
+                                                   dict_values={'particulierehuishoudens': {}})
     df_huishouden_prognose_pivot = df_huishouden_prognose_pivot[
         df_huishouden_prognose_pivot[settings.get_data_predict['PERIOD_COL']].astype(int) <= roundedto5periods]
     df_huishouden_prognose_pivot = rename_and_subset_cols(df=df_huishouden_prognose_pivot,
@@ -220,8 +546,6 @@ def get_data_predict(periods=settings.get_data_predict['LIST_PERIODS'], save_all
                                                               'LIST_COLS_SUBSET_HUISHOUDING_PIVOT'])
 
     print("Get 'prognose bevolking' tables")
-    df_population_prognose = get_and_combine_cbs_tables(dict_tables=settings.get_data_predict['DICT_TABLES_BEVOLKING'],
-                                                        url=settings.get_data['CBS_OPEN_URL'])
     df_population_prognose = rename_and_subset_cols(df=df_population_prognose,
                                                     dict_rename=settings.get_data_predict[
                                                         'DICT_COLS_RENAMED_BEVOLKING'],
@@ -238,6 +562,10 @@ def get_data_predict(periods=settings.get_data_predict['LIST_PERIODS'], save_all
     df_population_prognose['aantalinwoners'] = df_population_prognose['aantalinwoners'].round().astype(int)
     df_population_prognose = df_population_prognose.drop(['perioden'], axis=1)
 
+    df_fetch_report = pd.DataFrame(list_fetch_report)
+    print(f"Fetch report of the CBS tables (total {df_fetch_report['bytes'].sum()} bytes):")
+    print(df_fetch_report)
+
     # Merge all dataframes
     print("Merge tables")
     df_prognoses = pd.merge(df_regioindeling, df_huishouden_prognose_pivot, how='left',
@@ -253,18 +581,45 @@ def get_data_predict(periods=settings.get_data_predict['LIST_PERIODS'], save_all
 
     # Save logging and DataFrame
     if save_all:
-        datetime_now = datetime.now()
-        filename = settings.get_data_predict['FILENAME_GET_DATA_PREDICT'] + datetime.strftime(datetime_now,
-                                                                                              format='%Y%m%d%H%M')
-        df_log = pd.DataFrame({
-            'timestamp_run': [datetime_now],
-            'filename': [filename],
-            'df_output_shape': [df_prognoses.shape],
-            'df_output_cols': [df_prognoses.columns],
-            'settings': [settings.get_data_predict],
-            'personal_note': [personal_note]})
-        df_log.to_csv(settings.get_data_predict['LOG_PATH'] + filename + '_' + personal_note + '.csv')
-        df_prognoses.to_parquet(settings.DATAPATH + filename + '_' + personal_note + '.parquet.gzip',
-                                compression='gzip')
-
-    return df_prognoses
\ No newline at end of file
+        save_get_data_output(df_prognoses, settings.get_data_predict,
+                             settings.get_data_predict['FILENAME_GET_DATA_PREDICT'], personal_note=personal_note,
+                             df_fetch_report=df_fetch_report)
+    # The output is only stored if all CBS tables could be collected
+    if artifact_key is not None and (df_fetch_report['status'] == 'ok').all():
+        save_artifact(df_prognoses, 'get_data_predict', artifact_key, store_path=settings.artifact_store['STORE_PATH'])
+
+    return df_prognoses
+
+
+def get_data_and_data_predict(periods=settings.get_data_predict['LIST_PERIODS'], predict=True, save_all=False,
+                              personal_note=""):
+    """
+    Custom function to get the historical dataset (get_data) and the future dataset (get_data_predict) at the same
+    time. Both steps share no work, so the total time is determined by the slowest step only.
+
+    Parameters
+    ----------
+    periods : list(int)
+        List with integer year values with years in the future, see get_data_predict
+    predict : bool
+        Boolean value to get the future dataset as well. Default True.
+    save_all : bool
+        Boolean value to save DataFrames and settings
+    personal_note : str
+        String value to add to the filename to make recognition of the saved files easier.
+
+    Returns
+    -------
+    tuple(pd.DataFrame, pd.DataFrame) with the historical dataset and the future dataset (empty DataFrame if predict
+    is False)
+    """
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_get_data = executor.submit(get_data, save_all=save_all, personal_note=personal_note)
+        future_get_data_predict = None
+        if predict:
+            future_get_data_predict = executor.submit(get_data_predict, periods=periods, save_all=save_all,
+                                                      personal_note=personal_note)
+        df_get_data = future_get_data.result()
+        df_get_data_predict = pd.DataFrame() if future_get_data_predict is None else future_get_data_predict.result()
+    return df_get_data, df_get_data_predict
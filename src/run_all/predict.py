@@ -4,12 +4,14 @@ from datetime import datetime
 # Custom functions and settings
 import src.settings as settings
 from src.run_all.preprocess import preprocess_data, preprocess_data_predict
+from src.utilities.artifact_catalog import register_artifact
+from src.utilities.utilities import write_dataset
 
 def predict_data(trained_model,
                  periods=settings.get_data_predict['LIST_PERIODS'],
                  df_get_data=pd.DataFrame(),
                  df_get_data_predict=pd.DataFrame(),
-                 save_all=False, personal_note=""):
+                 save_all=False, personal_note="", pl_preprocess=None):
     """
     Method to predict values in the future with a trained model.
 
@@ -29,6 +31,9 @@ def predict_data(trained_model,
         Boolean value to save DataFrame and settings
     personal_note : str
         String value to add to the filename to make recognition of the saved files easier.
+    pl_preprocess : FusedPipeline or sklearn.pipeline.Pipeline
+        Fitted pipeline of preprocess_data of the training data (saved next to the best model by train_and_fit_models),
+        the data to predict is only transformed with it. Default None (the pipeline is fitted on the data to predict).
 
     Returns
     -------
@@ -40,9 +45,11 @@ def predict_data(trained_model,
     df_preprocessed_predict = preprocess_data_predict(df_get_data=df_get_data,
                                                       df_get_data_predict=df_get_data_predict,
                                                       save_all=save_all, personal_note=personal_note)
-    # Preprocess (general)
-    df_preprocessed = preprocess_data(df=df_preprocessed_predict,
-                                      save_all=save_all, personal_note=personal_note)
+    # Preprocess (general), with the imputer, scaler and columns of the training data if the fitted pipeline is given
+    if pl_preprocess is None:
+        print("No fitted preprocess pipeline given, the pipeline is fitted on the data to predict")
+    df_preprocessed = preprocess_data(df=df_preprocessed_predict, save_all=save_all, personal_note=personal_note,
+                                      pl_preprocess=pl_preprocess)
 
     ## Predict
     # Drop TARGET-values, only necessary in train
@@ -70,7 +77,7 @@ def predict_data(trained_model,
                                'settings': [settings.predict],
                                'personal_note': [personal_note]})
         df_log.to_csv(settings.predict['LOG_PATH'] + filename + '_' + personal_note + '.csv')
-        df_preds.to_parquet(settings.DATAPATH + filename + '_' + personal_note + '.parquet.gzip',
-                                   compression='gzip')
+        filepath = write_dataset(df_preds, settings.DATAPATH + filename + '_' + personal_note)
+        register_artifact(filepath, shape=df_preds.shape, catalog_path=settings.artifact_store['CATALOG_PATH'])
 
     return df_preds
\ No newline at end of file
@@ -1,7 +1,12 @@
 import sys
 sys.path.append('../../')
 
+import os
+import copy
+import shutil
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import numpy as np
 from datetime import datetime
 from sklearn import preprocessing
@@ -10,79 +15,471 @@ from sklearn.impute import SimpleImputer
 
 # Custom functions and settings
 import src.settings as settings
-from src.run_all.get_data import get_data, get_data_predict
-from src.preprocess.preprocess_utils import make_df_missing
+from src.run_all.get_data import get_data, get_data_predict, get_data_and_data_predict
+from src.preprocess.preprocess_utils import make_df_missing, get_incremental_rows, split_dataset_by_groups
+from src.utilities.artifact_store import get_artifact_key, load_artifact, save_artifact
+from src.utilities.artifact_catalog import register_artifact
+from src.utilities.utilities import write_dataset, atomic_filepath
 from src.utilities.transformers import ColumnSelector, GroupInterpolateImputer, RelativeColumnScaler, \
-    CustomScaler, CustomImputer
+    CustomScaler, CustomImputer, FusedPipeline, RelationalImputer
 
 
-def preprocess_data(df, save_all=False, personal_note=""):
+def make_preprocess_steps(df_preprocess, dict_relatively_cols, list_customscaler_cols, list_columnselector_cols_2,
+                          df_missing=None):
     """
-    Method to preprocess the data (select columns, impute, scale).
+    Method to make the (unfitted) transformers of the preprocess pipeline (select columns, impute, scale).
 
     Parameters
     ----------
-    df: pd.DataFrame
-        DataFrame with data from step 'Get Data'
-    save_all: Bool
-        Boolean value to save DataFrame and settings
-    personal_note : str
-        String value to add to the filename to make recognition of the saved files easier.
+    df_preprocess: pd.DataFrame
+        DataFrame with data from step 'Get Data', with the index as columns
+    dict_relatively_cols : dict(str:list(str))
+        Dictionary with the base columns and the columns to scale relatively to them (RelativeColumnScaler)
+    list_customscaler_cols : list(str)
+        List of columns to scale with the scaler (CustomScaler)
+    list_columnselector_cols_2 : list(str)
+        List of columns to keep in the last step (ColumnSelector), None for all columns
+    df_missing : pd.DataFrame
+        DataFrame with the missing values per column (see make_df_missing), i.e. when df_preprocess is only a part of
+        the data. Default None (of df_preprocess)
 
     Returns
     -------
-    pd.DataFrame with preprocessed data.
+    list with the transformers in order of execution
     """
 
-    df_preprocess = df.reset_index().copy()
     # Determine columns with to much missing values
-    df_missing = make_df_missing(df_preprocess)
+    if df_missing is None:
+        df_missing = make_df_missing(df_preprocess)
     list_drop_missing_cols = list(
         df_missing[df_missing['perc_missing'] > settings.preprocess['MISSING_BOUNDARY']].index)
 
-    # Determine columns which are not numeric but objects
-    list_drop_object_cols = list(df_preprocess.loc[:, df_preprocess.dtypes == object].columns)
+    # Determine columns which are not numeric but objects (or categorical)
+    list_drop_object_cols = list(df_preprocess.select_dtypes(include=['object', 'category']).columns)
 
     # Determine list of columns for first ColumnSelector
     drop_cols_total = list(set(list_drop_missing_cols + list_drop_object_cols))
     drop_cols_total = [c for c in drop_cols_total if c not in settings.preprocess['ORIGINAL_INDEX']]
     list_column_selector_1 = [c for c in list(df_preprocess.columns) if c not in drop_cols_total]
 
-    # Make Pipeline and fit transform df_preprocess
-    pl_preprocess = make_pipeline(
+    # The imputer and scaler are copies, so a returned (or saved) pipeline doesn't change when a pipeline is fitted
+    # again.
+    list_steps = [
         ColumnSelector(cols=list_column_selector_1),
         GroupInterpolateImputer(groupcols=settings.preprocess['GROUP_INTERPOLATE_IMPUTER_GROUPCOLS'],
                                 interpolate_method=settings.preprocess['GROUP_INTERPOLATE_IMPUTER_METHOD'],
                                 cols=settings.preprocess['GROUP_INTERPOLATE_IMPUTER_COLS']),
-        CustomImputer(imputer=settings.preprocess['IMPUTER']),
-        RelativeColumnScaler(dict_relatively_cols=settings.preprocess['DICT_RELATIVELY_COLS']),
-        CustomScaler(cols=settings.preprocess['LIST_CUSTOMSCALER_COLS'], scaler=settings.preprocess['SCALER']),
-        ColumnSelector(cols=settings.preprocess['LIST_COLUMNSELECTOR_COLS_2']))
+        CustomImputer(imputer=copy.deepcopy(settings.preprocess['IMPUTER'])),
+        # A copy, because fitting subsets the dictionary to the available columns (and settings should stay the same)
+        RelativeColumnScaler(dict_relatively_cols=copy.deepcopy(dict_relatively_cols)),
+        CustomScaler(cols=list_customscaler_cols, scaler=copy.deepcopy(settings.preprocess['SCALER'])),
+        ColumnSelector(cols=list_columnselector_cols_2)]
+    return list_steps
+
+
+def save_preprocess_output(df_input, df_preprocessed, dict_settings, pipeline, personal_note="", datetime_now=None,
+                           dict_log=None):
+    """
+    Method to save the logging and the DataFrame of a preprocess step and to add the DataFrame to the catalog of
+    artifacts.
+
+    Parameters
+    ----------
+    df_input : pd.DataFrame
+        DataFrame with the input of the step
+    df_preprocessed : pd.DataFrame
+        DataFrame with the preprocessed data
+    dict_settings : dict
+        Settings of the step (settings.preprocess or settings.preprocess_predict), with 'FILENAME' and 'LOG_PATH'
+    pipeline : list or str
+        Steps of the pipeline, for the logging
+    personal_note : str
+        String value to add to the filename to make recognition of the saved files easier.
+    datetime_now : datetime
+        Timestamp of the run. Default None (now)
+    dict_log : dict
+        Dictionary with extra columns of the logging. Default None
+
+    Returns
+    -------
+    str with the filepath of the saved DataFrame
+    """
+
+    datetime_now = datetime.now() if datetime_now is None else datetime_now
+    filename = dict_settings['FILENAME'] + datetime.strftime(datetime_now, format='%Y%m%d%H%M')
+    df_log = pd.DataFrame({'timestamp_run': [datetime_now],
+                           'filename': [filename],
+                           'df_input_shape': [df_input.shape],
+                           'df_input_cols': [list(df_input.columns)],
+                           'df_output_shape': [df_preprocessed.shape],
+                           'df_output_cols': [list(df_preprocessed.columns)],
+                           'settings': [dict_settings],
+                           'pipeline': [pipeline],
+                           **{col: [value] for col, value in (dict_log or {}).items()},
+                           'personal_note': [personal_note]})
+    df_log.to_csv(dict_settings['LOG_PATH'] + filename + '_' + personal_note + '.csv')
+    filepath = write_dataset(df_preprocessed, settings.DATAPATH + filename + '_' + personal_note)
+    register_artifact(filepath, shape=df_preprocessed.shape, catalog_path=settings.artifact_store['CATALOG_PATH'])
+    return filepath
+
+
+def preprocess_data(df, save_all=False, personal_note="", pl_preprocess=None, return_pipeline=False):
+    """
+    Method to preprocess the data (select columns, impute, scale). The pipeline is fitted on df, or a fitted pipeline
+    (i.e. of the training data, see train_and_fit_models) only transforms df.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        DataFrame with data from step 'Get Data'
+    save_all: Bool
+        Boolean value to save DataFrame and settings
+    personal_note : str
+        String value to add to the filename to make recognition of the saved files easier.
+    pl_preprocess : FusedPipeline or sklearn.pipeline.Pipeline
+        Fitted pipeline of preprocess_data to transform df with, nothing is fitted again. Default None (the pipeline is
+        fitted on df).
+    return_pipeline : bool
+        Boolean value to return the fitted pipeline as well. Default False
+
+    Returns
+    -------
+    pd.DataFrame with preprocessed data (and the fitted pipeline if return_pipeline is True).
+    """
+
+    # Only fitting is stored, transforming with a fitted pipeline is not (and its fitted values are not in its hash).
+    # The preprocessed data and the fitted pipeline are stored, and saved like a fitted one.
+    artifact_key = None
+    if settings.artifact_store['USE_ARTIFACT_STORE'] and pl_preprocess is None:
+        artifact_key = get_artifact_key('preprocess', [df, settings.preprocess])
+        artifact = load_artifact('preprocess', artifact_key, store_path=settings.artifact_store['STORE_PATH'])
+        if artifact is not None:
+            df_preprocessed, pl_preprocess = artifact
+            if save_all:
+                save_preprocess_output(df, df_preprocessed, settings.preprocess, pl_preprocess.steps,
+                                       personal_note=personal_note)
+            return (df_preprocessed, pl_preprocess) if return_pipeline else df_preprocessed
 
-    df_preprocessed = pl_preprocess.fit_transform(df_preprocess)
+    df_preprocess = df.reset_index().copy()
+    if pl_preprocess is None:
+        list_steps = make_preprocess_steps(df_preprocess, settings.preprocess['DICT_RELATIVELY_COLS'],
+                                           settings.preprocess['LIST_CUSTOMSCALER_COLS'],
+                                           settings.preprocess['LIST_COLUMNSELECTOR_COLS_2'])
+        # Make Pipeline and fit transform df_preprocess
+        if settings.preprocess['FUSED_PIPELINE']:
+            pl_preprocess = FusedPipeline(steps=list_steps, dtype=settings.preprocess['FUSED_DTYPE'])
+        else:
+            pl_preprocess = make_pipeline(*list_steps)
+
+        df_preprocessed = pl_preprocess.fit_transform(df_preprocess)
+    else:
+        print("Transform with the fitted preprocess pipeline (the imputer, scaler and columns are not fitted again)")
+        df_preprocessed = pl_preprocess.transform(df_preprocess)
     df_preprocessed = df_preprocessed.set_index(settings.preprocess['ORIGINAL_INDEX'])
     # NOTE: Possible features based on represented columns should be inserted below (or as a step in the pipeline)
 
     # Save logging and DataFrame
     if save_all:
-        datetime_now = datetime.now()
-        filename = settings.preprocess['FILENAME'] + datetime.strftime(datetime_now, format='%Y%m%d%H%M')
-        df_log = pd.DataFrame({'timestamp_run': [datetime_now],
-                               'filename': [filename],
-                               'df_input_shape': [df.shape],
-                               'df_input_cols': [list(df.columns)],
-                               'df_output_shape': [df_preprocessed.shape],
-                               'df_output_cols': [list(df_preprocessed.columns)],
-                               'settings': [settings.preprocess],
-                               'pipeline': [pl_preprocess.steps],
-                               'personal_note': [personal_note]})
-        df_log.to_csv(settings.preprocess['LOG_PATH'] + filename + '_' + personal_note + '.csv')
-        df_preprocessed.to_parquet(settings.DATAPATH + filename + '_' + personal_note + '.parquet.gzip',
-                                   compression='gzip')
+        save_preprocess_output(df, df_preprocessed, settings.preprocess, pl_preprocess.steps,
+                               personal_note=personal_note)
+    if artifact_key is not None:
+        save_artifact((df_preprocessed, pl_preprocess), 'preprocess', artifact_key,
+                      store_path=settings.artifact_store['STORE_PATH'])
+
+    return (df_preprocessed, pl_preprocess) if return_pipeline else df_preprocessed
+
+
+def preprocess_data_incremental(df, df_preprocessed_previous, pl_preprocess, save_all=False, personal_note=""):
+    """
+    Method to preprocess the data incrementally with a fitted pipeline of preprocess_data, i.e. when a new period is
+    published. Only the new rows and the previous rows whose interpolation changes (see get_incremental_rows) are
+    transformed, the other rows are taken from the previous preprocessed data. The previous rows of df are assumed to
+    be unchanged.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        DataFrame with data from step 'Get Data', with the previous and the new rows
+    df_preprocessed_previous: pd.DataFrame
+        DataFrame with the previous output of preprocess_data (or preprocess_data_incremental) with pl_preprocess
+    pl_preprocess : FusedPipeline or sklearn.pipeline.Pipeline
+        Fitted pipeline of preprocess_data (see return_pipeline), nothing is fitted again
+    save_all: Bool
+        Boolean value to save DataFrame and settings
+    personal_note : str
+        String value to add to the filename to make recognition of the saved files easier.
+
+    Returns
+    -------
+    pd.DataFrame with preprocessed data.
+    """
+
+    # The steps of a FusedPipeline are the transformers, of a sklearn Pipeline tuples of (name, transformer)
+    list_steps = [step[1] if isinstance(step, tuple) else step for step in pl_preprocess.steps]
+    list_gii = [step for step in list_steps if isinstance(step, GroupInterpolateImputer)]
+    if len(list_gii) > 0:
+        groupcols = list_gii[0].groupcols
+        cols = [c for c in list_gii[0].cols if c in df.columns and c not in groupcols]
+        is_transform, is_output = get_incremental_rows(df, df_preprocessed_previous.index, groupcols, cols,
+                                                       interpolate_method=list_gii[0].interpolate_method)
+    else:
+        is_transform = is_output = ~df.index.isin(df_preprocessed_previous.index)
+    print(f"Preprocess {is_output.sum()} of {len(df)} rows again ({(~is_output).sum()} rows are unchanged)")
+
+    # The positions in df are kept as index, so the interpolation ('nearest') uses the same positions as df
+    df_preprocess = df.reset_index()
+    df_preprocessed_new = pl_preprocess.transform(df_preprocess[is_transform])
+    df_preprocessed_new = df_preprocessed_new[is_output[is_transform]].set_index(
+        settings.preprocess['ORIGINAL_INDEX'])
+    df_preprocessed = pd.concat([df_preprocessed_previous.reindex(df.index[~is_output]),
+                                 df_preprocessed_new]).reindex(df.index)
+
+    # Save logging and DataFrame
+    if save_all:
+        save_preprocess_output(df, df_preprocessed, settings.preprocess, pl_preprocess.steps,
+                               personal_note=personal_note, dict_log={'n_rows_preprocessed': is_output.sum()})
 
     return df_preprocessed
 
 
+def save_feature_sets_output(df, dict_df_preprocessed, dict_feature_sets, list_pipeline, personal_note=""):
+    """
+    Method to save the logging and the DataFrames of preprocess_data_feature_sets, with the name of the feature set
+    added to the personal note.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame with data from step 'Get Data'
+    dict_df_preprocessed : dict(str: pd.DataFrame)
+        Dictionary with the preprocessed data per feature set
+    dict_feature_sets : dict(str: list)
+        Dictionary with the settings per feature set (see preprocess_data_feature_sets)
+    list_pipeline : list
+        Steps of the pipeline, for the logging
+    personal_note : str
+        String value to add to the filename to make recognition of the saved files easier.
+
+    Returns
+    -------
+    None
+    """
+
+    # All feature sets get the same timestamp
+    datetime_now = datetime.now()
+    for name, df_preprocessed in dict_df_preprocessed.items():
+        save_preprocess_output(df, df_preprocessed, settings.preprocess, list_pipeline,
+                               personal_note=personal_note + '_' + name if personal_note else name,
+                               datetime_now=datetime_now, dict_log={'feature_set': dict_feature_sets[name]})
+
+
+def preprocess_data_feature_sets(df, dict_feature_sets, save_all=False, personal_note=""):
+    """
+    Method to preprocess the data for several feature sets (i.e. of mapper_cols) at once. The columns are selected,
+    interpolated, imputed and scaled relatively once for all feature sets (with all relatively scaled columns), and the
+    union of the columns to scale is scaled once. Each feature set is a selection of the scaled or unscaled columns, the
+    same as preprocess_data with the settings of the feature set (the scaler scales each column separately, like the
+    MinMaxScaler).
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        DataFrame with data from step 'Get Data'
+    dict_feature_sets: dict(str: list)
+        Dictionary with the name of the feature set as key and as value a list with the settings of the feature set:
+        DICT_RELATIVELY_COLS, LIST_CUSTOMSCALER_COLS and LIST_COLUMNSELECTOR_COLS_2 (see settings.preprocess)
+    save_all: Bool
+        Boolean value to save DataFrames and settings (the name of the feature set is added to the personal note)
+    personal_note : str
+        String value to add to the filename to make recognition of the saved files easier.
+
+    Returns
+    -------
+    dict(str: pd.DataFrame) with the preprocessed data per feature set.
+    """
+
+    artifact_key = None
+    if settings.artifact_store['USE_ARTIFACT_STORE']:
+        artifact_key = get_artifact_key('preprocess_feature_sets', [df, settings.preprocess, dict_feature_sets])
+        artifact = load_artifact('preprocess_feature_sets', artifact_key,
+                                 store_path=settings.artifact_store['STORE_PATH'])
+        if artifact is not None:
+            # The stored preprocessed data is saved like a fitted one
+            dict_df_preprocessed, list_pipeline = artifact
+            if save_all:
+                save_feature_sets_output(df, dict_df_preprocessed, dict_feature_sets, list_pipeline,
+                                         personal_note=personal_note)
+            return dict_df_preprocessed
+
+    # Combine the relatively scaled columns and the columns to scale of all feature sets, a column can only be scaled
+    # relatively to one base column
+    dict_relatively_cols_all = {}
+    dict_base_cols = {}
+    list_customscaler_cols_all = []
+    for name, (dict_relatively_cols, list_customscaler_cols, _) in dict_feature_sets.items():
+        for base_col, relatively_cols in dict_relatively_cols.items():
+            for col in relatively_cols:
+                if dict_base_cols.setdefault(col, base_col) != base_col:
+                    raise ValueError(f"Column {col} of feature set {name} is scaled relatively to {base_col} and to "
+                                     f"{dict_base_cols[col]} in another feature set")
+                if col not in dict_relatively_cols_all.setdefault(base_col, []):
+                    dict_relatively_cols_all[base_col].append(col)
+        list_customscaler_cols_all += [c for c in list_customscaler_cols if c not in list_customscaler_cols_all]
+
+    # Make Pipeline without the CustomScaler and the last ColumnSelector and fit transform df_preprocess once
+    df_preprocess = df.reset_index().copy()
+    list_steps = make_preprocess_steps(df_preprocess, dict_relatively_cols_all, list_customscaler_cols_all, None)
+    if settings.preprocess['FUSED_PIPELINE']:
+        pl_preprocess = FusedPipeline(steps=list_steps[:-2], dtype=settings.preprocess['FUSED_DTYPE'])
+    else:
+        pl_preprocess = make_pipeline(*list_steps[:-2])
+    df_unscaled = pl_preprocess.fit_transform(df_preprocess)
+    custom_scaler = list_steps[-2].fit(df_unscaled)
+    df_scaled = custom_scaler.transform(df_unscaled)
+
+    dict_df_preprocessed = {}
+    for name, (dict_relatively_cols, list_customscaler_cols, list_columnselector_cols_2) in dict_feature_sets.items():
+        # The columns of preprocess_data with the settings of the feature set (before the last ColumnSelector)
+        list_relatively_cols = ['relative_' + str(col) for base_col, relatively_cols in dict_relatively_cols.items()
+                                if base_col in df_unscaled.columns for col in relatively_cols
+                                if col in df_unscaled.columns]
+        list_cols = list_columnselector_cols_2 if list_columnselector_cols_2 is not None else \
+            list_steps[0].cols + list_relatively_cols
+        try:
+            df_preprocessed = pd.concat([df_scaled[col] if col in list_customscaler_cols else df_unscaled[col]
+                                         for col in list_cols], axis=1)
+        except KeyError:
+            cols_error = list(set(list_cols) - set(df_unscaled.columns))
+            raise KeyError("The DataFrame does not include the columns: %s" % cols_error)
+        dict_df_preprocessed[name] = df_preprocessed.set_index(settings.preprocess['ORIGINAL_INDEX'])
+        print(f"The shape of the dataframe of feature set {name}: {dict_df_preprocessed[name].shape}")
+
+    # Save logging and DataFrames
+    list_pipeline = pl_preprocess.steps + [custom_scaler]
+    if save_all:
+        save_feature_sets_output(df, dict_df_preprocessed, dict_feature_sets, list_pipeline,
+                                 personal_note=personal_note)
+    if artifact_key is not None:
+        save_artifact((dict_df_preprocessed, list_pipeline), 'preprocess_feature_sets', artifact_key,
+                      store_path=settings.artifact_store['STORE_PATH'])
+
+    return dict_df_preprocessed
+
+
+def preprocess_data_out_of_core(filepath, personal_note="",
+                                n_partitions=settings.preprocess['N_PARTITIONS_OUT_OF_CORE'], return_pipeline=False):
+    """
+    Method to preprocess a saved dataset of step 'Get Data' that doesn't fit in memory (i.e. of the region levels
+    'wijk' and 'buurt'), partition by partition. The dataset is split in partitions of regions (see
+    split_dataset_by_groups), so the interpolation of a region is in one partition. The imputer and the scaler are
+    fitted on the statistics of all partitions (one pass over the partitions per step) and in the last pass every
+    partition is transformed and saved. Only one partition at once is in memory.
+
+    The steps run in a FusedPipeline, the imputer should impute with the mean (or a constant) and the scaler should
+    have a partial_fit method (i.e. MinMaxScaler). The preprocessed data is saved as a partitioned dataset (see
+    read_dataset), with the rows ordered by partition.
+
+    Parameters
+    ----------
+    filepath : str
+        Filepath of the dataset from step 'Get Data' (a parquet file or the folder of a partitioned dataset)
+    personal_note : str
+        String value to add to the filename to make recognition of the saved files easier.
+    n_partitions : int
+        Number of partitions, more partitions use less memory. Default settings.preprocess['N_PARTITIONS_OUT_OF_CORE']
+    return_pipeline : bool
+        Boolean value to return the fitted pipeline as well. Default False
+
+    Returns
+    -------
+    str with the filepath of the preprocessed dataset (and the fitted pipeline if return_pipeline is True).
+    """
+
+    datetime_now = datetime.now()
+    filename = settings.preprocess['FILENAME'] + datetime.strftime(datetime_now, format='%Y%m%d%H%M')
+    filepath_output = settings.DATAPATH + filename + '_' + personal_note + \
+        ('.parquet.gzip' if settings.storage['COMPRESSION'] == 'gzip' else '.parquet')
+    path_split = filepath_output + '.split'
+    try:
+        list_files_split, df_missing, df_schema = split_dataset_by_groups(
+            filepath, path_split, settings.preprocess['GROUP_INTERPOLATE_IMPUTER_GROUPCOLS'], n_partitions,
+            batch_size=settings.storage['ROW_GROUP_SIZE'])
+        print(f"The dataset is split in {len(list_files_split)} partitions of regions")
+        if len(list_files_split) == 0:
+            raise ValueError(f"The dataset {filepath} has no rows to preprocess")
+
+        def read_partition(file):
+            # The position in the dataset is the index, the same as of df.reset_index() in preprocess_data
+            return pq.read_table(file).to_pandas().reset_index().set_index('__position__').rename_axis(None)
+
+        list_steps = make_preprocess_steps(df_schema.reset_index(), settings.preprocess['DICT_RELATIVELY_COLS'],
+                                           settings.preprocess['LIST_CUSTOMSCALER_COLS'],
+                                           settings.preprocess['LIST_COLUMNSELECTOR_COLS_2'], df_missing=df_missing)
+        pl_preprocess = FusedPipeline(steps=list_steps, dtype=settings.preprocess['FUSED_DTYPE'])
+        pl_preprocess.fit_layout(df_schema.reset_index())
+
+        # Fit the imputer and the scaler in order, on the output of the (fitted) steps before them
+        for position_step, step in enumerate(list_steps):
+            if isinstance(step, CustomImputer):
+                if getattr(step.imputer, 'strategy', None) not in ['mean', 'constant']:
+                    raise ValueError(f"The imputer {step.imputer} can't be fitted out of core, only SimpleImputer "
+                                     f"with strategy 'mean' or 'constant'")
+            elif isinstance(step, CustomScaler):
+                if not hasattr(step.scaler, 'partial_fit'):
+                    raise ValueError(f"The scaler {step.scaler} can't be fitted out of core, it has no partial_fit")
+            else:
+                continue
+            print(f"Fit {type(step).__name__} on all partitions")
+            pl_fitted = FusedPipeline(steps=list_steps[:position_step],
+                                      dtype=settings.preprocess['FUSED_DTYPE']).fit_layout(df_schema.reset_index())
+            array_sum = np.zeros(len(step.cols))
+            array_count = np.zeros(len(step.cols))
+            for file in list_files_split:
+                array_values = pl_fitted.transform(read_partition(file))[step.cols].to_numpy(
+                    dtype=settings.preprocess['FUSED_DTYPE'], na_value=np.nan)
+                if isinstance(step, CustomImputer):
+                    array_sum += np.nansum(array_values, axis=0)
+                    array_count += (~np.isnan(array_values)).sum(axis=0)
+                else:
+                    step.scaler.partial_fit(array_values)
+            if isinstance(step, CustomImputer):
+                # The mean of all partitions, the imputer is fitted on one row with the means
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    step.imputer.fit((array_sum / array_count)[None, :])
+
+        # Transform and save every partition (to a temporary folder first, like write_dataset)
+        shape = (0, 0)
+        with atomic_filepath(filepath_output) as filepath_output_tmp:
+            for partition, file in enumerate(list_files_split):
+                df_preprocessed = pl_preprocess.transform(read_partition(file))
+                df_preprocessed = df_preprocessed.set_index(settings.preprocess['ORIGINAL_INDEX'])
+                filepath_partition = os.path.join(filepath_output_tmp, f"partition={partition}", 'part-0.parquet')
+                os.makedirs(os.path.dirname(filepath_partition), exist_ok=True)
+                pq.write_table(pa.Table.from_pandas(df_preprocessed, preserve_index=True), filepath_partition,
+                               compression=settings.storage['COMPRESSION'],
+                               compression_level=settings.storage['COMPRESSION_LEVEL'],
+                               row_group_size=settings.storage['ROW_GROUP_SIZE'], write_statistics=True)
+                shape = (shape[0] + len(df_preprocessed), df_preprocessed.shape[1])
+    finally:
+        shutil.rmtree(path_split, ignore_errors=True)
+    print(f"The shape of the preprocessed dataset: {shape}")
+
+    # Save logging
+    df_log = pd.DataFrame({'timestamp_run': [datetime_now],
+                           'filename': [filename],
+                           'df_input_shape': [(shape[0], len(df_schema.columns))],
+                           'df_input_cols': [list(df_schema.columns)],
+                           'df_output_shape': [shape],
+                           'df_output_cols': [list(df_preprocessed.columns)],
+                           'settings': [settings.preprocess],
+                           'pipeline': [pl_preprocess.steps],
+                           'personal_note': [personal_note]})
+    df_log.to_csv(settings.preprocess['LOG_PATH'] + filename + '_' + personal_note + '.csv')
+    register_artifact(filepath_output, shape=shape, catalog_path=settings.artifact_store['CATALOG_PATH'])
+
+    return (filepath_output, pl_preprocess) if return_pipeline else filepath_output
+
+
 def preprocess_data_predict(df_get_data=pd.DataFrame(),
                             df_get_data_predict=pd.DataFrame(),
                             save_all=False, personal_note=""):
@@ -106,10 +503,24 @@ def preprocess_data_predict(df_get_data=pd.DataFrame(),
     """
     ## Merge dataframes
     # Get data (if DataFrame is empty)
+    if df_get_data.empty and df_get_data_predict.empty:
+        df_get_data, df_get_data_predict = get_data_and_data_predict(save_all=save_all, personal_note="empty_df")
     if df_get_data.empty:
         df_get_data = get_data(save_all=save_all, personal_note="empty_df")
     if df_get_data_predict.empty:
         df_get_data_predict = get_data_predict(save_all=save_all, personal_note="empty_df")
+    artifact_key = None
+    if settings.artifact_store['USE_ARTIFACT_STORE']:
+        artifact_key = get_artifact_key('preprocess_predict',
+                                        [df_get_data, df_get_data_predict, settings.preprocess_predict])
+        df_artifact = load_artifact('preprocess_predict', artifact_key,
+                                    store_path=settings.artifact_store['STORE_PATH'])
+        if df_artifact is not None:
+            # The stored preprocessed data is saved like a preprocessed one (the input is logged without merging)
+            if save_all:
+                save_preprocess_output(pd.concat([df_get_data, df_get_data_predict]), df_artifact,
+                                       settings.preprocess_predict, "does not apply", personal_note=personal_note)
+            return df_artifact
     # Reset index
     df_get_data = df_get_data.reset_index().copy()
     df_get_data_predict = df_get_data_predict.reset_index().copy()
@@ -134,7 +545,7 @@ def preprocess_data_predict(df_get_data=pd.DataFrame(),
     # Determine columns for each imputing strategy
     list_cols_prognoses = df_get_data_predict.columns
     list_all_columns = list(df_get_data_merged.columns)
-    list_cols_str = list(df_get_data_merged.loc[:, df_get_data_merged.dtypes == object].columns)
+    list_cols_str = list(df_get_data_merged.select_dtypes(include=['object', 'category']).columns)
     list_cols_str = list(set(list_cols_str) - set(list_cols_prognoses))
     list_cols_trained_model = settings.preprocess_predict['LIST_COLS_TRAINED_MODEL']
     list_cols_trained_model = list(set([x.replace('relative_', '') for x in list_cols_trained_model]))
@@ -159,46 +570,26 @@ def preprocess_data_predict(df_get_data=pd.DataFrame(),
 
     # Relational imputer for other columns in trained model
     print("Strategy 3: Impute values based on relation with other columns (from historic data)")
-    df_preprocessed_predict = df_get_data_merged.copy()
-    all_relate_cols_necessary = settings.preprocess_predict[
-                                    'LIST_COLS_GROUPER_RELATE_IMPUTER'] + list_cols_relate_imputer + [
-                                    settings.preprocess_predict['BASE_COL_RELATE_IMPUTER']]
-    df_base_year = \
-    df_preprocessed_predict[df_preprocessed_predict[settings.preprocess_predict['PERIOD_COL']] == '2019'][
-        all_relate_cols_necessary]
-    df_base_year.loc[:, list_cols_relate_imputer] = df_base_year.loc[:, list_cols_relate_imputer].div(
-        df_base_year[settings.preprocess_predict['BASE_COL_RELATE_IMPUTER']], axis=0)
-    df_base_year = df_base_year[df_base_year[settings.preprocess_predict['REGION_COL']].isin(
-        df_preprocessed_predict[df_preprocessed_predict[settings.preprocess_predict['PERIOD_COL']] == total_periods_str[
-            -1]].codering_regio.unique())]
-    df_preprocessed_predict = df_preprocessed_predict.set_index(settings.preprocess_predict['REGION_COL'])
-    for col in list_cols_relate_imputer:
-        df_preprocessed_predict.loc[:, col] = df_preprocessed_predict.loc[:,
-                                              settings.preprocess_predict['BASE_COL_RELATE_IMPUTER']]
-        df_preprocessed_predict.loc[:, col] = df_preprocessed_predict.loc[:, col] * \
-                                              df_base_year.set_index(settings.preprocess_predict['REGION_COL'])[col]
+    RI = RelationalImputer(groupcol=settings.preprocess_predict['REGION_COL'],
+                           periodcol=settings.preprocess_predict['PERIOD_COL'],
+                           basecol=settings.preprocess_predict['BASE_COL_RELATE_IMPUTER'],
+                           cols=list_cols_relate_imputer,
+                           base_period=settings.preprocess_predict['BASE_PERIOD_RELATE_IMPUTER'])
+    df_preprocessed_predict = RI.fit_transform(df_get_data_merged)
+    print(f"Relations of period {RI.base_period_} are used")
     df_preprocessed_predict = df_preprocessed_predict[
-        df_preprocessed_predict[settings.preprocess_predict['PERIOD_COL']].isin(total_periods_str)].reset_index()
+        df_preprocessed_predict[settings.preprocess_predict['PERIOD_COL']].isin(total_periods_str)]
     df_preprocessed_predict = df_preprocessed_predict.set_index(
         [settings.preprocess_predict['REGION_COL'], settings.preprocess_predict['PERIOD_COL']])
     print(f"Shape of df_preprocessed_predict = {df_preprocessed_predict.shape}")
 
     # Save logging and DataFrame
     if save_all:
-        datetime_now = datetime.now()
-        filename = settings.preprocess_predict['FILENAME'] + datetime.strftime(datetime_now, format='%Y%m%d%H%M')
-        df_log = pd.DataFrame({'timestamp_run': [datetime_now],
-                               'filename': [filename],
-                               'df_input_shape': [df_get_data_merged.shape],
-                               'df_input_cols': [list(df_get_data_merged.columns)],
-                               'df_output_shape': [df_preprocessed_predict.shape],
-                               'df_output_cols': [list(df_preprocessed_predict.columns)],
-                               'settings': [settings.preprocess_predict],
-                               'pipeline': ["does not apply"],
-                               'personal_note': [personal_note]})
-        df_log.to_csv(settings.preprocess_predict['LOG_PATH'] + filename + '_' + personal_note + '.csv')
-        df_preprocessed_predict.to_parquet(settings.DATAPATH + filename + '_' + personal_note + '.parquet.gzip',
-                                   compression='gzip')
+        save_preprocess_output(df_get_data_merged, df_preprocessed_predict, settings.preprocess_predict,
+                               "does not apply", personal_note=personal_note)
+    if artifact_key is not None:
+        save_artifact(df_preprocessed_predict, 'preprocess_predict', artifact_key,
+                      store_path=settings.artifact_store['STORE_PATH'])
 
     return df_preprocessed_predict
 
@@ -12,11 +12,14 @@ from xgboost import XGBRegressor
 
 # Custom functions
 import src.settings as settings
+from src.utilities.artifact_store import get_artifact_key, load_artifact, save_artifact
+from src.utilities.artifact_catalog import register_artifact
 from src.train.train_utils import drop_nan_from_specific_columns, split_clf_and_params, \
     rmse_from_neg_mean_squared_error, rmse_from_gridsearch_best_estimator
 
 
-def train_and_fit_models(df_preprocessed, filename_input, param_grid=[], save_all=False, personal_note=""):
+def train_and_fit_models(df_preprocessed, filename_input, param_grid=[], save_all=False, personal_note="",
+                         pl_preprocess=None):
     """
     Method to train model(s) on a preprocessed dataset and return the gridsearch object.
 
@@ -30,12 +33,23 @@ def train_and_fit_models(df_preprocessed, filename_input, param_grid=[], save_al
         Boolean value to save DataFrame and settings
     personal_note : str
         String value to add to the filename to make recognition of the saved files easier.
+    pl_preprocess : FusedPipeline or sklearn.pipeline.Pipeline
+        Fitted pipeline of preprocess_data (see return_pipeline), saved next to the best model so predict_data only
+        transforms with it. Default None (not saved).
 
     Returns
     -------
     Complete gridsearch object, where `gridsearchobject.best_estimator_` will give the best model.
     """
 
+    # A stored gridsearch object is not fitted again, but it is saved (and logged) like a fitted one
+    artifact_key = None
+    grid_search_total = None
+    if settings.artifact_store['USE_ARTIFACT_STORE']:
+        artifact_key = get_artifact_key('train', [df_preprocessed, settings.Y_TARGET_COLS, settings.train, param_grid])
+        grid_search_total = load_artifact('train', artifact_key, store_path=settings.artifact_store['STORE_PATH'])
+    is_stored = grid_search_total is not None
+
     # Delete rows where target value is NaN
     df = df_preprocessed.copy()
     df = drop_nan_from_specific_columns(df, settings.train['Y_VALUE'])
@@ -46,37 +60,38 @@ def train_and_fit_models(df_preprocessed, filename_input, param_grid=[], save_al
     # Split X and y into train and test dataset
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=settings.train['TEST_SIZE'], random_state=settings.train['RANDOM_STATE'])
 
-    # Construct basic pipeline for gridsearch
-    pl_gs_total = Pipeline([('clf', LinearRegression())])  # Placeholder Estimator
+    if not is_stored:
+        # Construct basic pipeline for gridsearch
+        pl_gs_total = Pipeline([('clf', LinearRegression())])  # Placeholder Estimator
 
-    # Make/use param_grid for all classifiers and hyper parameters
-    if len(param_grid) == 0:
-        param_grid_total = [{'clf': [LinearRegression()],
-                             'clf__normalize': settings.train['GRIDSEARCH_NORMALIZE'], },
+        # Make/use param_grid for all classifiers and hyper parameters
+        if len(param_grid) == 0:
+            param_grid_total = [{'clf': [LinearRegression()],
+                                 'clf__normalize': settings.train['GRIDSEARCH_NORMALIZE'], },
 
-                            {'clf': [Ridge()],
-                             'clf__alpha': settings.train['GRIDSEARCH_ALPHA']},
+                                {'clf': [Ridge()],
+                                 'clf__alpha': settings.train['GRIDSEARCH_ALPHA']},
 
-                            {'clf': [Lasso()],
-                             'clf__alpha': settings.train['GRIDSEARCH_ALPHA']},
+                                {'clf': [Lasso()],
+                                 'clf__alpha': settings.train['GRIDSEARCH_ALPHA']},
 
-                            {'clf': [KNeighborsRegressor()],
-                             'clf__n_neighbors': settings.train['GRIDSEARCH_NEIGHBORS']},
+                                {'clf': [KNeighborsRegressor()],
+                                 'clf__n_neighbors': settings.train['GRIDSEARCH_NEIGHBORS']},
 
-                            {'clf': [XGBRegressor()],
-                             'clf__gamma': settings.train['GRIDSEARCH_GAMMA'],
-                             'clf__n_estimators': settings.train['GRIDSEARCH_N_ESTIMATORS']},
-                            ]
-    else:
-        param_grid_total = param_grid
+                                {'clf': [XGBRegressor()],
+                                 'clf__gamma': settings.train['GRIDSEARCH_GAMMA'],
+                                 'clf__n_estimators': settings.train['GRIDSEARCH_N_ESTIMATORS']},
+                                ]
+        else:
+            param_grid_total = param_grid
 
-    # Initiate gridsearch object
-    grid_search_total = GridSearchCV(pl_gs_total, param_grid_total, cv=settings.train['CROSS_VALIDATE'],
-                                     scoring=settings.train['MODEL_SCORING'],
-                                     return_train_score=True)
+        # Initiate gridsearch object
+        grid_search_total = GridSearchCV(pl_gs_total, param_grid_total, cv=settings.train['CROSS_VALIDATE'],
+                                         scoring=settings.train['MODEL_SCORING'],
+                                         return_train_score=True)
 
-    # Fit gridsearch object on to the data
-    grid_search_total.fit(X_train, y_train)
+        # Fit gridsearch object on to the data
+        grid_search_total.fit(X_train, y_train)
     # Get the best estimator (based on best train score)
     print(f"The model with the best train score is:\n{grid_search_total.best_estimator_['clf']}")
     # Calculate the RMSE for best estimator
@@ -89,7 +104,17 @@ def train_and_fit_models(df_preprocessed, filename_input, param_grid=[], save_al
         # Save the best estimator of the gridsearch in a Pickle file
         suffix_datetime = datetime.strftime(datetime.now(), format='%Y%m%d%H%M')
         filename_output = f'best_model_{suffix_datetime}_{personal_note}'
-        pickle.dump(grid_search_total.best_estimator_, open(f'{settings.DATAPATH}{filename_output}.pickle', 'wb'))
+        with open(f'{settings.DATAPATH}{filename_output}.pickle', 'wb') as file:
+            pickle.dump(grid_search_total.best_estimator_, file)
+        register_artifact(f'{settings.DATAPATH}{filename_output}.pickle',
+                          catalog_path=settings.artifact_store['CATALOG_PATH'])
+        if pl_preprocess is not None:
+            # Same timestamp and note as the best model, so the model and its preprocessing are found together
+            filename_pipeline = f'pl_preprocess_{suffix_datetime}_{personal_note}'
+            with open(f'{settings.DATAPATH}{filename_pipeline}.pickle', 'wb') as file:
+                pickle.dump(pl_preprocess, file)
+            register_artifact(f'{settings.DATAPATH}{filename_pipeline}.pickle',
+                              catalog_path=settings.artifact_store['CATALOG_PATH'])
 
         # Save log of train step
         df_log = pd.DataFrame({"Model": [split_clf_and_params(grid_search_total.best_estimator_['clf'])[0]],
@@ -104,5 +129,7 @@ def train_and_fit_models(df_preprocessed, filename_input, param_grid=[], save_al
                               })
         df_log.to_csv(settings.train['LOG_PATH'] + filename_output + '.csv', index=False,
                                      header=True)
+    if artifact_key is not None and not is_stored:
+        save_artifact(grid_search_total, 'train', artifact_key, store_path=settings.artifact_store['STORE_PATH'])
 
     return grid_search_total
\ No newline at end of file
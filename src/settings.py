@@ -14,6 +14,49 @@ Y_TARGET_COLS = ['wmoclienten', 'wmoclientenper1000inwoners']
 A short description of the settings for get data are listed below:
 CBS_OPEN_URL : str
     URL of the CBS Statline database
+CBS_MAX_WORKERS : int
+    Maximum number of tables of one dictionary with tables that are downloaded at the same time, and maximum number of
+    requests to the CBS database at the same time over all tables and steps (at most CBS_POOL_SIZE). Default: 8
+CBS_CACHE_PATH : str
+    Path of the local cache with the raw CBS tables (None to disable the cache). Default: '../../data/cache_cbs/'
+CBS_CACHE_POLICY : str
+    Policy of the cache with raw CBS tables:
+    * 'refresh': always download the tables and update the cache
+    * 'check': only download the tables that are modified in the CBS database since they were cached (default)
+    * 'cache': use the cached tables without checking for modifications, download tables that are not cached
+    * 'offline': only use the cached tables, never connect to the CBS database
+COLUMN_PROJECTION : bool
+    Boolean value to download only the columns of the (wide) CBS tables that are used in the settings and mapper_cols.
+    Default: True
+CBS_RETRIES : int
+    Number of retries of a request to the CBS database after a connection error, timeout or status 429/5xx.
+    Default: 3
+CBS_BACKOFF : float
+    Number of seconds before the first retry, doubled for every next retry (with a random jitter). Default: 1.0
+CBS_TIMEOUT : float
+    Number of seconds to wait for a response of the CBS database. Default: 60
+CBS_POOL_SIZE : int
+    Number of keep-alive connections to the CBS database that are reused across all tables. Default: 32
+CBS_ALLOW_FAILED_TABLES : bool
+    Boolean value to continue with the tables that could be collected if a CBS table failed after all retries. The
+    failed tables are always listed in the fetch report. Default: False (the run stops with a CBSFetchError)
+CBS_STREAMING : bool
+    Boolean value to convert the downloaded CBS tables page by page to Arrow (typed by the DataProperties of the
+    table), instead of collecting all rows as Python dictionaries first. Lowers the peak memory of large tables.
+    Default: True
+HUISHOUDENS_STREAMING : bool
+    Boolean value to aggregate the household tables to municipalities chunk by chunk (via the link between zipcodes
+    and municipalities), instead of loading and pivotting the whole table at zipcode level first. Default: True
+LOW_MEMORY : bool
+    Boolean value to make a memory-lean dataset: the columns of LIST_COLS_CATEGORY (and other text columns) become
+    categorical with the same categories in all merged datasets, measures become int32/float32 if their values fit.
+    The steps preprocess and train use these dtypes as they are. Default: False
+LIST_COLS_CATEGORY : list(str)
+    List with the key columns that become categorical in the LOW_MEMORY mode.
+ROW_FILTER_PUSHDOWN : bool
+    Boolean value to download only the rows of the selected REGION, PERIOD and TYPE_WMO from the CBS database (the
+    rows are filtered again after downloading). Set to False for servers that do not support OData filters.
+    Default: True
 REGION : str
     String notification of which region level ('gemeente', 'wijk', 'buurt')
 PERIOD : str
@@ -92,6 +135,20 @@ DICT_WMO_TO_WLZ = {'2019': '84812NED', # How to predict this as a feature?!
 
 get_data = {
     'CBS_OPEN_URL': 'opendata.cbs.nl',
+    'CBS_MAX_WORKERS': 8,
+    'CBS_CACHE_PATH': '../../data/cache_cbs/',
+    'CBS_CACHE_POLICY': 'check',
+    'COLUMN_PROJECTION': True,
+    'CBS_RETRIES': 3,
+    'CBS_BACKOFF': 1.0,
+    'CBS_TIMEOUT': 60,
+    'CBS_POOL_SIZE': 32,
+    'CBS_ALLOW_FAILED_TABLES': False,
+    'CBS_STREAMING': True,
+    'ROW_FILTER_PUSHDOWN': True,
+    'HUISHOUDENS_STREAMING': True,
+    'LOW_MEMORY': False,
+    'LIST_COLS_CATEGORY': ['codering_regio', 'interval', 'gemeentenaam'],
     'REGION': 'gemeente',
     'PERIOD': 'jaar',
     'DICT_TABLES_WMO': {'2020': '84908NED',
@@ -504,6 +561,15 @@ SCALER : sklearn.scaler
     Default: preprocessing.MinMaxScaler()
 LIST_COLUMNSELECTOR_COLS_2 : list(str)
     List of columns to apply custom scaler
+FUSED_PIPELINE : bool
+    Boolean value to run the transformers of the pipeline in place on one array of the numeric columns
+    (src.utilities.transformers.FusedPipeline), instead of a copy of the DataFrame in every step. Default: True
+FUSED_DTYPE : str
+    Dtype of the array of the FusedPipeline: 'float64' (the same results) or 'float32' (half the memory).
+    Default: 'float64'
+N_PARTITIONS_OUT_OF_CORE : int
+    Number of partitions of regions of preprocess_data_out_of_core, only one partition at once is in memory (more
+    partitions use less memory). Default: 64
 LOG_PATH : str
     Path of saving logging files. Default: '../../data/log_preprocess/',
 FILENAME : 
@@ -573,6 +639,9 @@ preprocess = {
                                     'relative_alleenstaande_mannen',
                                     'relative_popafstandtothuisartsenpraktijk',
                                     'relative_popbevolkingsdichtheid'],
+    'FUSED_PIPELINE': True,
+    'FUSED_DTYPE': 'float64',
+    'N_PARTITIONS_OUT_OF_CORE': 64,
     'LOG_PATH': '../../data/log_preprocess/',
     'FILENAME': 'df_preprocessed_'
 }
@@ -774,8 +843,9 @@ GROUP_INTERPOLATE_IMPUTER_COLS : list(str)
 BASE_COL_RELATE_IMPUTER : str
     Column name of the base column which will be used to calculate the relation in the past (%) and use that
     relation to fill in the missing values in the future.
-LIST_COLS_GROUPER_RELATE_IMPUTER : list(str)
-    List of columns to groupby on when imputing (based on relation).    
+BASE_PERIOD_RELATE_IMPUTER : str
+    Period of the relation (%) with the base column per region, i.e. '2019'. Default: None (the latest period with
+    historic values of the columns, see src.utilities.transformers.RelationalImputer)
 LOG_PATH : str
     String value of the path to save the logging in. 
 FILENAME : str
@@ -846,7 +916,7 @@ preprocess_predict = {
     'GROUP_INTERPOLATE_IMPUTER_METHOD': 'linear',
     'GROUP_INTERPOLATE_IMPUTER_COLS': None,
     'BASE_COL_RELATE_IMPUTER': 'aantalinwoners',
-    'LIST_COLS_GROUPER_RELATE_IMPUTER': ['codering_regio', 'interval'],
+    'BASE_PERIOD_RELATE_IMPUTER': None,
     'LOG_PATH': '../../data/log_preprocess/',
     'FILENAME': 'df_preprocess_predict_'
     }
@@ -861,4 +931,81 @@ FILENAME : str
 predict = {
     'LOG_PATH': '../../data/log_predict/',
     'FILENAME': 'df_predict_'
+    }
+
+# cbs_stand_in
+"""
+FIXTURE_PATH : str
+    Path of the recorded or synthetic CBS tables for the local stand-in of the CBS database, one folder per table
+    (see src.utilities.cbs_stand_in). Default: '../../data/fixtures_cbs/'
+HOST : str
+    Host of the stand-in server. Default: 'localhost'
+PORT : int
+    Port of the stand-in server. Default: 0 (a free port)
+LATENCY : float
+    Number of seconds every request to the stand-in server is delayed, to mimic the network. Default: 0.1
+PAGE_SIZE : int
+    Maximum number of rows per response of the stand-in server, further rows are available via the next link (like
+    the CBS database). Default: 10000
+"""
+cbs_stand_in = {
+    'FIXTURE_PATH': '../../data/fixtures_cbs/',
+    'HOST': 'localhost',
+    'PORT': 0,
+    'LATENCY': 0.1,
+    'PAGE_SIZE': 10000
+    }
+
+# artifact_store
+"""
+USE_ARTIFACT_STORE : bool
+    Boolean value to store the output of the steps get_data, get_data_predict, preprocess, preprocess_predict and train
+    by the hash of their inputs and settings (see src.utilities.artifact_store). A step with unchanged inputs and
+    settings returns the stored output instead of running again (and saves, logs and registers it like a run with
+    save_all). Default: True
+STORE_PATH : str
+    Path of the artifact store. Default: '../../data/artifacts/'
+CATALOG_PATH : str
+    Filepath of the catalog (SQLite) of the saved files of all steps (see src.utilities.artifact_catalog), used to find
+    the latest file of a step. Default: '../../data/artifact_catalog.sqlite'
+USE_FEATHER_CACHE : bool
+    Boolean value to convert saved datasets (parquet) once to uncompressed feather files, which are memory mapped when
+    the dataset is read again with get_latest_file (see src.utilities.utilities.read_dataset). Default: False
+FEATHER_CACHE_PATH : str
+    Path of the feather files of the saved datasets. Default: '../../data/cache_feather/'
+STORE_VERSION : int
+    Version that is part of the key of all artifacts, raise it to run all steps again (i.e. after changing the code of
+    a step). Default: 2
+"""
+artifact_store = {
+    'USE_ARTIFACT_STORE': True,
+    'STORE_PATH': '../../data/artifacts/',
+    'CATALOG_PATH': '../../data/artifact_catalog.sqlite',
+    'USE_FEATHER_CACHE': False,
+    'FEATHER_CACHE_PATH': '../../data/cache_feather/',
+    'STORE_VERSION': 2
+    }
+
+# storage
+"""
+COMPRESSION : str
+    Codec of the saved datasets (parquet) of all steps and of the DataFrames in the artifact store: 'zstd', 'lz4',
+    'snappy', 'gzip' or 'none'. Files with 'gzip' get the extension '.parquet.gzip', otherwise '.parquet'.
+    Default: 'zstd' (writes and reads much faster than gzip with about the same file size)
+COMPRESSION_LEVEL : int
+    Level of the codec (i.e. 1-22 for zstd). Default: None (the default level of the codec)
+ROW_GROUP_SIZE : int
+    Maximum number of rows per row group of a parquet file. The statistics (minimum and maximum) of every column are
+    written per row group, so a reader with filters skips the row groups without matching rows. Default: 100000
+PARTITION_COL : str
+    Column (or level of the index) to partition the saved datasets by, i.e. 'interval'. A partitioned dataset is a
+    folder with one parquet file per value ('<col>=<value>/part-0.parquet'), so a reader of only the latest period
+    reads only the file of that period (see src.utilities.utilities.read_dataset). The rows are read back per
+    partition (sorted by value). Default: None (one file per run)
+"""
+storage = {
+    'COMPRESSION': 'zstd',
+    'COMPRESSION_LEVEL': None,
+    'ROW_GROUP_SIZE': 100000,
+    'PARTITION_COL': None
     }
\ No newline at end of file
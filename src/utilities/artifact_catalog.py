@@ -0,0 +1,254 @@
+import os
+import re
+import time
+import sqlite3
+from contextlib import closing
+import pandas as pd
+import pyarrow.parquet as pq
+
+import src.settings as settings
+
+FILENAME_PATTERN = re.compile(r"^(?P<step>.*?)_?(?P<timestamp>\d{12})(?:_(?P<note>.*?))?"
+                              r"\.(?P<filetype>parquet\.gzip|parquet|pickle|csv)$")
+DICT_FILETYPES = {'parquet.gzip': 'parquet', 'parquet': 'parquet', 'pickle': 'pickle', 'csv': 'csv'}
+LIST_CATALOG_COLS = ['datapath', 'filename', 'step', 'timestamp', 'note', 'filetype', 'n_rows', 'n_cols']
+# Number of seconds in which a new file may not change the modification time of a folder (i.e. on FAT or NFS)
+MTIME_RESOLUTION = 2
+
+
+def get_catalog_connection(catalog_path=settings.artifact_store['CATALOG_PATH']):
+    """
+    Method to open the catalog of artifacts (SQLite), the tables and indexes are made if they don't exist.
+
+    Parameters
+    ----------
+    catalog_path : str
+        Filepath of the catalog
+
+    Returns
+    -------
+    sqlite3.Connection
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(catalog_path)), exist_ok=True)
+    # get_data and get_data_predict can run at the same time, so wait on a lock of the other thread
+    connection = sqlite3.connect(catalog_path, timeout=30)
+    connection.execute("CREATE TABLE IF NOT EXISTS artifacts ("
+                       "datapath TEXT NOT NULL, filename TEXT NOT NULL, step TEXT, timestamp TEXT, note TEXT, "
+                       "filetype TEXT, n_rows INTEGER, n_cols INTEGER, PRIMARY KEY (datapath, filename))")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_step ON artifacts (datapath, step, timestamp)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_note ON artifacts (datapath, note, timestamp)")
+    # Modification time of each folder at its last synchronization, see sync_catalog_if_modified
+    connection.execute("CREATE TABLE IF NOT EXISTS folders (datapath TEXT NOT NULL PRIMARY KEY, mtime INTEGER)")
+    return connection
+
+
+def parse_artifact_filename(filename):
+    """
+    Method to get the step, timestamp, note and filetype from the filename of an artifact, i.e.
+    'df_preprocessed_202104241838_pretrain_and_predict_new.parquet.gzip'.
+
+    Parameters
+    ----------
+    filename : str
+        Filename of the artifact
+
+    Returns
+    -------
+    dict(str: str) with the step, timestamp, note and filetype (None if the filename has another format)
+    """
+
+    match = FILENAME_PATTERN.match(filename)
+    if match is None:
+        return None
+    return {'step': match.group('step'),
+            'timestamp': match.group('timestamp'),
+            'note': match.group('note') or '',
+            'filetype': DICT_FILETYPES[match.group('filetype')]}
+
+
+def register_artifact(filepath, shape=None, catalog_path=settings.artifact_store['CATALOG_PATH']):
+    """
+    Method to add (or update) an artifact in the catalog.
+
+    Parameters
+    ----------
+    filepath : str
+        Filepath of the artifact (a file or the folder of a partitioned dataset), the filename has the format
+        '<step>_<timestamp>_<note>.<filetype>'
+    shape : tuple(int)
+        Number of rows and columns of the artifact. Default None (read from the metadata of a parquet file).
+    catalog_path : str
+        Filepath of the catalog
+
+    Returns
+    -------
+    None
+    """
+
+    datapath, filename = os.path.split(os.path.abspath(filepath))
+    dict_artifact = parse_artifact_filename(filename) or {'step': None, 'timestamp': None, 'note': None,
+                                                          'filetype': None}
+    if shape is None and dict_artifact['filetype'] == 'parquet':
+        # Only the metadata is read (of every partition of a partitioned dataset), the columns of the index of the
+        # DataFrame are not counted
+        list_metadata = [pq.read_metadata(os.path.join(entry.path, 'part-0.parquet')) for entry in
+                         os.scandir(filepath)] if os.path.isdir(filepath) else [pq.read_metadata(filepath)]
+        schema = list_metadata[0].schema.to_arrow_schema()
+        list_index_cols = [col for col in (schema.pandas_metadata or {}).get('index_columns', [])
+                           if isinstance(col, str)]
+        shape = (sum(metadata.num_rows for metadata in list_metadata), len(schema.names) - len(list_index_cols))
+    n_rows, n_cols = shape if shape is not None else (None, None)
+    with closing(get_catalog_connection(catalog_path)) as connection, connection:
+        connection.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (datapath, filename, dict_artifact['step'], dict_artifact['timestamp'],
+                            dict_artifact['note'], dict_artifact['filetype'], n_rows, n_cols))
+
+
+def sync_catalog(datapath, catalog_path=settings.artifact_store['CATALOG_PATH']):
+    """
+    Method to synchronize the catalog with the files (and partitioned datasets) in a folder: new files are added (i.e.
+    files that are copied to the folder) and files that don't exist anymore are removed. The modification time of the
+    folder is saved, see sync_catalog_if_modified.
+
+    Parameters
+    ----------
+    datapath : str
+        Path of the folder with artifacts
+    catalog_path : str
+        Filepath of the catalog
+
+    Returns
+    -------
+    int with the number of added files
+    """
+
+    datapath_abs = os.path.abspath(datapath)
+    # The modification time before the scan, so files that are added during the scan are found by the next one. A
+    # folder that is modified just before the scan is synchronized again the next time.
+    mtime = os.stat(datapath_abs).st_mtime_ns
+    if time.time() - mtime / 1e9 < MTIME_RESOLUTION:
+        mtime = None
+    # Partitioned datasets are folders with the filename of an artifact
+    set_files = {entry.name for entry in os.scandir(datapath_abs)
+                 if entry.is_file() or (entry.is_dir() and parse_artifact_filename(entry.name) is not None)}
+    with closing(get_catalog_connection(catalog_path)) as connection, connection:
+        set_cataloged = {row[0] for row in connection.execute("SELECT filename FROM artifacts WHERE datapath = ?",
+                                                              (datapath_abs,))}
+        connection.executemany("DELETE FROM artifacts WHERE datapath = ? AND filename = ?",
+                               [(datapath_abs, filename) for filename in set_cataloged - set_files])
+    list_new = sorted(set_files - set_cataloged)
+    for filename in list_new:
+        register_artifact(os.path.join(datapath_abs, filename), catalog_path=catalog_path)
+    with closing(get_catalog_connection(catalog_path)) as connection, connection:
+        connection.execute("INSERT OR REPLACE INTO folders VALUES (?, ?)", (datapath_abs, mtime))
+    return len(list_new)
+
+
+def sync_catalog_if_modified(datapath, catalog_path=settings.artifact_store['CATALOG_PATH']):
+    """
+    Method to synchronize the catalog with a folder (see sync_catalog) if the folder is modified since the last
+    synchronization, i.e. a file is added, removed or renamed by another process than the pipeline.
+
+    Parameters
+    ----------
+    datapath : str
+        Path of the folder with artifacts
+    catalog_path : str
+        Filepath of the catalog
+
+    Returns
+    -------
+    int with the number of added files
+    """
+
+    datapath_abs = os.path.abspath(datapath)
+    with closing(get_catalog_connection(catalog_path)) as connection:
+        row = connection.execute("SELECT mtime FROM folders WHERE datapath = ?", (datapath_abs,)).fetchone()
+    if row is not None and row[0] == os.stat(datapath_abs).st_mtime_ns:
+        return 0
+    print(f"Synchronize the catalog of artifacts with {datapath}")
+    return sync_catalog(datapath, catalog_path=catalog_path)
+
+
+def query_artifacts(datapath, step=None, note=None, filetype=None, filename_str_contains=None, n_latest=None,
+                    catalog_path=settings.artifact_store['CATALOG_PATH']):
+    """
+    Method to get the artifacts in a folder from the catalog, filtered on step, note, filetype and/or a snippet of the
+    filename.
+
+    Parameters
+    ----------
+    datapath : str
+        Path of the folder with artifacts
+    step : str
+        Step of the artifacts, i.e. 'df_preprocessed' or 'best_model'. Default None (all steps).
+    note : str
+        Personal note of the artifacts. Default None (all notes).
+    filetype : str
+        Filetype of the artifacts ('parquet', 'pickle', 'csv'). Default None (all filetypes).
+    filename_str_contains : str
+        String with snippet of filename that is searched for. Default None (all filenames).
+    n_latest : int
+        Only get this number of artifacts with the last filenames. Default None (all artifacts).
+    catalog_path : str
+        Filepath of the catalog
+
+    Returns
+    -------
+    pd.DataFrame with the artifacts (LIST_CATALOG_COLS), sorted by filename
+    """
+
+    query = f"SELECT {', '.join(LIST_CATALOG_COLS)} FROM artifacts WHERE datapath = ?"
+    list_params = [os.path.abspath(datapath)]
+    for col, value in [('step', step), ('note', note), ('filetype', filetype)]:
+        if value is not None:
+            query += f" AND {col} = ?"
+            list_params.append(value)
+    if filename_str_contains is not None:
+        query += " AND instr(filename, ?) > 0"
+        list_params.append(filename_str_contains)
+    # The primary key (datapath, filename) is used for the order, so the last filenames are found without sorting
+    query += " ORDER BY filename DESC"
+    if n_latest is not None:
+        query += " LIMIT ?"
+        list_params.append(n_latest)
+    with closing(get_catalog_connection(catalog_path)) as connection:
+        list_rows = connection.execute(query, list_params).fetchall()
+    return pd.DataFrame(list_rows[::-1], columns=LIST_CATALOG_COLS)
+
+
+def get_latest_artifact_filepath(datapath, step=None, note=None, filetype=None, filename_str_contains=None,
+                                 catalog_path=settings.artifact_store['CATALOG_PATH']):
+    """
+    Method to get the filepath of the latest artifact in a folder (the last filename, so the latest timestamp of a
+    step) with the filters of query_artifacts. The catalog is synchronized first if the folder is modified since the
+    last synchronization (see sync_catalog_if_modified), so files that are added outside the pipeline are found too.
+
+    Parameters
+    ----------
+    datapath : str
+        Path of the folder with artifacts
+    step : str
+        Step of the artifact, i.e. 'df_preprocessed' or 'best_model'. Default None (all steps).
+    note : str
+        Personal note of the artifact. Default None (all notes).
+    filetype : str
+        Filetype of the artifact ('parquet', 'pickle', 'csv'). Default None (all filetypes).
+    filename_str_contains : str
+        String with snippet of filename that is searched for. Default None (all filenames).
+    catalog_path : str
+        Filepath of the catalog
+
+    Returns
+    -------
+    str with the filepath of the artifact
+    """
+
+    sync_catalog_if_modified(datapath, catalog_path=catalog_path)
+    df_artifacts = query_artifacts(datapath, step=step, note=note, filetype=filetype,
+                                   filename_str_contains=filename_str_contains, n_latest=1, catalog_path=catalog_path)
+    if len(df_artifacts) > 0:
+        return os.path.join(df_artifacts['datapath'].iloc[-1], df_artifacts['filename'].iloc[-1])
+    raise FileNotFoundError(f"No artifact in {datapath} with step={step}, note={note}, filetype={filetype} and "
+                            f"filename containing {filename_str_contains}")
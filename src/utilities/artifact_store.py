@@ -0,0 +1,184 @@
+import os
+import io
+import json
+import pickle
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+import src.settings as settings
+from src.utilities.utilities import atomic_filepath
+
+
+def hash_object(obj):
+    """
+    Method to get a stable hash of the inputs of a step: settings (dictionaries, lists, strings, numbers), DataFrames
+    and other objects (i.e. sklearn estimators, by their representation).
+
+    Parameters
+    ----------
+    obj : object
+        Object to hash, i.e. a settings dictionary or a pd.DataFrame
+
+    Returns
+    -------
+    str with the sha1 hash of the object
+    """
+
+    sha = hashlib.sha1()
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        # The values (including the index) are hashed per row, the columnnames and dtypes are hashed separately
+        sha.update(b'dataframe')
+        sha.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+        if isinstance(obj, pd.DataFrame):
+            sha.update(repr([(str(col), str(dtype)) for col, dtype in obj.dtypes.items()]).encode('utf-8'))
+        sha.update(repr(list(obj.index.names)).encode('utf-8'))
+    elif isinstance(obj, dict):
+        sha.update(b'dict')
+        for key in sorted(obj.keys(), key=str):
+            sha.update(str(key).encode('utf-8'))
+            sha.update(hash_object(obj[key]).encode('utf-8'))
+    elif isinstance(obj, (list, tuple)):
+        sha.update(b'list')
+        for value in obj:
+            sha.update(hash_object(value).encode('utf-8'))
+    elif isinstance(obj, (set, frozenset)):
+        sha.update(b'set')
+        for value in sorted([hash_object(value) for value in obj]):
+            sha.update(value.encode('utf-8'))
+    elif isinstance(obj, np.ndarray):
+        sha.update(b'array')
+        sha.update(str(obj.dtype).encode('utf-8'))
+        sha.update(np.ascontiguousarray(obj).tobytes())
+    elif obj is None or isinstance(obj, (str, bool, int, float, np.generic)):
+        sha.update(repr(obj).encode('utf-8'))
+    else:
+        sha.update(type(obj).__name__.encode('utf-8'))
+        sha.update(repr(obj).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def get_artifact_key(step, list_inputs):
+    """
+    Method to get the key of the output of a step, based on the hash of its inputs and settings (and the version of the
+    store, see settings.artifact_store['STORE_VERSION']).
+
+    Parameters
+    ----------
+    step : str
+        Name of the step, i.e. 'preprocess'
+    list_inputs : list(object)
+        List with the inputs of the step (DataFrames, settings, parameters)
+
+    Returns
+    -------
+    str with the key of the artifact
+    """
+
+    return hash_object([step, settings.artifact_store['STORE_VERSION']] + list(list_inputs))
+
+
+def get_artifact_paths(step, key, store_path=settings.artifact_store['STORE_PATH']):
+    """
+    Method to get the path of the key file of an artifact and the folder with the (deduplicated) contents.
+
+    Parameters
+    ----------
+    step : str
+        Name of the step, i.e. 'preprocess'
+    key : str
+        Key of the artifact, see get_artifact_key
+    store_path : str
+        Path of the artifact store
+
+    Returns
+    -------
+    Tuple with the filepath of the key (json) and the path of the folder with the contents
+    """
+
+    return os.path.join(store_path, 'keys', f"{step}_{key}.json"), os.path.join(store_path, 'objects')
+
+
+def save_artifact(obj, step, key, store_path=settings.artifact_store['STORE_PATH']):
+    """
+    Method to save the output of a step in the artifact store. The content is stored once by its own hash, so identical
+    outputs (of different keys) are only stored once.
+
+    Parameters
+    ----------
+    obj : pd.DataFrame or object
+        Output of the step, a DataFrame is stored as parquet and other objects (i.e. a model) as pickle
+    step : str
+        Name of the step, i.e. 'preprocess'
+    key : str
+        Key of the artifact, see get_artifact_key
+    store_path : str
+        Path of the artifact store
+
+    Returns
+    -------
+    str with the filepath of the content
+    """
+
+    filepath_key, path_objects = get_artifact_paths(step, key, store_path=store_path)
+    os.makedirs(os.path.dirname(filepath_key), exist_ok=True)
+    os.makedirs(path_objects, exist_ok=True)
+    if isinstance(obj, pd.DataFrame):
+        filetype = 'parquet'
+        buffer = io.BytesIO()
+        obj.to_parquet(buffer, compression=settings.storage['COMPRESSION'],
+                       compression_level=settings.storage['COMPRESSION_LEVEL'],
+                       row_group_size=settings.storage['ROW_GROUP_SIZE'])
+        content = buffer.getvalue()
+    else:
+        filetype = 'pickle'
+        content = pickle.dumps(obj)
+    content_hash = hashlib.sha1(content).hexdigest()
+    filepath_content = os.path.join(path_objects, f"{content_hash}.{filetype}")
+    if os.path.isfile(filepath_content):
+        print(f"Artifact of step '{step}' is identical to a stored artifact, content is not stored again")
+    else:
+        with atomic_filepath(filepath_content) as filepath_content_tmp:
+            with open(filepath_content_tmp, 'wb') as file_content:
+                file_content.write(content)
+    with atomic_filepath(filepath_key) as filepath_key_tmp, open(filepath_key_tmp, 'w') as file_key:
+        json.dump({'step': step,
+                   'key': key,
+                   'content': os.path.basename(filepath_content),
+                   'filetype': filetype,
+                   'timestamp_run': datetime.now().isoformat()}, file_key)
+    return filepath_content
+
+
+def load_artifact(step, key, store_path=settings.artifact_store['STORE_PATH']):
+    """
+    Method to load the output of a step from the artifact store.
+
+    Parameters
+    ----------
+    step : str
+        Name of the step, i.e. 'preprocess'
+    key : str
+        Key of the artifact, see get_artifact_key
+    store_path : str
+        Path of the artifact store
+
+    Returns
+    -------
+    pd.DataFrame or object with the output of the step (None if the artifact is not in the store)
+    """
+
+    filepath_key, path_objects = get_artifact_paths(step, key, store_path=store_path)
+    if not os.path.isfile(filepath_key):
+        return None
+    with open(filepath_key, 'r') as file_key:
+        dict_key = json.load(file_key)
+    filepath_content = os.path.join(path_objects, dict_key['content'])
+    if not os.path.isfile(filepath_content):
+        return None
+    print(f"Use the stored artifact of step '{step}' of {dict_key['timestamp_run']} (inputs and settings unchanged)")
+    if dict_key['filetype'] == 'parquet':
+        return pd.read_parquet(filepath_content)
+    with open(filepath_content, 'rb') as file_content:
+        return pickle.load(file_content)
@@ -0,0 +1,602 @@
+import sys
+sys.path.append('../../')
+import os
+import re
+import json
+import time
+import random
+import itertools
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+import numpy as np
+import pandas as pd
+import cbsodata
+
+import src.settings as settings
+from src.preprocess.cbs_utils import strip_cbs_colname
+from src.run_all.get_data import get_data, get_data_predict
+
+FILTER_TOKENS = re.compile(r"\s*(\(|\)|,|'(?:[^']|'')*'|-?\d+(?:\.\d+)?|[A-Za-z_][A-Za-z0-9_]*)")
+DICT_FILTER_FUNCTIONS = {'startswith': lambda value, prefix: str(value).startswith(prefix),
+                         'endswith': lambda value, suffix: str(value).endswith(suffix),
+                         'substringof': lambda substring, value: substring in str(value)}
+DICT_FILTER_OPERATORS = {'eq': lambda x, y: x == y, 'ne': lambda x, y: x != y, 'gt': lambda x, y: x > y,
+                         'ge': lambda x, y: x >= y, 'lt': lambda x, y: x < y, 'le': lambda x, y: x <= y}
+
+
+def get_settings_tables():
+    """
+    Method to get all CBS tables that are referenced in settings.get_data and settings.get_data_predict.
+
+    Returns
+    -------
+    list(str) with the unique table names, i.e. ['70072NED', '83504NED', ...]
+    """
+
+    set_tables = set()
+    for dict_settings in [settings.get_data, settings.get_data_predict]:
+        for key, value in dict_settings.items():
+            if key.startswith('DICT_TABLES_'):
+                set_tables.update(value.values())
+    return sorted(set_tables)
+
+
+def record_cbs_fixtures(list_tables=None, fixture_path=settings.cbs_stand_in['FIXTURE_PATH'],
+                        url='opendata.cbs.nl'):
+    """
+    Method to record CBS tables (data and metadata) as fixtures for the stand-in server. Each table is saved in the
+    format of cbsodata.download_data, i.e. '<fixture_path>/<table>/DataProperties.json'.
+
+    Parameters
+    ----------
+    list_tables : list(str)
+        List with the table names to record. Default None (all tables in the settings, see get_settings_tables)
+    fixture_path : str
+        Path of the folder with the fixtures
+    url : str
+        URL of the catalog of the CBS databases, i.e.: 'opendata.cbs.nl'
+
+    Returns
+    -------
+    list(str) with the recorded tables
+    """
+
+    if list_tables is None:
+        list_tables = get_settings_tables()
+    list_recorded = []
+    for table in list_tables:
+        print(f"Record table {table}")
+        try:
+            cbsodata.download_data(table, dir=os.path.join(fixture_path, table), catalog_url=url)
+            list_recorded.append(table)
+        except Exception as e:
+            print(f"Table {table} could not be recorded: {e}")
+    return list_recorded
+
+
+def read_cbs_fixture(table, name, fixture_path=settings.cbs_stand_in['FIXTURE_PATH']):
+    """
+    Method to read (meta)data of a recorded or synthetic table, i.e. to use it as template of a synthetic table.
+
+    Parameters
+    ----------
+    table : str
+        Table name in the CBS database, i.e. '84583NED'
+    name : str
+        Name of the (meta)data, i.e. 'DataProperties', 'TypedDataSet' or the key of a dimension
+    fixture_path : str
+        Path of the folder with the fixtures
+
+    Returns
+    -------
+    list(dict) with the (meta)data
+    """
+
+    with open(os.path.join(fixture_path, table, name + '.json'), 'r') as file:
+        return json.load(file)
+
+
+def make_synthetic_cbs_fixture(table, list_data_properties, dict_dimensions,
+                               fixture_path=settings.cbs_stand_in['FIXTURE_PATH'], n_regions=None, seed=0,
+                               dict_topic_values=None):
+    """
+    Method to make a synthetic table for the stand-in server. All combinations of the dimension values are added as
+    rows, the topics get random values of the datatype in the DataProperties.
+
+    Parameters
+    ----------
+    table : str
+        Table name of the synthetic table, i.e. '84583NED'
+    list_data_properties : list(dict)
+        DataProperties of the table (with 'Key', 'Type' and for topics 'Datatype'), i.e. of a recorded table
+    dict_dimensions : dict(str: list(dict))
+        Dictionary with as key the key of a dimension and as value the metadata of the dimension (with 'Key' and
+        'Title'), i.e. of a recorded table
+    fixture_path : str
+        Path of the folder with the fixtures
+    n_regions : int
+        Number of municipalities in the GeoDimension, each municipality gets one 'wijk' and one 'buurt'. Default None
+        (the values in dict_dimensions are used).
+    seed : int
+        Seed of the random values
+    dict_topic_values : dict(str: dict(str: object))
+        Dictionary with per topic the value of each key of the GeoDimension, i.e. {'Gemeentenaam_1': {'GM0001':
+        'Gemeente 1'}}. Default None (random values).
+
+    Returns
+    -------
+    int with the number of rows of the synthetic table
+    """
+
+    rng = np.random.default_rng(seed)
+    dict_dimensions = dict(dict_dimensions)
+    dict_topic_values = dict_topic_values or {}
+    list_dimensions = [data_property['Key'] for data_property in list_data_properties
+                       if data_property.get('Type') in ['Dimension', 'GeoDimension', 'TimeDimension']]
+    list_geo_dimensions = [data_property['Key'] for data_property in list_data_properties
+                           if data_property.get('Type') == 'GeoDimension']
+    list_topics = [data_property for data_property in list_data_properties if data_property.get('Type') == 'Topic']
+    for data_property in list_data_properties:
+        if data_property.get('Type') == 'GeoDimension' and n_regions is not None:
+            dict_dimensions[data_property['Key']] = list(itertools.chain.from_iterable(
+                [{'Key': f"GM{i:04d}", 'Title': f"Gemeente {i}"},
+                 {'Key': f"WK{i:04d}00", 'Title': f"Wijk 00 Gemeente {i}"},
+                 {'Key': f"BU{i:04d}0000", 'Title': f"Buurt 00 Gemeente {i}"}] for i in range(1, n_regions + 1)))
+
+    list_keys = [[dimension_value['Key'] for dimension_value in dict_dimensions.get(dimension, [])]
+                 for dimension in list_dimensions]
+    list_rows = list(itertools.product(*list_keys))
+    dict_cols = {'ID': list(range(len(list_rows)))}
+    for i, dimension in enumerate(list_dimensions):
+        dict_cols[dimension] = [row[i] for row in list_rows]
+    for data_property in list_topics:
+        datatype = data_property.get('Datatype', 'Double')
+        if data_property['Key'] in dict_topic_values and list_geo_dimensions:
+            dict_cols[data_property['Key']] = [dict_topic_values[data_property['Key']].get(key)
+                                               for key in dict_cols[list_geo_dimensions[0]]]
+        elif datatype in ['Long', 'Integer', 'Short']:
+            dict_cols[data_property['Key']] = rng.integers(0, 10000, len(list_rows)).tolist()
+        elif datatype in ['Double', 'Float', 'Decimal']:
+            dict_cols[data_property['Key']] = np.round(rng.random(len(list_rows)) * 1000, 1).tolist()
+        elif strip_cbs_colname(data_property['Key']) == 'codering' and list_geo_dimensions:
+            # The code of the region is the key of the GeoDimension, i.e. 'GM0014'
+            dict_cols[data_property['Key']] = list(dict_cols[list_geo_dimensions[0]])
+        else:
+            dict_cols[data_property['Key']] = [f"{data_property['Key']} {j % 100}" for j in range(len(list_rows))]
+    list_data = [dict(zip(dict_cols.keys(), values)) for values in zip(*dict_cols.values())]
+
+    dict_fixture = {'TableInfos': [{'Identifier': table, 'Modified': datetime.now().isoformat()}],
+                    'DataProperties': list_data_properties,
+                    'TypedDataSet': list_data}
+    dict_fixture.update({dimension: dict_dimensions.get(dimension, []) for dimension in list_dimensions})
+    os.makedirs(os.path.join(fixture_path, table), exist_ok=True)
+    for name, data in dict_fixture.items():
+        with open(os.path.join(fixture_path, table, name + '.json'), 'w') as file:
+            json.dump(data, file)
+    return len(list_data)
+
+
+def make_settings_cbs_fixtures(fixture_path=settings.cbs_stand_in['FIXTURE_PATH'], n_regions=3, seed=0):
+    """
+    Method to make synthetic fixtures of all tables in settings.get_data and settings.get_data_predict without recorded
+    templates, so the stand-in server works offline. Every table has the dimensions and the columns that get_data and
+    get_data_predict use (not all topics of the CBS table), with the same municipalities, codes and zipcodes in all
+    tables so the tables can be combined.
+
+    Parameters
+    ----------
+    fixture_path : str
+        Path of the folder with the fixtures
+    n_regions : int
+        Number of municipalities, each municipality gets one 'wijk', one 'buurt' and one zipcode. Default 3.
+    seed : int
+        Seed of the random values
+
+    Returns
+    -------
+    dict(str: int) with the number of rows per table
+    """
+
+    def dimension(key, type='Dimension'):
+        return {'Key': key, 'Type': type}
+
+    def topic(key, datatype='Double'):
+        return {'Key': key, 'Type': 'Topic', 'Datatype': datatype}
+
+    def periods(list_years, halfyear=False):
+        list_periods = [{'Key': f"{year}JJ00", 'Title': str(year)} for year in list_years]
+        if halfyear:
+            list_periods += [{'Key': f"{year}HJ01", 'Title': f"{year} 1e halfjaar"} for year in list_years]
+        return list_periods
+
+    def titles(list_titles, prefix):
+        return [{'Key': f"{prefix}{i:02d}", 'Title': title} for i, title in enumerate(list_titles)]
+
+    list_municipalities = list(range(1, n_regions + 1))
+    dict_names = {}
+    dict_codes = {}
+    dict_zipcodes = {}
+    for i in list_municipalities:
+        for key in [f"GM{i:04d}", f"WK{i:04d}00", f"BU{i:04d}0000"]:
+            dict_names[key] = f"Gemeente {i}"
+            dict_codes[key] = key
+            dict_zipcodes[key] = str(1000 + i) if not key.startswith('GM') else '.'
+    list_years = sorted({int(interval) for dict_tables in [settings.get_data['DICT_TABLES_WMO'],
+                                                             settings.get_data['DICT_TABLES_WIJK']]
+                         for interval in dict_tables.keys()})
+    # The prognoses are only available per municipality (and for the country and provinces)
+    list_municipalities_titles = [{'Key': f"GM{i:04d}", 'Title': f"Gemeente {i}"} for i in list_municipalities]
+    list_regions_prognose = [{'Key': 'NL01', 'Title': 'Nederland'},
+                             {'Key': 'PV20', 'Title': 'Groningen (PV)'}] + list_municipalities_titles
+    list_years_prognose = list(range(min(settings.get_data_predict['LIST_PERIODS']),
+                                     max(settings.get_data_predict['LIST_PERIODS']) + 6))
+
+    # (dictionary with tables, DataProperties, dimensions (the GeoDimension if not of n_regions) and values of topics)
+    list_specs = [
+        (settings.get_data['DICT_TABLES_WMO'],
+         [dimension('TypeMaatwerkarrangement'), dimension('RegioS', 'GeoDimension'),
+          dimension('Perioden', 'TimeDimension'), topic('Codering_3', 'String'), topic('WmoClienten_5', 'Long'),
+          topic('WmoClientenPer1000Inwoners_6')],
+         {'TypeMaatwerkarrangement': titles([settings.get_data['TYPE_WMO'], 'Hulpmiddelen en diensten'], 'A0457')},
+         {}),
+        (settings.get_data['DICT_TABLES_WIJK'],
+         [dimension('WijkenEnBuurten', 'GeoDimension'), topic('Gemeentenaam_1', 'String'),
+          topic('SoortRegio_2', 'String'), topic('Codering_3', 'String'), topic('AantalInwoners_5', 'Long'),
+          topic('Mannen_6', 'Long'), topic('Vrouwen_7', 'Long'), topic('GemiddeldElektriciteitsverbruikTotaal_47'),
+          topic('Appartement_48'), topic('MeestVoorkomendePostcode_103', 'String')],
+         {},
+         {'Gemeentenaam_1': dict_names, 'MeestVoorkomendePostcode_103': dict_zipcodes}),
+        (settings.get_data['DICT_TABLES_HUISHOUDEN'],
+         [dimension('Geslacht'), dimension('PositieInHetHuishouden'), dimension('Postcode'),
+          dimension('Perioden', 'TimeDimension'), topic('Bevolking_1', 'Long')],
+         {'Geslacht': titles(['Mannen', 'Vrouwen'], '3000'),
+          'PositieInHetHuishouden': titles(['Alleenstaand', 'Thuiswonend kind', 'Partner'], '1050'),
+          'Postcode': [{'Key': f"PC{1000 + i}", 'Title': str(1000 + i)} for i in list_municipalities]
+          + [{'Key': 'NL01', 'Title': 'Nederland'}],
+          'Perioden': periods(list_years)},
+         {}),
+        (settings.get_data['DICT_TABLES_BEVOLKING'],
+         [dimension('RegioS', 'GeoDimension'), dimension('Perioden', 'TimeDimension'),
+          topic('TotaleBevolking_1', 'Long'), topic('Mannen_2', 'Long'), topic('Vrouwen_3', 'Long'),
+          topic('GemiddeldeHuishoudensgrootte_89')],
+         {'Perioden': periods(list_years)},
+         {}),
+        (settings.get_data['DICT_TABLES_HEFFING'],
+         [dimension('GemeentelijkeHeffingenVanaf'), dimension('RegioS', 'GeoDimension'),
+          dimension('Perioden', 'TimeDimension'), topic('GemeentelijkeHeffingenIn1000Euro_1'),
+          topic('GemeentelijkeHeffingenEuroInwoner_2')],
+         {'GemeentelijkeHeffingenVanaf': titles(['Begraafplaatsrechten', 'Rioolheffing',
+                                                 'Totaal onroerendezaakbelasting'], 'A0250'),
+          'Perioden': periods(list_years)},
+         {}),
+        (settings.get_data_predict['DICT_TABLES_REGIOINDELING'],
+         [dimension('RegioS', 'GeoDimension'), topic('Code_1', 'String'), topic('Naam_2', 'String'),
+          topic('SorteringNaam_3', 'String')],
+         {'RegioS': list_municipalities_titles},
+         {'Code_1': dict_codes, 'Naam_2': dict_names, 'SorteringNaam_3': dict_names}),
+        (settings.get_data_predict['DICT_TABLES_HUISHOUDEN'],
+         [dimension('SamenstellingVanHetHuishouden'), dimension('RegioIndeling', 'GeoDimension'),
+          dimension('Prognoseinterval'), dimension('Perioden', 'TimeDimension'), topic('ParticuliereHuishoudens_1')],
+         {'SamenstellingVanHetHuishouden': titles(list(settings.get_data_predict['DICT_COLS_RENAMED_HUISHOUDEN_PIVOT']),
+                                                  '1050'),
+          'RegioIndeling': list_regions_prognose,
+          'Prognoseinterval': titles(['Prognose', 'Ondergrens prognose-interval'], 'PI'),
+          'Perioden': periods(list_years_prognose)},
+         {}),
+        (settings.get_data_predict['DICT_TABLES_BEVOLKING'],
+         [dimension('RegioIndeling', 'GeoDimension'), dimension('Perioden', 'TimeDimension'),
+          topic('BevolkingAanHetEindVanDePeriode_4')],
+         {'RegioIndeling': list_regions_prognose, 'Perioden': periods(list_years_prognose)},
+         {})]
+
+    dict_rows = {}
+    for dict_tables, list_data_properties, dict_dimensions, dict_topic_values in list_specs:
+        for interval, table in dict_tables.items():
+            dict_dimensions_table = dict(dict_dimensions)
+            if 'Perioden' not in dict_dimensions_table and interval.isdigit():
+                # The tables per year only have the rows of that year
+                dict_dimensions_table['Perioden'] = periods([int(interval)], halfyear=True)
+            is_geo_given = any(data_property['Type'] == 'GeoDimension' and data_property['Key'] in dict_dimensions
+                               for data_property in list_data_properties)
+            dict_rows[table] = make_synthetic_cbs_fixture(table, list_data_properties, dict_dimensions_table,
+                                                          fixture_path=fixture_path,
+                                                          n_regions=None if is_geo_given else n_regions, seed=seed,
+                                                          dict_topic_values=dict_topic_values)
+    return dict_rows
+
+
+def parse_odata_filter(filters):
+    """
+    Method to parse an OData $filter into a function that checks a row. Supported are the operators 'and', 'or',
+    'not', 'eq', 'ne', 'gt', 'ge', 'lt' and 'le', the functions 'startswith', 'endswith' and 'substringof' and
+    parentheses, i.e. "startswith(WijkenEnBuurten,'GM') and (Perioden eq '2019JJ00' or Perioden eq '2018JJ00')".
+
+    Parameters
+    ----------
+    filters : str
+        OData $filter
+
+    Returns
+    -------
+    function with as input a row (dict) and as output a bool
+    """
+
+    tokens = FILTER_TOKENS.findall(filters)
+    position = [0]
+
+    def peek():
+        return tokens[position[0]] if position[0] < len(tokens) else None
+
+    def take(expected=None):
+        token = peek()
+        if token is None or (expected is not None and token != expected):
+            raise ValueError(f"Unsupported filter '{filters}', expected '{expected}' but got '{token}'")
+        position[0] += 1
+        return token
+
+    def parse_operand():
+        token = take()
+        if token.startswith("'"):
+            value = token[1:-1].replace("''", "'")
+            return lambda row: value
+        if re.match(r"-?\d", token):
+            value = float(token)
+            return lambda row: value
+        if peek() == '(':
+            function = DICT_FILTER_FUNCTIONS[token.lower()]
+            take('(')
+            list_args = [parse_operand()]
+            while peek() == ',':
+                take(',')
+                list_args.append(parse_operand())
+            take(')')
+            return lambda row: function(*[arg(row) for arg in list_args])
+        if token in ['true', 'false']:
+            return lambda row: token == 'true'
+        return lambda row: row.get(token)
+
+    def parse_primary():
+        if peek() == '(':
+            take('(')
+            check = parse_or()
+            take(')')
+            return check
+        if peek() == 'not':
+            take('not')
+            check = parse_primary()
+            return lambda row: not check(row)
+        left = parse_operand()
+        if peek() in DICT_FILTER_OPERATORS:
+            operator = DICT_FILTER_OPERATORS[take()]
+            right = parse_operand()
+            return lambda row: operator(left(row), right(row))
+        return lambda row: bool(left(row))
+
+    def parse_and():
+        list_checks = [parse_primary()]
+        while peek() == 'and':
+            take('and')
+            list_checks.append(parse_primary())
+        return lambda row: all(check(row) for check in list_checks)
+
+    def parse_or():
+        list_checks = [parse_and()]
+        while peek() == 'or':
+            take('or')
+            list_checks.append(parse_and())
+        return lambda row: any(check(row) for check in list_checks)
+
+    check = parse_or()
+    if peek() is not None:
+        raise ValueError(f"Unsupported filter '{filters}', unexpected '{peek()}'")
+    return check
+
+
+class CBSStandInHandler(BaseHTTPRequestHandler):
+    """
+    This is a request handler class to serve the fixtures in the OData format of the CBS database, with support of
+    $select, $filter, $skip, $top and paging with 'odata.nextLink'.
+    """
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        if server.failure_rate and random.random() < server.failure_rate:
+            self.send_json({'odata.error': 'Service unavailable (failure injected by the stand-in)'}, status=503)
+            return
+        url_split = urlsplit(self.path)
+        params = {key: value[-1] for key, value in parse_qs(url_split.query).items()}
+        match = re.match(r"^/(?:ODataFeed|ODataApi)/odata/([^/]+)/?([^/]*)$", url_split.path)
+        if match is None or not os.path.isdir(os.path.join(server.fixture_path, match.group(1))):
+            self.send_json({'odata.error': f"Not found: {url_split.path}"}, status=404)
+            return
+        table, name = match.group(1), match.group(2)
+        table_url = f"http://{server.catalog_url}/ODataFeed/odata/{table}/"
+
+        if name == '':
+            # Overview of the (meta)data of the table, as used in cbsodata.download_data
+            list_names = sorted(set([f[:-5] for f in os.listdir(os.path.join(server.fixture_path, table))
+                                     if f.endswith('.json')] + ['TypedDataSet', 'UntypedDataSet']))
+            self.send_json({'value': [{'name': n, 'url': table_url + n} for n in list_names]})
+            return
+        try:
+            list_data = server.get_fixture(table, 'TypedDataSet' if name == 'UntypedDataSet' else name)
+            if '$filter' in params:
+                check = parse_odata_filter(params['$filter'])
+                list_data = [row for row in list_data if check(row)]
+            skip = int(params.get('$skip', 0))
+            end = len(list_data) if '$top' not in params else skip + int(params['$top'])
+            end_page = min(end, skip + server.page_size) if server.page_size else end
+            list_page = list_data[skip:end_page]
+            if '$select' in params:
+                list_select = [col.strip() for col in params['$select'].split(',')]
+                list_page = [{col: row.get(col) for col in list_select} for row in list_page]
+        except (KeyError, ValueError) as e:
+            self.send_json({'odata.error': str(e)}, status=400)
+            return
+
+        response = {'value': list_page}
+        if end_page < min(end, len(list_data)):
+            params['$skip'] = str(end_page)
+            response['odata.nextLink'] = table_url + name + '?' + urlencode(params)
+        self.send_json(response)
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.n_requests += 1
+            self.server.bytes_sent += len(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CBSStandInServer(ThreadingHTTPServer):
+    """
+    This is a local stand-in for the OData API of the CBS database, it serves the recorded or synthetic fixtures in
+    fixture_path through the same catalog_url mechanism as opendata.cbs.nl.
+
+    Parameters
+    ----------
+    fixture_path : str
+        Path of the folder with the fixtures, one folder per table (see record_cbs_fixtures)
+    host : str
+        Host of the server. Default 'localhost'
+    port : int
+        Port of the server. Default 0 (a free port)
+    latency : float
+        Number of seconds every request is delayed, to mimic the network. Default 0.
+    page_size : int
+        Maximum number of rows per response, further rows are available via 'odata.nextLink'. Default None (no
+        paging).
+    failure_rate : float
+        Fraction of the requests that randomly fail with status 503, to test the retries. Default 0.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, fixture_path, host='localhost', port=0, latency=0.0, page_size=None, failure_rate=0.0):
+        super().__init__((host, port), CBSStandInHandler)
+        self.fixture_path = fixture_path
+        self.latency = latency
+        self.page_size = page_size
+        self.failure_rate = failure_rate
+        self.catalog_url = f"{host}:{self.server_address[1]}"
+        self.n_requests = 0
+        self.bytes_sent = 0
+        self.dict_fixtures = {}
+        self.lock = threading.Lock()
+
+    def get_fixture(self, table, name):
+        with self.lock:
+            if (table, name) not in self.dict_fixtures:
+                try:
+                    self.dict_fixtures[(table, name)] = read_cbs_fixture(table, name, fixture_path=self.fixture_path)
+                except FileNotFoundError:
+                    raise KeyError(f"Fixture {name} of table {table} not found")
+            return self.dict_fixtures[(table, name)]
+
+
+@contextmanager
+def cbs_stand_in(fixture_path=settings.cbs_stand_in['FIXTURE_PATH'], host=settings.cbs_stand_in['HOST'],
+                 port=settings.cbs_stand_in['PORT'], latency=settings.cbs_stand_in['LATENCY'],
+                 page_size=settings.cbs_stand_in['PAGE_SIZE'], failure_rate=0.0):
+    """
+    Context manager to run the stand-in server in a background thread, with cbsodata switched to http.
+
+    Parameters
+    ----------
+    fixture_path : str
+        Path of the folder with the fixtures
+    host : str
+        Host of the server
+    port : int
+        Port of the server (0 for a free port)
+    latency : float
+        Number of seconds every request is delayed
+    page_size : int
+        Maximum number of rows per response
+    failure_rate : float
+        Fraction of the requests that randomly fail with status 503
+
+    Returns
+    -------
+    CBSStandInServer, use server.catalog_url as url of the catalog
+    """
+
+    server = CBSStandInServer(fixture_path, host=host, port=port, latency=latency, page_size=page_size,
+                              failure_rate=failure_rate)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    use_https = cbsodata.options.use_https
+    cbsodata.options.use_https = False
+    try:
+        yield server
+    finally:
+        cbsodata.options.use_https = use_https
+        server.shutdown()
+        server.server_close()
+
+
+def benchmark_get_data(fixture_path=settings.cbs_stand_in['FIXTURE_PATH'], latency=settings.cbs_stand_in['LATENCY'],
+                       page_size=settings.cbs_stand_in['PAGE_SIZE'], repeat=1, predict=True):
+    """
+    Method to time the get data stage end to end against the stand-in server (without the cache of CBS tables and the
+    artifact store). Without fixtures in fixture_path, synthetic fixtures of all tables in the settings are made first
+    (see make_settings_cbs_fixtures).
+
+    Parameters
+    ----------
+    fixture_path : str
+        Path of the folder with the fixtures
+    latency : float
+        Number of seconds every request is delayed
+    page_size : int
+        Maximum number of rows per response
+    repeat : int
+        Number of runs of each stage
+    predict : bool
+        Boolean value to also time get_data_predict. Default True.
+
+    Returns
+    -------
+    pd.DataFrame with per run the stage, duration in seconds, number of requests, bytes and shape of the result
+    """
+
+    if not os.path.isdir(fixture_path) or not os.listdir(fixture_path):
+        print(f"No fixtures in {fixture_path}, make synthetic fixtures of the tables in the settings")
+        make_settings_cbs_fixtures(fixture_path=fixture_path)
+    dict_settings_old = {key: settings.get_data[key] for key in ['CBS_OPEN_URL', 'CBS_CACHE_PATH']}
+    use_artifact_store = settings.artifact_store['USE_ARTIFACT_STORE']
+    list_results = []
+    with cbs_stand_in(fixture_path=fixture_path, latency=latency, page_size=page_size) as server:
+        settings.get_data['CBS_OPEN_URL'] = server.catalog_url
+        settings.get_data['CBS_CACHE_PATH'] = None
+        # A stored artifact would skip the download after the first run
+        settings.artifact_store['USE_ARTIFACT_STORE'] = False
+        try:
+            list_stages = [('get_data', lambda: get_data(save_all=False))]
+            if predict:
+                list_stages.append(('get_data_predict', lambda: get_data_predict(save_all=False)))
+            for run, (stage, function) in itertools.product(range(repeat), list_stages):
+                requests_start, bytes_start = server.n_requests, server.bytes_sent
+                time_start = time.perf_counter()
+                df = function()
+                list_results.append({'stage': stage, 'run': run, 'seconds': time.perf_counter() - time_start,
+                                     'requests': server.n_requests - requests_start,
+                                     'bytes': server.bytes_sent - bytes_start, 'shape': df.shape})
+        finally:
+            settings.get_data.update(dict_settings_old)
+            settings.artifact_store['USE_ARTIFACT_STORE'] = use_artifact_store
+
+    df_results = pd.DataFrame(list_results)
+    print(df_results)
+    return df_results
@@ -1,5 +1,6 @@
 from sklearn.base import BaseEstimator, TransformerMixin
 from typing import Union
+import numpy as np
 import pandas as pd
 
 
@@ -252,11 +253,135 @@ class GroupInterpolateImputer(BaseEstimator, TransformerMixin):
         """
 
         X = X.copy()
-        X.loc[:, self.cols] = X[self.cols].groupby(self.groupcols).apply(
-            lambda group: group.interpolate(method=self.interpolate_method, **self.kwargs_interpolate))
+        # Only numeric columns are interpolated, text and categorical columns are kept as they are
+        cols_numeric = [c for c in self.cols if c not in self.groupcols and pd.api.types.is_numeric_dtype(X[c])]
+        # Columns without missing values don't change, the float columns are interpolated at once (see
+        # interpolate_vectorized) and the other columns (and other methods or arguments) with pd.interpolate per group
+        cols_missing = [c for c in cols_numeric if X[c].isna().any()]
+        cols_vectorized = []
+        if self.can_interpolate_vectorized(X.index):
+            cols_vectorized = [c for c in cols_missing if pd.api.types.is_float_dtype(X[c]) and
+                               isinstance(X[c].dtype, np.dtype)]
+        if len(cols_vectorized) > 0:
+            X[cols_vectorized] = self.interpolate_vectorized(X, cols_vectorized)
+        cols_apply = [c for c in cols_missing if c not in cols_vectorized]
+        if len(cols_apply) > 0:
+            X.loc[:, cols_apply] = X[self.groupcols + cols_apply].groupby(self.groupcols, observed=True)[
+                cols_apply].apply(lambda group: group.interpolate(method=self.interpolate_method,
+                                                                  **self.kwargs_interpolate))
 
         return X
 
+    def can_interpolate_vectorized(self, index):
+        """
+        Method to check if the interpolation can be vectorized (see interpolate_array): for the methods 'linear', 'pad'
+        and 'nearest' without extra arguments of pd.interpolate, and for 'nearest' with an increasing numeric index.
+
+        Parameters
+        ----------
+        index : pd.Index
+            Index of the DataFrame to interpolate
+
+        Returns
+        -------
+        bool
+        """
+
+        if self.interpolate_method not in ['linear', 'pad', 'nearest'] or len(self.kwargs_interpolate) > 0:
+            return False
+        return self.interpolate_method != 'nearest' or (pd.api.types.is_numeric_dtype(index) and
+                                                        index.is_monotonic_increasing and index.is_unique)
+
+    def interpolate_vectorized(self, X, cols):
+        """
+        Method to interpolate the float column(s) of all groups at once (see interpolate_array).
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            DataFrame with the group column(s) and the column(s) to interpolate
+        cols : list(str)
+            List of float columns to interpolate
+
+        Returns
+        -------
+        pd.DataFrame with the interpolated column(s), with the index of X
+        """
+
+        # Rows with a missing value in a group column are in no group (-1), like in groupby their values become missing
+        codes = X.groupby(self.groupcols, sort=False, observed=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        array_result = X[cols].to_numpy(dtype=float, copy=True)
+        index_values = np.asarray(X.index, dtype=float) if self.interpolate_method == 'nearest' else None
+        self.interpolate_array(array_result, codes, index_values=index_values)
+
+        return pd.DataFrame(array_result, index=X.index, columns=cols)
+
+    def interpolate_array(self, array, codes, index_values=None, positions_cols=None, n_max_values=2 ** 18):
+        """
+        Method to interpolate the column(s) of a float array in place for all groups at once, with the same results as
+        pd.interpolate per group for the methods 'linear', 'pad' and 'nearest'. The rows are sorted once by group
+        (stable, so the order within a group is kept) and for every value the previous and next non missing value of
+        the same group are found with a cumulative maximum and minimum of their positions. The values of rows without a
+        group become missing (like groupby, which drops them).
+
+        Parameters
+        ----------
+        array : np.ndarray
+            2D float array with the values to interpolate (rows x columns)
+        codes : np.ndarray
+            Number of the group of every row (-1 is no group)
+        index_values : np.ndarray
+            Values of the index of the rows, used by the method 'nearest'. Default None
+        positions_cols : list(int)
+            Positions of the columns to interpolate. Default None (all columns)
+        n_max_values : int
+            Maximum number of values (rows x columns) that are interpolated at once, to limit the memory. Default 2**18
+
+        Returns
+        -------
+        None (array is interpolated in place)
+        """
+
+        order = np.argsort(codes, kind='stable')
+        codes_sorted = codes[order]
+        n_rows = len(order)
+        positions = np.arange(n_rows)
+        # The 'nearest' method uses the distance in the index (like scipy), the others the positions within a group
+        index_sorted = index_values[order] if self.interpolate_method == 'nearest' else None
+        positions_cols = np.arange(array.shape[1]) if positions_cols is None else np.asarray(positions_cols)
+        n_cols_block = max(1, n_max_values // max(n_rows, 1))
+        for i in range(0, len(positions_cols), n_cols_block):
+            block = np.ix_(order, positions_cols[i:i + n_cols_block])
+            array_block = array[block]
+            is_valid = ~np.isnan(array_block)
+            pos_prev = np.maximum.accumulate(np.where(is_valid, positions[:, None], -1), axis=0)
+            pos_next = np.minimum.accumulate(np.where(is_valid, positions[:, None], n_rows)[::-1], axis=0)[::-1]
+            pos_prev_clip = np.clip(pos_prev, 0, n_rows - 1)
+            pos_next_clip = np.clip(pos_next, 0, n_rows - 1)
+            # The previous or next value must be of the same group
+            has_prev = (pos_prev >= 0) & (codes_sorted[pos_prev_clip] == codes_sorted[:, None]) & \
+                (codes_sorted[:, None] >= 0) & ~is_valid
+            has_next = (pos_next < n_rows) & (codes_sorted[pos_next_clip] == codes_sorted[:, None]) & has_prev
+            value_prev = np.take_along_axis(array_block, pos_prev_clip, axis=0)
+            value_next = np.take_along_axis(array_block, pos_next_clip, axis=0)
+            if self.interpolate_method == 'linear':
+                # After the last value of a group, the last value is repeated (like pd.interpolate)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    fraction = (positions[:, None] - pos_prev) / (pos_next - pos_prev)
+                array_new = np.where(has_next, value_prev + (value_next - value_prev) * fraction, value_prev)
+                array_block[has_prev] = array_new[has_prev]
+            elif self.interpolate_method == 'pad':
+                array_block[has_prev] = value_prev[has_prev]
+            else:
+                # After the last value of a group no value is nearest, with equal distance the previous value is used
+                distance_prev = index_sorted[:, None] - index_sorted[pos_prev_clip]
+                distance_next = index_sorted[pos_next_clip] - index_sorted[:, None]
+                array_new = np.where(distance_prev <= distance_next, value_prev, value_next)
+                array_block[has_next] = array_new[has_next]
+            # Rows without a group are dropped by groupby, so they are missing in the result of pd.interpolate per group
+            array_block[codes_sorted < 0] = np.nan
+            array[block] = array_block
+
 
 class CustomImputer(BaseEstimator, TransformerMixin):
     """
@@ -318,4 +443,298 @@ class CustomImputer(BaseEstimator, TransformerMixin):
         X = X.copy()
         X.loc[:, self.cols] = self.imputer.transform(X[self.cols])
 
-        return X
\ No newline at end of file
+        return X
+
+
+class RelationalImputer(BaseEstimator, TransformerMixin):
+    """
+    This is a transformer class to impute column(s) based on their relation (ratio) with a base column in a base period
+    per group (i.e. region): the value is the base column times the ratio of the group in the base period.
+    """
+
+    def __init__(self, groupcol, periodcol, basecol, cols=None, base_period=None):
+        """
+
+        Parameters
+        ----------
+        groupcol : str
+            Column of the groups (i.e. regions) with their own ratios
+        periodcol : str
+            Column of the periods
+        basecol : str
+            Column on which the relation is based, i.e. 'aantalinwoners'
+        cols : list(str)
+            List of columns to impute. Default None (all numeric columns except basecol)
+        base_period : str
+            Period of the ratios. Default None (the latest period with values of the columns)
+        """
+
+        self.groupcol = groupcol
+        self.periodcol = periodcol
+        self.basecol = basecol
+        self.cols = cols
+        self.base_period = base_period
+
+    def fit(self, X, y=None):
+        """
+        Standard fit method of transformer which calculates the ratios of all groups and columns at once in the base
+        period
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            DataFrame with the group, period and base column and the column(s) to impute
+        y : pd.Series
+            Default None, not used in fit. The target values in a model
+
+        Returns
+        -------
+        return object itself
+        """
+
+        if self.cols is None:
+            self.cols = [c for c in X.select_dtypes(include='number').columns if c != self.basecol]
+        self.base_period_ = self.base_period
+        if self.base_period_ is None:
+            self.base_period_ = X.loc[X[self.cols].notna().any(axis=1), self.periodcol].max()
+        X_base = X[X[self.periodcol] == self.base_period_]
+        # One row per group: with more rows of a group in the base period the last row is used
+        X_base = X_base[~X_base[self.groupcol].duplicated(keep='last')]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            array_ratios = X_base[self.cols].to_numpy(dtype=float) / X_base[self.basecol].to_numpy(dtype=float)[:, None]
+        self.ratios_ = pd.DataFrame(array_ratios, index=pd.Index(X_base[self.groupcol], name=self.groupcol),
+                                    columns=self.cols)
+
+        return self
+
+    def transform(self, X):
+        """
+        Standard transform method of transformer which imputes the column(s) with the base column times the ratios of
+        the group (missing for groups without ratios)
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            DataFrame with the group and base column
+
+        Returns
+        -------
+        Transformed dataset X (with all values of the column(s) imputed by their relation with the base column)
+        """
+
+        X = X.copy()
+        # The ratios of every row are taken at once, an extra row with NaN is used for the groups without ratios
+        array_ratios = np.vstack([self.ratios_.to_numpy(), np.full((1, len(self.cols)), np.nan)])
+        positions_group = self.ratios_.index.get_indexer(X[self.groupcol])
+        array_values = X[self.basecol].to_numpy(dtype=float)[:, None] * array_ratios[positions_group]
+        X[self.cols] = pd.DataFrame(array_values, index=X.index, columns=self.cols)
+
+        return X
+
+
+class FusedPipeline(BaseEstimator, TransformerMixin):
+    """
+    This is a transformer class to run a chain of the transformers of this module (ColumnSelector,
+    GroupInterpolateImputer, CustomImputer, RelativeColumnScaler and CustomScaler) in place on one float array, instead
+    of a copy of the DataFrame in every step.
+    """
+
+    def __init__(self, steps, dtype='float64', n_max_rows=2 ** 16):
+        """
+
+        Parameters
+        ----------
+        steps : list
+            List of the transformers in order of execution (like make_pipeline)
+        dtype : str
+            Dtype of the array: 'float64' (the same results as the pipeline of the transformers) or 'float32' (half
+            the memory). Default 'float64'
+        n_max_rows : int
+            Maximum number of rows that the imputer and scaler transform at once, to limit the memory. Default 2**16
+        """
+
+        self.steps = steps
+        self.dtype = dtype
+        self.n_max_rows = n_max_rows
+
+    def fit(self, X, y=None):
+        """
+        Standard fit method of transformer which fits the transformers in order to X
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            DataFrame with the feature columns
+        y : pd.Series
+            Default None, not used in fit. The target values in a model
+
+        Returns
+        -------
+        return object itself
+        """
+
+        self.fit_transform(X)
+
+        return self
+
+    def fit_transform(self, X, y=None):
+        """
+        Method to fit the transformers in order to X and to transform X at once (every step is fitted on the output of
+        the previous steps)
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            DataFrame with the feature columns
+        y : pd.Series
+            Default None, not used in fit. The target values in a model
+
+        Returns
+        -------
+        Transformed dataset X
+        """
+
+        self.fit_layout(X)
+
+        return self.run_fused(X, fit=True)
+
+    def transform(self, X):
+        """
+        Standard transform method of transformer which transforms X with the fitted transformers
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            DataFrame with the feature columns
+
+        Returns
+        -------
+        Transformed dataset X
+        """
+
+        return self.run_fused(X, fit=False)
+
+    def fit_layout(self, X):
+        """
+        Method to resolve the columns of every step (like their fit methods) and the position of every numeric column
+        in the array, so the array (with room for the relative columns) is made only once.
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            DataFrame with the feature columns
+
+        Returns
+        -------
+        return object itself
+        """
+
+        cols = list(X.columns)
+        dict_dtypes = X.dtypes.to_dict()
+        set_cols_used = set(cols)
+        list_cols_relative = []
+        for step in self.steps:
+            if isinstance(step, ColumnSelector):
+                step.fit(pd.DataFrame(columns=cols))
+                cols = list(step.cols)
+            elif isinstance(step, GroupInterpolateImputer):
+                if step.cols is None:
+                    step.cols = list(cols)
+            elif isinstance(step, CustomImputer):
+                # The same numeric dtypes as in CustomImputer.fit
+                numerics = ['int16', 'int32', 'int64', 'float16', 'float32', 'float64']
+                step.cols = [c for c in (cols if step.cols is None else step.cols) if c in cols and
+                             str(dict_dtypes[c]) in numerics]
+                dict_dtypes.update({c: np.dtype('float64') for c in step.cols})
+            elif isinstance(step, RelativeColumnScaler):
+                # Only the columnnames are used to fit the ColumnSelector and RelativeColumnScaler
+                step.fit(pd.DataFrame(columns=cols))
+                cols_relative = ['relative_' + str(col) for list_cols in step.dict_relatively_cols.values()
+                                 for col in list_cols]
+                if len(set(cols_relative)) < len(cols_relative) or len(set(cols_relative) & set(cols)) > 0:
+                    raise ValueError(f"FusedPipeline needs unique columnnames, the relative columns are already "
+                                     f"in the DataFrame: {sorted(set(cols_relative) & set(cols))}")
+                list_cols_relative += cols_relative
+                cols = cols + cols_relative
+                dict_dtypes.update({c: np.dtype('float64') for c in cols_relative})
+            elif isinstance(step, CustomScaler):
+                step.cols = [c for c in step.cols if c in cols]
+            else:
+                raise TypeError(f"{type(step).__name__} is not supported by FusedPipeline")
+            set_cols_used.update(cols)
+        # Text and categorical columns are not in the array, they are taken from X
+        self.cols_input_ = [c for c in X.columns if c in set_cols_used and pd.api.types.is_numeric_dtype(X[c])]
+        self.positions_ = {col: position for position, col in enumerate(self.cols_input_ + list_cols_relative)}
+
+        return self
+
+    def run_fused(self, X, fit=False):
+        """
+        Method to run the chain of transformers on one array with the numeric columns of X. The columns that are not
+        changed by any step keep the values and dtype of X.
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            DataFrame with the feature columns
+        fit : bool
+            Boolean value to fit the imputers and scalers on the array before transforming it. Default False
+
+        Returns
+        -------
+        Transformed dataset X
+        """
+
+        assert isinstance(X, pd.DataFrame)
+        array = np.empty((len(X), len(self.positions_)), dtype=self.dtype)
+        for col in self.cols_input_:
+            array[:, self.positions_[col]] = X[col].to_numpy(dtype=self.dtype, na_value=np.nan)
+        cols = list(X.columns)
+        set_cols_changed = set()
+        for step in self.steps:
+            if isinstance(step, ColumnSelector):
+                cols_error = list(set(step.cols) - set(cols))
+                if len(cols_error) > 0:
+                    raise KeyError("The DataFrame does not include the columns: %s" % cols_error)
+                cols = list(step.cols)
+            elif isinstance(step, GroupInterpolateImputer):
+                cols_missing = [c for c in step.cols if c not in step.groupcols and c in self.positions_ and
+                                np.isnan(array[:, self.positions_[c]]).any()]
+                positions_missing = [self.positions_[c] for c in cols_missing]
+                if len(cols_missing) == 0:
+                    continue
+                if step.can_interpolate_vectorized(X.index):
+                    codes = X.groupby(step.groupcols, sort=False, observed=True).ngroup().fillna(-1).to_numpy(
+                        dtype=np.int64)
+                    index_values = np.asarray(X.index, dtype=float) if step.interpolate_method == 'nearest' else None
+                    step.interpolate_array(array, codes, index_values=index_values, positions_cols=positions_missing)
+                else:
+                    df_interpolate = pd.DataFrame(array[:, positions_missing], index=X.index, columns=cols_missing)
+                    df_interpolate[step.groupcols] = X[step.groupcols]
+                    array[:, positions_missing] = df_interpolate.groupby(step.groupcols, observed=True,
+                                                                         group_keys=False)[cols_missing].apply(
+                        lambda group: group.interpolate(method=step.interpolate_method, **step.kwargs_interpolate)
+                    ).reindex(X.index).to_numpy()
+                set_cols_changed.update(cols_missing)
+            elif isinstance(step, (CustomImputer, CustomScaler)):
+                estimator = step.imputer if isinstance(step, CustomImputer) else step.scaler
+                positions = [self.positions_[c] for c in step.cols]
+                if fit:
+                    estimator.fit(array[:, positions])
+                for start in range(0, len(X), self.n_max_rows):
+                    rows = slice(start, start + self.n_max_rows)
+                    array[rows, positions] = estimator.transform(array[rows][:, positions])
+                set_cols_changed.update(step.cols)
+            elif isinstance(step, RelativeColumnScaler):
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    for base_col, relatively_cols in step.dict_relatively_cols.items():
+                        for col in relatively_cols:
+                            np.divide(array[:, self.positions_[col]], array[:, self.positions_[base_col]],
+                                      out=array[:, self.positions_['relative_' + str(col)]])
+                cols_relative = ['relative_' + str(col) for list_cols in step.dict_relatively_cols.values()
+                                 for col in list_cols]
+                cols = cols + cols_relative
+                set_cols_changed.update(cols_relative)
+
+        return pd.DataFrame({col: array[:, self.positions_[col]] if col in set_cols_changed else X[col]
+                             for col in cols}, index=X.index, columns=cols)
\ No newline at end of file
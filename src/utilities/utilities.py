@@ -1,11 +1,21 @@
-from os import listdir
-from os.path import isfile, join
-import pandas as pd
+import hashlib
+import os
 import pickle
+import shutil
+import uuid
+from contextlib import contextmanager, suppress
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 
-def get_latest_file(filename_str_contains, datapath='../data/', filetype='parquet'):
+import src.settings as settings
+from src.utilities.artifact_catalog import get_latest_artifact_filepath, query_artifacts, sync_catalog_if_modified
+
+def get_latest_file(filename_str_contains, datapath='../data/', filetype='parquet', columns=None, filters=None):
     """
-    Method to get the latest file to given a certain string value.
+    Method to get the latest file to given a certain string value. The file is looked up in the catalog of artifacts,
+    which is synchronized with the folder if no file is found.
 
     Parameters
     ----------
@@ -15,21 +25,28 @@ def get_latest_file(filename_str_contains, datapath='../data/', filetype='parque
         (relative) path of the files. Default '../data'
     filetype: str
         String which type of file should be read ('parquet', 'pickle'). Default 'parquet'
+    columns : list(str)
+        List with the columns to read of a parquet file (the index is always read). Default None (all columns).
+    filters : dict(str: list)
+        Dictionary with per column (i.e. 'codering_regio' or 'interval') the values of the rows to read of a parquet
+        file. Default None (all rows).
 
     Returns
     -------
     pd.DataFrame or model object
     """
 
-    # Get list with files
-    onlyfiles = sorted([f for f in listdir(datapath) if isfile(join(datapath, f))])
-    # Get last file
-    filename = [s for s in onlyfiles if filename_str_contains in s][-1]
+    # Get last file from the catalog of artifacts (see src.utilities.artifact_catalog)
+    filepath = get_latest_artifact_filepath(datapath, filetype=filetype, filename_str_contains=filename_str_contains,
+                                            catalog_path=settings.artifact_store['CATALOG_PATH'])
     if filetype == 'parquet':
-        df = pd.read_parquet(datapath + filename)
+        feather_cache_path = settings.artifact_store['FEATHER_CACHE_PATH'] \
+            if settings.artifact_store['USE_FEATHER_CACHE'] else None
+        df = read_dataset(filepath, columns=columns, filters=filters, feather_cache_path=feather_cache_path)
         return df
     if filetype == 'pickle':
-        model = pickle.load(open(datapath + filename, 'rb'))
+        with open(filepath, 'rb') as file:
+            model = pickle.load(file)
         return model
 
 def list_filenames(path, filename_str_contains):
@@ -47,6 +64,228 @@ def list_filenames(path, filename_str_contains):
     -------
     List with string values of all the matched filenames
     """
-    all_files = sorted([f for f in listdir(path) if isfile(join(path, f))])
-    filenames = [s for s in all_files if filename_str_contains in s]
-    return filenames
\ No newline at end of file
+    # Files that are not in the catalog yet (i.e. copied to the folder) are added
+    sync_catalog_if_modified(path, catalog_path=settings.artifact_store['CATALOG_PATH'])
+    df_artifacts = query_artifacts(path, filename_str_contains=filename_str_contains,
+                                   catalog_path=settings.artifact_store['CATALOG_PATH'])
+    filenames = list(df_artifacts['filename'])
+    return filenames
+
+
+def read_dataset(filepath, columns=None, filters=None, feather_cache_path=None):
+    """
+    Method to read (a subset of) a dataset that is saved as parquet (a file or a partitioned folder, see write_dataset).
+    Only the asked columns are read and the filters are pushed down to the parquet reader, so partitions and row groups
+    without matching rows are skipped. With a feather cache, the dataset is converted once to an uncompressed feather
+    file that is memory mapped on the next reads: nothing is decompressed and the columns that are not asked are not
+    read from disk (the asked columns are copied once, when converted to pandas).
+
+    Parameters
+    ----------
+    filepath : str
+        Filepath of the parquet file (or folder of a partitioned dataset)
+    columns : list(str)
+        List with the columns to read (the index is always read). Default None (all columns).
+    filters : dict(str: list)
+        Dictionary with per column (i.e. 'codering_regio' or 'interval') the values of the rows to read. Default None
+        (all rows).
+    feather_cache_path : str
+        Path of the folder with the feather cache. Default None (no cache is used).
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+
+    if feather_cache_path is None:
+        # Of a partitioned dataset only the files of the asked partitions are read
+        list_files = get_dataset_files(filepath, filters=filters)
+        schema = pq.read_schema(get_dataset_files(filepath)[0])
+        list_cols = get_dataset_cols(schema, columns)
+        list_filters = [(col, 'in', list(values)) for col, values in filters.items()] if filters else None
+        list_tables = [pq.read_table(file, columns=list_cols, filters=list_filters, use_pandas_metadata=True)
+                       for file in list_files]
+        if len(list_tables) == 0:
+            list_tables = [pa.schema([schema.field(col) for col in list_cols], metadata=schema.metadata).empty_table()]
+        return pa.concat_tables(list_tables).to_pandas(split_blocks=True)
+
+    # Datasets with the same filename in different folders get their own feather file
+    hash_filepath = hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()[:16]
+    filepath_feather = os.path.join(feather_cache_path,
+                                    os.path.basename(filepath).split('.parquet')[0] + '_' + hash_filepath + '.feather')
+    if not os.path.isfile(filepath_feather) or os.path.getmtime(filepath_feather) < os.path.getmtime(filepath):
+        os.makedirs(feather_cache_path, exist_ok=True)
+        with atomic_filepath(filepath_feather) as filepath_feather_tmp:
+            feather.write_feather(pa.concat_tables([pq.read_table(file) for file in get_dataset_files(filepath)]),
+                                  filepath_feather_tmp, compression='uncompressed')
+    # The columns refer to the memory mapped file until they are copied to pandas, so the file is closed after that
+    with pa.memory_map(filepath_feather, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+        table = table.select(get_dataset_cols(table.schema, columns))
+        if filters:
+            mask = None
+            for col, values in filters.items():
+                mask_col = pc.is_in(table[col], value_set=pa.array(list(values), type=table.schema.field(col).type))
+                mask = mask_col if mask is None else pc.and_(mask, mask_col)
+            table = table.filter(mask)
+        return table.to_pandas(split_blocks=True)
+
+
+def write_dataset(df, filepath, compression=settings.storage['COMPRESSION'],
+                  compression_level=settings.storage['COMPRESSION_LEVEL'],
+                  row_group_size=settings.storage['ROW_GROUP_SIZE'], partition_col=settings.storage['PARTITION_COL']):
+    """
+    Method to save a dataset as parquet, with the codec, row groups and (optional) partitioning of settings.storage.
+    The statistics of the columns are written per row group, so readers with filters skip the row groups (and
+    partitions) without matching rows.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset to save (including the index)
+    filepath : str
+        Filepath of the dataset without extension, i.e. '../../data/df_preprocessed_202104241838_note'
+    compression : str
+        Codec of the parquet files ('zstd', 'lz4', 'snappy', 'gzip' or 'none')
+    compression_level : int
+        Level of the codec. None is the default level of the codec.
+    row_group_size : int
+        Maximum number of rows per row group
+    partition_col : str
+        Column or level of the index to partition the dataset by (one file per value). None is one file.
+
+    Returns
+    -------
+    str with the filepath of the saved dataset (a folder if the dataset is partitioned)
+    """
+
+    filepath = filepath + ('.parquet.gzip' if compression == 'gzip' else '.parquet')
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    dict_tables = {None: table}
+    if partition_col is not None:
+        # The partition column stays in the files, so the dtypes and the index are read back unchanged
+        col_partition = table[partition_col]
+        if pa.types.is_dictionary(col_partition.type):
+            col_partition = col_partition.cast(col_partition.type.value_type)
+        dict_tables = {value: table.filter(pc.equal(col_partition, value))
+                       for value in pc.unique(col_partition).to_pylist() if value is not None}
+        if col_partition.null_count > 0:
+            dict_tables['__null__'] = table.filter(pc.is_null(col_partition))
+    with atomic_filepath(filepath) as filepath_tmp:
+        for value, table_partition in dict_tables.items():
+            filepath_partition = filepath_tmp if value is None else \
+                os.path.join(filepath_tmp, f"{partition_col}={value}", 'part-0.parquet')
+            os.makedirs(os.path.dirname(os.path.abspath(filepath_partition)), exist_ok=True)
+            pq.write_table(table_partition, filepath_partition, compression=compression,
+                           compression_level=compression_level, row_group_size=row_group_size,
+                           write_statistics=True)
+    return filepath
+
+
+@contextmanager
+def atomic_filepath(filepath):
+    """
+    Method to write a file or folder atomically. The block writes to a temporary filepath next to filepath, which
+    replaces filepath when the block ends, so an interrupted run never leaves a half written file. Every writer gets its
+    own temporary filepath, so writers of the same file in other threads or processes don't overwrite each other's
+    temporary file: the last writer wins. After an exception (or if the block writes nothing) filepath is unchanged.
+
+    Parameters
+    ----------
+    filepath : str
+        Filepath of the file or folder to write
+
+    Returns
+    -------
+    str with the temporary filepath to write to
+    """
+
+    filepath_tmp = f"{filepath}.{uuid.uuid4().hex}.tmp"
+    try:
+        yield filepath_tmp
+        if os.path.isdir(filepath_tmp):
+            if os.path.isdir(filepath):
+                shutil.rmtree(filepath, ignore_errors=True)
+            # A folder can't replace a folder that another writer has just written, then that folder is kept
+            with suppress(OSError):
+                os.replace(filepath_tmp, filepath)
+        elif os.path.isfile(filepath_tmp):
+            if os.path.isdir(filepath):
+                shutil.rmtree(filepath, ignore_errors=True)
+            os.replace(filepath_tmp, filepath)
+    finally:
+        if os.path.isdir(filepath_tmp):
+            shutil.rmtree(filepath_tmp, ignore_errors=True)
+        elif os.path.isfile(filepath_tmp):
+            os.remove(filepath_tmp)
+
+
+def get_dataset_files(filepath, filters=None):
+    """
+    Method to get the parquet files of a dataset: the file itself or the files of the partitions of a partitioned
+    dataset (see write_dataset), optionally only of the partitions that match the filters.
+
+    Parameters
+    ----------
+    filepath : str
+        Filepath of the dataset
+    filters : dict(str: list)
+        Dictionary with per column the values of the rows to read. Default None (all partitions).
+
+    Returns
+    -------
+    list(str) with the filepaths of the parquet files, sorted by partition
+    """
+
+    if not os.path.isdir(filepath):
+        return [filepath]
+    list_files = []
+    for entry in sorted(os.scandir(filepath), key=lambda entry: entry.name):
+        col, _, value = entry.name.partition('=')
+        if filters and col in filters and value not in {str(value_filter) for value_filter in filters[col]}:
+            continue
+        list_files.append(os.path.join(entry.path, 'part-0.parquet'))
+    return list_files
+
+
+def list_dataset_partitions(filepath):
+    """
+    Method to get the values of the partitions of a partitioned dataset (see write_dataset) without reading it, i.e.
+    to read only the latest period with read_dataset(filepath, filters={'interval': [periods[-1]]}).
+
+    Parameters
+    ----------
+    filepath : str
+        Filepath of the dataset
+
+    Returns
+    -------
+    list(str) with the sorted values of the partitions (empty if the dataset is not partitioned)
+    """
+
+    if not os.path.isdir(filepath):
+        return []
+    return sorted(entry.name.partition('=')[2] for entry in os.scandir(filepath) if entry.is_dir())
+
+
+def get_dataset_cols(schema, columns=None):
+    """
+    Method to get the columns to read of a dataset: the asked columns and the columns of the index (from the pandas
+    metadata of the file).
+
+    Parameters
+    ----------
+    schema : pa.Schema
+        Schema of the dataset
+    columns : list(str)
+        List with the columns to read. Default None (all columns).
+
+    Returns
+    -------
+    list(str) with the columns to read
+    """
+
+    if columns is None:
+        return list(schema.names)
+    list_index_cols = [col for col in (schema.pandas_metadata or {}).get('index_columns', []) if isinstance(col, str)]
+    return [col for col in schema.names if col in list(columns) + list_index_cols]
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# The tests import the modules of the repository as src.<package>.<module>
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def interpolate_reference(df, groupcols, cols, method):
+    """
+    Interpolation per group with groupby.apply, in the order of the rows (the transform of GroupInterpolateImputer
+    before interpolate_array)
+    """
+
+    # The method 'pad' of pd.interpolate is ffill (newer versions of pandas only have ffill)
+    return df.groupby(groupcols, observed=True, group_keys=False)[cols].apply(
+        lambda group: group.ffill() if method == 'pad' else group.interpolate(method=method)).reindex(df.index)
+
+
+def make_df_groups(seed, n_rows=400):
+    """
+    DataFrame with the columns 'a', 'b' and 'c' with missing values, the groups 'regio' and 'jaar' and a sorted float
+    index with gaps
+    """
+
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(n_rows, 3)), columns=['a', 'b', 'c'],
+                      index=np.sort(rng.choice(10 * n_rows, n_rows, replace=False)).astype(float))
+    df = df.mask(rng.random(df.shape) < 0.5)
+    # Groups are interleaved, with missing group keys, leading and trailing NaNs and a group without any value
+    df['regio'] = rng.choice(['GM01', 'GM02', 'GM03', None], n_rows)
+    df['jaar'] = rng.choice(['2019', '2020'], n_rows)
+    df.loc[df['regio'] == 'GM03', 'c'] = np.nan
+    return df
+
+
+def make_df_panel(seed, n_regions=40, n_periods=8, newest_first=True):
+    """
+    DataFrame with a row per region ('regio') and period ('interval') and the columns 'a' and 'b' with missing values
+    """
+
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'regio': np.repeat([f"GM{i:04d}" for i in range(n_regions)], n_periods).astype(object),
+                       'interval': np.tile(np.arange(2013, 2013 + n_periods), n_regions)})
+    # Like the ABT the newest period can be the first row of a region
+    if newest_first:
+        df = df.sort_values(['regio', 'interval'], ascending=[True, False])
+    df = df.sample(frac=1, random_state=seed) if seed % 2 else df
+    df.loc[df.sample(frac=0.05, random_state=seed).index, 'regio'] = None
+    for col in ['a', 'b']:
+        df[col] = rng.normal(size=len(df))
+        df.loc[rng.random(len(df)) < 0.5, col] = np.nan
+    return df.reset_index(drop=True)
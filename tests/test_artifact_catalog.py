@@ -0,0 +1,47 @@
+import os
+import time
+
+from src.utilities import artifact_catalog
+from src.utilities.artifact_catalog import get_latest_artifact_filepath, register_artifact
+
+
+def touch(filepath, mtime):
+    with open(filepath, 'wb') as file:
+        file.write(b'model')
+    os.utime(os.path.dirname(filepath), ns=(mtime, mtime))
+
+
+def test_get_latest_artifact_filepath_file_added_outside_pipeline(tmp_path):
+    catalog_path = str(tmp_path / 'catalog.sqlite')
+    datapath = tmp_path / 'models'
+    datapath.mkdir()
+    mtime = time.time_ns() - 60 * 10 ** 9
+    touch(str(datapath / 'best_model_202104010000_x.pickle'), mtime)
+    register_artifact(str(datapath / 'best_model_202104010000_x.pickle'), shape=(0, 0), catalog_path=catalog_path)
+    assert get_latest_artifact_filepath(str(datapath), step='best_model',
+                                        catalog_path=catalog_path).endswith('best_model_202104010000_x.pickle')
+
+    # A newer model is copied to the folder, the query of the catalog itself is not empty
+    touch(str(datapath / 'best_model_202105010000_x.pickle'), mtime + 10 ** 9)
+    assert get_latest_artifact_filepath(str(datapath), step='best_model',
+                                        catalog_path=catalog_path).endswith('best_model_202105010000_x.pickle')
+
+    # An unmodified folder is not scanned again
+    assert artifact_catalog.sync_catalog_if_modified(str(datapath), catalog_path=catalog_path) == 0
+
+    os.remove(str(datapath / 'best_model_202105010000_x.pickle'))
+    os.utime(str(datapath), ns=(mtime + 2 * 10 ** 9, mtime + 2 * 10 ** 9))
+    assert get_latest_artifact_filepath(str(datapath), step='best_model',
+                                        catalog_path=catalog_path).endswith('best_model_202104010000_x.pickle')
+
+
+def test_sync_catalog_recent_folder_is_synchronized_again(tmp_path):
+    catalog_path = str(tmp_path / 'catalog.sqlite')
+    datapath = tmp_path / 'models'
+    datapath.mkdir()
+    touch(str(datapath / 'best_model_202104010000_x.pickle'), time.time_ns())
+
+    assert artifact_catalog.sync_catalog_if_modified(str(datapath), catalog_path=catalog_path) == 1
+    # Within the resolution of the modification time a new file could be missed, so the folder is scanned again
+    touch(str(datapath / 'best_model_202105010000_x.pickle'), os.stat(str(datapath)).st_mtime_ns)
+    assert artifact_catalog.sync_catalog_if_modified(str(datapath), catalog_path=catalog_path) == 1
@@ -0,0 +1,47 @@
+import os
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.preprocess import cbs_utils
+
+
+def test_get_cbs_metadata_concurrent_once(tmp_path, monkeypatch):
+    list_calls = []
+    lock = threading.Lock()
+
+    def get_cbs_odata(table, name, url='opendata.cbs.nl', select=None, filters=None):
+        with lock:
+            list_calls.append((table, name))
+        time.sleep(0.05)
+        return [{'Key': 'Perioden', 'Type': 'TimeDimension'}]
+
+    monkeypatch.setattr(cbs_utils, 'get_cbs_odata', get_cbs_odata)
+    cbs_utils.reset_cbs_metadata()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list_metadata = list(executor.map(
+            lambda _: cbs_utils.get_cbs_metadata('84286NED', url='opendata.cbs.nl', cache_path=str(tmp_path)),
+            range(8)))
+    cbs_utils.reset_cbs_metadata()
+
+    assert list_calls == [('84286NED', 'DataProperties')]
+    assert all(metadata == list_metadata[0] for metadata in list_metadata)
+    list_files = [filename for filename in os.listdir(tmp_path) if filename.endswith('_DataProperties.json')]
+    assert len(list_files) == 1
+    with open(tmp_path / list_files[0]) as file_metadata:
+        assert json.load(file_metadata) == list_metadata[0]
+    assert not [filename for filename in os.listdir(tmp_path) if filename.endswith('.tmp')]
+
+
+def test_reset_cbs_metadata(monkeypatch):
+    list_calls = []
+    monkeypatch.setattr(cbs_utils, 'get_cbs_odata', lambda table, name, url='opendata.cbs.nl': list_calls.append(1))
+    cbs_utils.reset_cbs_metadata()
+    cbs_utils.get_cbs_metadata('84286NED')
+    cbs_utils.get_cbs_metadata('84286NED')
+    cbs_utils.reset_cbs_metadata()
+    cbs_utils.get_cbs_metadata('84286NED')
+    cbs_utils.reset_cbs_metadata()
+
+    assert len(list_calls) == 2
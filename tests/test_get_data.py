@@ -0,0 +1,55 @@
+import os
+import pandas as pd
+import pytest
+
+import src.settings as settings
+from src.utilities.cbs_stand_in import make_settings_cbs_fixtures, cbs_stand_in
+from src.run_all.get_data import get_data, get_data_predict
+
+N_REGIONS = 3
+
+
+@pytest.fixture(scope='module')
+def fixture_path(tmp_path_factory):
+    fixture_path = str(tmp_path_factory.mktemp('fixtures_cbs'))
+    make_settings_cbs_fixtures(fixture_path=fixture_path, n_regions=N_REGIONS)
+    return fixture_path
+
+
+@pytest.fixture
+def stand_in_settings(fixture_path, tmp_path, monkeypatch):
+    monkeypatch.setitem(settings.artifact_store, 'USE_ARTIFACT_STORE', False)
+    monkeypatch.setitem(settings.get_data, 'CBS_CACHE_PATH', str(tmp_path / 'cache_cbs'))
+    # With the injected failures a request should not fail after all retries
+    monkeypatch.setitem(settings.get_data, 'CBS_RETRIES', 10)
+    monkeypatch.setitem(settings.get_data, 'CBS_BACKOFF', 0.01)
+    return fixture_path
+
+
+@pytest.mark.parametrize('failure_rate', [0.0, 0.1])
+def test_get_data_stand_in(stand_in_settings, monkeypatch, failure_rate):
+    with cbs_stand_in(fixture_path=stand_in_settings, latency=0.0, page_size=5, failure_rate=failure_rate) as server:
+        monkeypatch.setitem(settings.get_data, 'CBS_OPEN_URL', server.catalog_url)
+        df = get_data(save_all=False)
+        # The second run checks the cache, both WIJK downloads write the same cached metadata again
+        df_cached = get_data(save_all=False)
+
+    assert df.shape[0] == N_REGIONS * len(settings.get_data['DICT_TABLES_WMO'])
+    assert set(df.index.get_level_values('interval')) == set(settings.get_data['DICT_TABLES_WMO'].keys())
+    assert (df['typemaatwerkarrangement'] == settings.get_data['TYPE_WMO']).all()
+    # Every source is matched: WIJK (codering_regio), huishoudens, bevolking and heffing (gemeentenaam)
+    for col in ['gemeentenaam', 'aantalinwoners', 'alleenstaand_mannen', 'poptotalebevolking',
+                'rioolheffing_gemeenteheffingeuroinwoner']:
+        assert df[col].notna().all(), col
+    pd.testing.assert_frame_equal(df_cached, df)
+    assert not [filename for filename in os.listdir(settings.get_data['CBS_CACHE_PATH']) if filename.endswith('.tmp')]
+
+
+def test_get_data_predict_stand_in(stand_in_settings, monkeypatch):
+    with cbs_stand_in(fixture_path=stand_in_settings, latency=0.0, page_size=5) as server:
+        monkeypatch.setitem(settings.get_data, 'CBS_OPEN_URL', server.catalog_url)
+        df = get_data_predict(save_all=False)
+
+    assert set(df.index.get_level_values('codering_regio')) == {f"GM{i:04d}" for i in range(1, N_REGIONS + 1)}
+    assert df['aantalinwoners'].notna().all()
+    assert df['poptotaalaantalparticulierehuishoudens'].notna().all()
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import interpolate_reference, make_df_panel
+from src.preprocess.preprocess_utils import get_incremental_rows
+
+
+@pytest.mark.parametrize('method', ['linear', 'pad', 'nearest'])
+@pytest.mark.parametrize('newest_first', [True, False])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_incremental_equals_full(method, newest_first, seed):
+    df = make_df_panel(seed, newest_first=newest_first)
+    cols = ['a', 'b']
+    # The rows of the last period are new
+    index_previous = df.index[df['interval'] < df['interval'].max()]
+    df_previous = interpolate_reference(df.loc[index_previous], ['regio'], cols, method)
+
+    is_transform, is_output = get_incremental_rows(df, index_previous, ['regio'], cols, interpolate_method=method)
+
+    assert is_output[~df.index.isin(index_previous)].all()
+    assert not (is_output & ~is_transform).any()
+    # The rows to transform are interpolated on their own, the other rows are taken from the previous result
+    df_incremental = df_previous.reindex(df.index)
+    df_transformed = interpolate_reference(df[is_transform], ['regio'], cols, method)
+    df_incremental[is_output] = df_transformed.loc[df.index[is_output]]
+
+    df_expected = interpolate_reference(df, ['regio'], cols, method)
+    pd.testing.assert_frame_equal(df_incremental, df_expected)
+
+
+def test_incremental_without_new_rows():
+    df = make_df_panel(3)
+    is_transform, is_output = get_incremental_rows(df, df.index, ['regio'], ['a', 'b'])
+
+    assert not is_transform.any()
+    assert not is_output.any()
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import interpolate_reference, make_df_groups
+from src.utilities.transformers import GroupInterpolateImputer, FusedPipeline
+
+
+@pytest.mark.parametrize('method', ['linear', 'pad', 'nearest'])
+@pytest.mark.parametrize('groupcols', [['regio'], ['regio', 'jaar']])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_interpolate_array_equals_groupby_apply(method, groupcols, seed):
+    df = make_df_groups(seed)
+    cols = ['a', 'b', 'c']
+    imputer = GroupInterpolateImputer(groupcols, interpolate_method=method)
+    assert imputer.can_interpolate_vectorized(df.index)
+
+    codes = df.groupby(groupcols, sort=False, observed=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    array = df[cols].to_numpy(dtype=float, copy=True)
+    imputer.interpolate_array(array, codes, index_values=np.asarray(df.index, dtype=float))
+
+    df_expected = interpolate_reference(df, groupcols, cols, method)
+    # pd.interpolate computes the linear interpolation in another order, the difference is a rounding error
+    np.testing.assert_allclose(array, df_expected.to_numpy(), rtol=1e-12, atol=1e-15)
+
+
+def test_interpolate_array_in_blocks():
+    df = make_df_groups(3)
+    cols = ['a', 'b', 'c']
+    imputer = GroupInterpolateImputer(['regio'], interpolate_method='linear')
+    codes = df.groupby(['regio'], sort=False, observed=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    array = df[cols].to_numpy(dtype=float, copy=True)
+    # Less values than one column at once, so every column is interpolated apart
+    imputer.interpolate_array(array, codes, n_max_values=10)
+
+    np.testing.assert_allclose(array, interpolate_reference(df, ['regio'], cols, 'linear').to_numpy(), rtol=1e-12,
+                               atol=1e-15)
+
+
+def test_transform_equals_groupby_apply():
+    df = make_df_groups(4).reset_index(drop=True)
+    cols = ['a', 'b', 'c']
+    df_transformed = GroupInterpolateImputer(['regio'], cols=cols).fit(df).transform(df)
+
+    pd.testing.assert_frame_equal(df_transformed[cols], interpolate_reference(df, ['regio'], cols, 'linear'),
+                                  check_exact=False, rtol=1e-12)
+
+
+def test_fused_pipeline_equals_transform():
+    df = make_df_groups(5).reset_index(drop=True)
+    cols = ['a', 'b', 'c']
+    df_expected = GroupInterpolateImputer(['regio'], cols=cols).fit(df).transform(df)
+    df_fused = FusedPipeline([GroupInterpolateImputer(['regio'], cols=cols)]).fit_transform(df)
+
+    pd.testing.assert_frame_equal(df_fused[cols], df_expected[cols])
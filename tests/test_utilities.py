@@ -0,0 +1,52 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+
+from src.utilities.utilities import atomic_filepath, write_dataset, read_dataset
+
+
+def test_atomic_filepath_concurrent_writers(tmp_path):
+    filepath = str(tmp_path / 'metadata.json')
+
+    def write(value):
+        for _ in range(50):
+            with atomic_filepath(filepath) as filepath_tmp, open(filepath_tmp, 'w') as file:
+                file.write(str(value) * 1000)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(write, range(8)))
+
+    # The file is written completely by one of the writers, no temporary file is left
+    with open(filepath) as file:
+        content = file.read()
+    assert content in [str(value) * 1000 for value in range(8)]
+    assert os.listdir(tmp_path) == ['metadata.json']
+
+
+def test_atomic_filepath_exception(tmp_path):
+    filepath = str(tmp_path / 'data.txt')
+    with atomic_filepath(filepath) as filepath_tmp, open(filepath_tmp, 'w') as file:
+        file.write('old')
+    with pytest.raises(ValueError):
+        with atomic_filepath(filepath) as filepath_tmp, open(filepath_tmp, 'w') as file:
+            file.write('new')
+            raise ValueError
+
+    with open(filepath) as file:
+        assert file.read() == 'old'
+    assert os.listdir(tmp_path) == ['data.txt']
+
+
+@pytest.mark.parametrize('partition_col', [None, 'jaar'])
+def test_write_dataset_concurrent_writers(tmp_path, partition_col):
+    df = pd.DataFrame({'jaar': ['2019', '2020'] * 50, 'a': range(100)})
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list_filepaths = list(executor.map(lambda _: write_dataset(df, str(tmp_path / 'df'),
+                                                                   partition_col=partition_col), range(8)))
+
+    df_read = read_dataset(list_filepaths[0])
+    pd.testing.assert_frame_equal(df_read.sort_values('a').reset_index(drop=True)[['jaar', 'a']],
+                                  df.astype({'jaar': df_read['jaar'].dtype}))
+    assert len(os.listdir(tmp_path)) == 1